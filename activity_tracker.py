@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+New-post tracking from the Activity section.
+
+The Activity section of a profile transcription lists the latest posts and
+comments ("Ivan shared a post: / Why High-Quality... / February 25, 2023").
+Entries are parsed locally into snippet, action and timestamp, and matched
+against the posts already seen for the profile by word-shingle containment,
+since every screenshot truncates and misreads snippets a little
+differently. Posts not seen before are stored and emitted as a
+new_activity event; no LLM call is involved.
+"""
+
+import re
+import sqlite3
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import numpy as np
+
+import event_outbox
+import profile_identity
+import snapshot_sources
+from job_rules import clean_line, section_name
+from minhash_cache import shingles
+
+DB_PATH = 'image_analysis_results.db'
+
+# Snippets shorter than this (in words) are UI leftovers, not post text
+MIN_SNIPPET_WORDS = 3
+# Share of the shorter snippet's shingles found in the other for both to be one post
+CONTAINMENT_THRESHOLD = 0.6
+# Word shingles are short: snippets are often cut after a few words
+SHINGLE_SIZE = 2
+
+_ACTION_RE = re.compile(
+    r"\b(?P<action>shared|posted|reposted|commented|replied|liked|celebrated|published|wrote)\b"
+    r"(?:\s+(?:a|an|this|on|to)\b)?(?:\s+(?:post|article|comment|document|video|photo|poll))?\s*:?\s*",
+    re.IGNORECASE
+)
+_MONTHS = "jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec"
+_ABSOLUTE_DATE_RE = re.compile(
+    rf"\b(?:(?P<month>(?:{_MONTHS})[a-z]*)\.?\s+(?:(?P<day>\d{{1,2}}),?\s+)?(?P<year>(?:19|20)\d{{2}})"
+    rf"|(?P<iso>(?:19|20)\d{{2}}-\d{{2}}-\d{{2}}))\b",
+    re.IGNORECASE
+)
+_RELATIVE_TIME_RE = re.compile(
+    r"(?<![\w.,])(?P<amount>\d+)\s*(?P<unit>mo|mos|months?|m|min|mins|minutes?|h|hr|hrs|hours?|d|days?|w|wk|wks|weeks?|y|yr|yrs|years?)\b"
+    r"(?:\s+ago)?",
+    re.IGNORECASE
+)
+_UNIT_DAYS = {"m": 1 / 1440, "h": 1 / 24, "d": 1, "w": 7, "mo": 30, "y": 365}
+_ENTRY_START_RE = re.compile(r"^\s*\d+[.)]\s")
+_NOISE_RE = re.compile(
+    r"(?:\bfollowers?\b|\bconnections?\b|linkedin\.com|^\W*$|^[\d\s,.kKmM+•·|\\]+$"
+    r"|^\d[\d,.]*[kKmM]?\s*(?:reactions?|likes?|comments?|reposts?|shares?|views?|impressions?)$)",
+    re.IGNORECASE
+)
+# Activity tab labels and buttons
+_UI_WORDS = {
+    "posts", "comments", "images", "videos", "articles", "documents", "newsletters", "reactions", "reposts",
+    "create", "a", "post", "show", "see", "all", "follow", "following", "edited", "more", "activity",
+}
+
+
+def activity_block(text: str) -> List[str]:
+    """Raw lines of the Activity section (empty if there is none)"""
+    block, inside = [], False
+    for line in (text or "").splitlines():
+        name = section_name(line)
+        if name:
+            if inside:
+                break
+            inside = name == "activity"
+            continue
+        if inside:
+            if line.strip() == "---":
+                break
+            block.append(line)
+    return block
+
+
+def parse_time(line: str, observed_at: datetime) -> tuple:
+    """(posted date or None, line without the timestamp)"""
+    match = _ABSOLUTE_DATE_RE.search(line)
+    if match:
+        if match.group("iso"):
+            posted = match.group("iso")
+        else:
+            month = _MONTHS.split("|").index(match.group("month")[:3].lower()) + 1
+            posted = f"{match.group('year')}-{month:02d}-{int(match.group('day') or 1):02d}"
+        return posted, (line[:match.start()] + line[match.end():]).strip()
+    match = _RELATIVE_TIME_RE.search(line)
+    if match:
+        unit = match.group("unit").lower()
+        unit = "mo" if unit.startswith("mo") else "m" if unit.startswith("m") else unit[0]
+        posted = observed_at - timedelta(days=int(match.group("amount")) * _UNIT_DAYS[unit])
+        return posted.strftime("%Y-%m-%d"), (line[:match.start()] + line[match.end():]).strip()
+    return None, line
+
+
+def split_entries(block: List[str]) -> List[List[str]]:
+    """Entries of the section: split on blank lines, numbered items and "X shared/commented" headers"""
+    entries, current = [], []
+    for raw in block:
+        line = clean_line(raw)
+        if not line or _ENTRY_START_RE.match(raw) or _ACTION_RE.search(line):
+            if current:
+                entries.append(current)
+            current = [line] if line else []
+        else:
+            current.append(line)
+    if current:
+        entries.append(current)
+    return entries
+
+
+def extract_posts(text: str, observed_at: Optional[str] = None) -> List[dict]:
+    """[{"snippet", "action", "posted_at"}] of the Activity section"""
+    moment = parse_moment(observed_at)
+    posts = []
+    for entry in split_entries(activity_block(text)):
+        action, posted_at, parts = None, None, []
+        for line in entry:
+            match = _ACTION_RE.search(line)
+            if match and action is None:
+                action = match.group("action").lower()
+                # "Ivan commented on energy storage news": the text after the verb is content
+                line = line[match.end():]
+            date, line = parse_time(line, moment)
+            posted_at = posted_at or date
+            line = line.strip(" •·|\\-")
+            if _NOISE_RE.search(line):
+                continue
+            words = {word.lower() for word in re.findall(r"\w+", line)}
+            # Button rows and the author's name above a post
+            if not words or words <= _UI_WORDS or profile_identity.parse_name(line) == line:
+                continue
+            parts.append(line)
+        snippet = " ".join(parts)
+        if len(snippet.split()) >= MIN_SNIPPET_WORDS:
+            posts.append({"snippet": snippet, "action": action, "posted_at": posted_at})
+    return posts
+
+
+def parse_moment(observed_at: Optional[str]) -> datetime:
+    """Snapshot time as a naive UTC datetime"""
+    if observed_at:
+        return datetime.strptime(observed_at[:19].replace("T", " "), "%Y-%m-%d %H:%M:%S")
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def post_shingles(snippet: str) -> np.ndarray:
+    """Sorted hashed word shingles of a snippet"""
+    return np.array(sorted(shingles(snippet, SHINGLE_SIZE)), dtype=np.uint32)
+
+
+def containment(first: np.ndarray, second: np.ndarray) -> float:
+    """Share of the smaller shingle set contained in the other"""
+    if not first.size or not second.size:
+        return 0.0
+    common = np.intersect1d(first, second, assume_unique=True).size
+    return common / min(first.size, second.size)
+
+
+def init_activity_tables(db_path: str):
+    """Create activity_posts and the scan log"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS activity_posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            profile_key TEXT NOT NULL,
+            snippet TEXT NOT NULL,
+            action TEXT,
+            posted_at TEXT,
+            shingles BLOB NOT NULL,
+            first_seen_at TIMESTAMP NOT NULL,
+            last_seen_at TIMESTAMP NOT NULL,
+            seen_count INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_activity_posts_profile ON activity_posts (profile_key, first_seen_at)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS activity_scans (
+            source TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            profile_key TEXT NOT NULL,
+            observed_at TIMESTAMP NOT NULL,
+            new_posts INTEGER NOT NULL,
+            PRIMARY KEY (source, source_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_activity_scans_profile ON activity_scans (profile_key, observed_at)')
+    conn.commit()
+    conn.close()
+    event_outbox.init_outbox_tables(db_path)
+
+
+def track_posts(db_path: str, profile_key: str, text: str, source: str, source_id: int,
+                observed_at: Optional[str] = None) -> List[dict]:
+    """Match a snapshot's posts against the profile's known posts; returns the new ones
+
+    The first snapshot of a profile sets the baseline and snapshots older than the
+    newest scanned one (backfills) only refresh what is known: neither emits events.
+    """
+    observed_at = observed_at or parse_moment(None).strftime("%Y-%m-%d %H:%M:%S")
+    posts = extract_posts(text, observed_at)
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute(
+            "SELECT 1 FROM activity_scans WHERE source = ? AND source_id = ?", (source, source_id)
+        ).fetchone():
+            conn.execute("COMMIT")
+            return []
+        newest = conn.execute(
+            "SELECT MAX(observed_at) FROM activity_scans WHERE profile_key = ?", (profile_key,)
+        ).fetchone()[0]
+        known = [
+            (post_id, snippet, np.frombuffer(blob, dtype=np.uint32))
+            for post_id, snippet, blob in conn.execute(
+                "SELECT id, snippet, shingles FROM activity_posts WHERE profile_key = ?", (profile_key,)
+            )
+        ]
+
+        new_posts = []
+        for post in posts:
+            grams = post_shingles(post["snippet"])
+            best = max(known, key=lambda item: containment(grams, item[2]), default=None)
+            if best is not None and containment(grams, best[2]) >= CONTAINMENT_THRESHOLD:
+                post_id, snippet, _ = best
+                # Keep the most complete reading of the snippet
+                longer = len(post["snippet"]) > len(snippet)
+                conn.execute(
+                    '''
+                    UPDATE activity_posts SET seen_count = seen_count + 1, last_seen_at = MAX(last_seen_at, ?),
+                        snippet = CASE WHEN ? THEN ? ELSE snippet END,
+                        shingles = CASE WHEN ? THEN ? ELSE shingles END,
+                        posted_at = COALESCE(posted_at, ?)
+                    WHERE id = ?
+                    ''',
+                    (observed_at, longer, post["snippet"], longer, grams.tobytes(), post["posted_at"], post_id)
+                )
+                continue
+            post_id = conn.execute(
+                '''
+                INSERT INTO activity_posts
+                    (profile_key, snippet, action, posted_at, shingles, first_seen_at, last_seen_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''',
+                (profile_key, post["snippet"], post["action"], post["posted_at"], grams.tobytes(),
+                 observed_at, observed_at)
+            ).lastrowid
+            known.append((post_id, post["snippet"], grams))
+            new_posts.append(post)
+
+        notify = bool(new_posts) and newest is not None and observed_at >= newest
+        if notify:
+            event_outbox.emit_event(conn, event_outbox.EVENT_NEW_ACTIVITY, profile_key, {
+                "profile_key": profile_key,
+                "observed_at": observed_at,
+                "posts": new_posts,
+                "source": f"{source} #{source_id}",
+            })
+        conn.execute(
+            "INSERT INTO activity_scans (source, source_id, profile_key, observed_at, new_posts) VALUES (?, ?, ?, ?, ?)",
+            (source, source_id, profile_key, observed_at, len(new_posts))
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    if notify:
+        event_outbox.wake_worker()
+    return new_posts
+
+
+def track_pending(db_path: str = DB_PATH) -> int:
+    """Scan every analysis / bot text not scanned yet, oldest first; returns how many"""
+    init_activity_tables(db_path)
+    profile_identity.resolve_pending(db_path)
+    pending = snapshot_sources.pending_rows(db_path, "activity_scans")
+    for source, source_id, text, profile_key, _, observed_at in pending:
+        new_posts = track_posts(db_path, profile_key, text, source, source_id, observed_at)
+        for post in new_posts:
+            print(f"🆕 {profile_key}: {post['action'] or 'post'} {post['posted_at'] or ''} — {post['snippet'][:80]}")
+    return len(pending)
+
+
+if __name__ == "__main__":
+    scanned = track_pending(sys.argv[1] if len(sys.argv) > 1 else DB_PATH)
+    print(f"📰 Scanned {scanned} snapshots for new posts")
@@ -6,6 +6,8 @@
 import json
 import sqlite3
 
+import snapshot_diff
+
 # Тарифы OpenAI GPT-4o (актуальные на январь 2025)
 OPENAI_PRICING = {
     "input_cost_per_1m_tokens": 2.50,   # $2.50 за 1M входящих токенов
@@ -20,14 +22,16 @@ def estimate_tokens_for_job_analysis():
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT analysis_id, response_text, prompt_tokens, completion_tokens, total_tokens
+        SELECT analysis_id, id, response_text, prompt_tokens, completion_tokens, total_tokens
         FROM analysis_results 
         WHERE status = 'SUCCESS'
         ORDER BY analysis_id
         LIMIT 3
     ''')
     
-    results = cursor.fetchall()
+    # Сжатые ответы восстанавливаются из цепочки снимков
+    results = [(analysis_id, snapshot_diff.source_text('image_analysis_results.db', 'analysis', row_id, text) or "")
+               + tuple(tokens) for analysis_id, row_id, text, *tokens in cursor.fetchall()]
     conn.close()
     
     if not results:
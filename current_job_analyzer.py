@@ -4,39 +4,72 @@ Current job analyzer via OpenAI API
 Extracts the current job from each analysis and tracks changes
 """
 
+import asyncio
+import hashlib
 import sqlite3
 import requests
 import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 
+import event_outbox
+import job_history
+import job_rules
+from job_normalize import group_values, load_aliases, normalize_company, normalize_position
+import minhash_cache
+import profile_identity
+import snapshot_diff
+from rate_limit import TokenBucket, estimate_tokens
+from structured_output import (
+    CURRENT_JOB_INSTRUCTIONS, JOB_EXTRACTION_SCHEMA, PACKED_JOB_EXTRACTION_SCHEMA, parse_tolerant, response_format
+)
+
 # OpenAI configuration (from env)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
+JOB_MAX_TOKENS = 300
 
-def extract_current_job_via_openai(response_text, analysis_id):
-    """Extract current job via OpenAI API"""
-    
-    prompt = f"""Analyze the text below and extract ONLY the person's current job.
+# Batch runner: parallel requests paced to the account's rate limits (gpt-4o tier 1 defaults)
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "8"))
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "30000"))
+JOB_MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", "3"))
+PROGRESS_EVERY = 25
+# Texts the rule parser reads at or above this confidence skip the LLM
+JOB_RULES_MIN_CONFIDENCE = float(os.getenv("JOB_RULES_MIN_CONFIDENCE", str(job_rules.MIN_CONFIDENCE)))
+# Packing: several texts per request share one instruction preamble (0 = one text per request)
+JOB_PACK_TOKEN_BUDGET = int(os.getenv("JOB_PACK_TOKEN_BUDGET", "0"))
+JOB_PACK_MAX_RECORDS = int(os.getenv("JOB_PACK_MAX_RECORDS", "10"))
+JOB_PACK_TOKENS_PER_RECORD = 150
+# Near-duplicate cache: reuse the result of an analysed text this similar (estimated Jaccard)
+JOB_CACHE_ENABLED = os.getenv("JOB_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+JOB_CACHE_THRESHOLD = float(os.getenv("JOB_CACHE_THRESHOLD", str(minhash_cache.THRESHOLD)))
+# Share of cache hits still sent to the LLM to measure false reuse
+JOB_CACHE_AUDIT_RATE = float(os.getenv("JOB_CACHE_AUDIT_RATE", "0.05"))
+
+DB_PATH = 'image_analysis_results.db'
+# The per-run job_analysis_*.json dump is optional now that results live in the DB
+JOB_EXPORT_JSON = os.getenv("JOB_EXPORT_JSON", "").lower() in ("1", "true", "yes")
+# Optional JSON file with extra company/position spellings: {"companies": {...}, "positions": {...}}
+JOB_ALIASES_FILE = os.getenv("JOB_ALIASES_FILE", "")
 
-Return JSON:
-{{
-  "current_job": {{
-    "company": "company name",
-    "position": "position", 
-    "period": "work period (if provided)",
-    "is_current": true/false
-  }},
-  "found": true/false
-}}
+def build_job_prompt(response_text):
+    """Prompt for extracting the current job from OCR text"""
+    
+    return f"""Analyze the text below and extract ONLY the person's current job.
 
-Look for keywords like: "Present", "Current", "Founder", "CEO", "Head of", etc.
-If you can't determine the current job, return {{"found": false}}.
+{CURRENT_JOB_INSTRUCTIONS}
 
 TEXT TO ANALYZE:
 {response_text}
 """
 
+def request_structured(prompt, max_tokens, schema_name, schema, label):
+    """Chat completion with a strict JSON schema; parsed dict, or {"found": False, "error": ...}"""
+    
     try:
         headers = {
             "Authorization": f"Bearer {OPENAI_API_KEY}",
@@ -51,83 +84,517 @@ TEXT TO ANALYZE:
                     "content": prompt
                 }
             ],
-            "max_tokens": 300,
-            "temperature": 0.1
+            "max_tokens": max_tokens,
+            "temperature": 0.1,
+            # The model can only answer with this shape, so no fences or prose to clean up
+            "response_format": response_format(schema_name, schema)
         }
         
-        print(f"🔍 Analyzing job in analysis #{analysis_id}...")
         response = requests.post(OPENAI_API_URL, headers=headers, json=payload, timeout=30)
         
         if response.status_code == 200:
             result = response.json()
-            ai_response = result['choices'][0]['message']['content'].strip()
+            message = result['choices'][0]['message']
+            if message.get('refusal'):
+                print(f"⚠️  Model refused {label}: {message['refusal']}")
+                return {"found": False, "error": "Refused", "raw_response": message['refusal']}
+            ai_response = (message.get('content') or "").strip()
             
-            # Try to parse JSON
-            try:
-                cleaned_response = ai_response.strip()
-                if cleaned_response.startswith("```json"):
-                    cleaned_response = cleaned_response.replace("```json", "").replace("```", "").strip()
-                elif cleaned_response.startswith("```"):
-                    cleaned_response = cleaned_response.replace("```", "").strip()
-                
-                job_data = json.loads(cleaned_response)
-                return job_data
-            except json.JSONDecodeError:
-                print(f"⚠️  JSON parse failed for analysis #{analysis_id}")
+            # Output cut off by max_tokens still yields the fields completed before the cut
+            data = parse_tolerant(ai_response)
+            if not isinstance(data, dict):
+                print(f"⚠️  JSON parse failed for {label}")
                 print(f"OpenAI response: {ai_response}")
                 return {"found": False, "error": "JSON parse failed", "raw_response": ai_response}
+            if result['choices'][0].get('finish_reason') == "length":
+                print(f"⚠️  Truncated response for {label}, using the parsed part")
+            return data
         
         else:
             print(f"❌ OpenAI API error: {response.status_code}")
             return {"found": False, "error": f"API error {response.status_code}"}
             
     except Exception as e:
-        print(f"❌ Exception analyzing #{analysis_id}: {e}")
+        print(f"❌ Exception analyzing {label}: {e}")
         return {"found": False, "error": str(e)}
 
-def analyze_all_jobs():
-    """Analyze current job across successful analyses"""
+def normalize_job(job_data):
+    """Job result with found only kept when the job got as far as a company or position"""
+    # A job cut off before its fields (truncated output) isn't trusted as found
+    current_job = job_data.get("current_job") or {}
+    has_job = bool(current_job.get("company") or current_job.get("position"))
+    return {"found": bool(job_data.get("found")) and has_job, "current_job": job_data.get("current_job")}
+
+def extract_current_job_via_openai(response_text, analysis_id):
+    """Extract current job via OpenAI API"""
     
-    conn = sqlite3.connect('image_analysis_results.db')
-    cursor = conn.cursor()
+    print(f"🔍 Analyzing job in analysis #{analysis_id}...")
+    job_data = request_structured(
+        build_job_prompt(response_text), JOB_MAX_TOKENS, "current_job", JOB_EXTRACTION_SCHEMA, f"analysis #{analysis_id}"
+    )
+    if "error" in job_data:
+        return job_data
+    if "found" not in job_data:
+        return {"found": False, "error": "JSON parse failed", "raw_response": json.dumps(job_data)}
+    return normalize_job(job_data)
+
+def build_packed_prompt(records):
+    """One prompt for several (analysis_id, response_text) records"""
     
+    texts = "\n\n".join(f"=== ANALYSIS #{analysis_id} ===\n{response_text}" for analysis_id, response_text in records)
+    return f"""Below are OCR texts of several profiles, each starting with a line "=== ANALYSIS #<id> ===".
+For EACH of them extract ONLY the person's current job and return one result per analysis with its analysis_id.
+
+{CURRENT_JOB_INSTRUCTIONS}
+
+TEXTS TO ANALYZE:
+{texts}
+"""
+
+def pack_records(records, token_budget=None, max_records=None):
+    """Greedy packs of records whose prompt fits the token budget; an oversized record gets a pack of its own"""
+    
+    token_budget = token_budget or JOB_PACK_TOKEN_BUDGET
+    max_records = max_records or JOB_PACK_MAX_RECORDS
+    preamble_tokens = estimate_tokens(build_packed_prompt([]))
+    packs, pack, pack_tokens = [], [], preamble_tokens
+    for record in records:
+        record_tokens = estimate_tokens(f"=== ANALYSIS #{record[0]} ===\n{record[1]}\n\n")
+        if pack and (pack_tokens + record_tokens > token_budget or len(pack) >= max_records):
+            packs.append(pack)
+            pack, pack_tokens = [], preamble_tokens
+        pack.append(record)
+        pack_tokens += record_tokens
+    if pack:
+        packs.append(pack)
+    return packs
+
+def extract_current_jobs_packed(records):
+    """Current jobs of several records in one request; {"results": {analysis_id: job_info}} or an error dict
+    
+    Records the answer leaves out (or that were cut off) are simply absent from results.
+    """
+    
+    ids = [analysis_id for analysis_id, _ in records]
+    label = f"analyses #{ids[0]}..#{ids[-1]} ({len(ids)} packed)"
+    print(f"🔍 Analyzing jobs in {label}...")
+    max_tokens = min(4096, JOB_PACK_TOKENS_PER_RECORD * len(records))
+    data = request_structured(build_packed_prompt(records), max_tokens, "current_jobs", PACKED_JOB_EXTRACTION_SCHEMA, label)
+    if "error" in data:
+        return data
+    
+    wanted = set(ids)
+    results = {}
+    for item in data.get("results") or []:
+        if isinstance(item, dict) and item.get("analysis_id") in wanted and "found" in item:
+            results[item["analysis_id"]] = normalize_job(item)
+    return {"results": results}
+
+def is_retryable(job_info):
+    """Rate limits, server errors and network failures are worth another try; bad answers are not"""
+    error = job_info.get("error")
+    if not error or "raw_response" in job_info:
+        return False
+    if error.startswith("API error "):
+        status = error[len("API error "):]
+        return status == "429" or status.startswith("5")
+    return True
+
+def print_job_info(analysis_id, job_info):
+    """Print one extraction"""
+    print(f"\n📋 ANALYSIS #{analysis_id}:")
+    if job_info.get("found", False):
+        current_job = job_info.get("current_job", {})
+        print(f"   🏢 Company: {current_job.get('company', 'N/A')}")
+        print(f"   👔 Position: {current_job.get('position', 'N/A')}")
+        print(f"   📅 Period: {current_job.get('period', 'N/A')}")
+        print(f"   ✅ Current: {current_job.get('is_current', 'Unknown')}")
+    else:
+        print(f"   ❌ Current job not found")
+        if "error" in job_info:
+            print(f"   🔴 Error: {job_info['error']}")
+
+def input_hash(response_text):
+    """Hash of the text a job was extracted from; a changed text means a stale extraction"""
+    return hashlib.sha256((response_text or "").encode('utf-8')).hexdigest()
+
+def init_job_tables(db_path=DB_PATH):
+    """Create job extraction tables"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
     cursor.execute('''
-        SELECT analysis_id, response_text
-        FROM analysis_results 
-        WHERE status = 'SUCCESS'
-        ORDER BY analysis_id
+        CREATE TABLE IF NOT EXISTS job_extractions (
+            analysis_id INTEGER PRIMARY KEY,
+            input_hash TEXT NOT NULL,
+            job_json TEXT NOT NULL,
+            found INTEGER NOT NULL,
+            company TEXT,
+            position TEXT,
+            period TEXT,
+            extracted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
     ''')
-    
-    results = cursor.fetchall()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_analysis_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+def get_watermark(db_path=DB_PATH):
+    """Highest analysis_results.id already handed to the job analyzer"""
+    conn = sqlite3.connect(db_path)
+    row = conn.execute("SELECT value FROM job_analysis_state WHERE key = 'last_row_id'").fetchone()
+    conn.close()
+    return int(row[0]) if row else 0
+
+def set_watermark(row_id, db_path=DB_PATH):
+    """Store the watermark"""
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "INSERT INTO job_analysis_state (key, value) VALUES ('last_row_id', ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (str(row_id),)
+    )
+    conn.commit()
     conn.close()
+
+def select_rows_to_analyze(db_path=DB_PATH):
+    """SUCCESS rows added after the watermark, or whose text no longer matches the stored extraction
     
-    print("🏢 CURRENT JOB ANALYZER")
-    print("="*80)
-    print(f"Found {len(results)} successful analyses to process")
+    Returns (rows as (analysis_id, response_text), highest row id seen).
+    """
+    watermark = get_watermark(db_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
     
-    job_extractions = []
+    cursor.execute('''
+        SELECT ar.id, ar.analysis_id, ar.response_text, je.input_hash
+        FROM analysis_results ar
+        LEFT JOIN job_extractions je ON je.analysis_id = ar.analysis_id
+        WHERE ar.status = 'SUCCESS'
+        ORDER BY ar.analysis_id
+    ''')
+    rows = []
+    max_row_id = watermark
+    for row_id, analysis_id, response_text, stored_hash in cursor.fetchall():
+        max_row_id = max(max_row_id, row_id)
+        response_text = snapshot_diff.source_text(db_path, 'analysis', row_id, response_text)
+        # Below the watermark only edited texts (or extractions that failed and weren't stored) are redone
+        if row_id > watermark or stored_hash != input_hash(response_text):
+            rows.append((analysis_id, response_text))
+    conn.close()
+    return rows, max_row_id
+
+def save_job_extraction(analysis_id, response_text, job_info, db_path=DB_PATH):
+    """Insert or replace the extraction of one analysis"""
+    current_job = job_info.get("current_job") or {}
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        '''
+        INSERT OR REPLACE INTO job_extractions
+            (analysis_id, input_hash, job_json, found, company, position, period, extracted_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        (
+            analysis_id,
+            input_hash(response_text),
+            json.dumps(job_info, ensure_ascii=False),
+            int(bool(job_info.get("found"))),
+            current_job.get("company"),
+            current_job.get("position"),
+            current_job.get("period"),
+            datetime.now().isoformat()
+        )
+    )
+    conn.commit()
+    conn.close()
+
+def load_job_extractions(db_path=DB_PATH):
+    """All stored extractions of SUCCESS analyses, in the job_extractions format"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT je.analysis_id, je.job_json, je.extracted_at
+        FROM job_extractions je
+        WHERE je.analysis_id IN (SELECT analysis_id FROM analysis_results WHERE status = 'SUCCESS')
+        ORDER BY je.analysis_id
+    ''')
+    job_extractions = [
+        {"analysis_id": analysis_id, "job_info": json.loads(job_json), "timestamp": extracted_at}
+        for analysis_id, job_json, extracted_at in cursor.fetchall()
+    ]
+    conn.close()
+    return job_extractions
+
+async def run_job_batch(rows, concurrency=JOB_CONCURRENCY, rpm_limit=OPENAI_RPM_LIMIT,
+                        tpm_limit=OPENAI_TPM_LIMIT, on_extraction=None, pack_budget=JOB_PACK_TOKEN_BUDGET,
+                        cache=None, audit_rate=JOB_CACHE_AUDIT_RATE):
+    """Extract jobs for (analysis_id, response_text) rows concurrently under RPM/TPM limits
+    
+    on_extraction(analysis_id, response_text, job_info) is called as soon as an extraction is final
+    (retryable failures are not), so an interrupted run loses nothing already paid for.
+    With pack_budget, texts the rules can't read are sent several per request.
+    With a MinHashCache, near-duplicates of analysed texts (earlier or in this batch) reuse their result.
+    Returns job_extractions in row order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    # requests is blocking; a pool of its own so concurrency isn't capped by the default executor
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    loop = asyncio.get_running_loop()
+    requests_bucket = TokenBucket(rpm_limit)
+    tokens_bucket = TokenBucket(tpm_limit)
+    started = time.monotonic()
+    extractions = {}
+    rule_hits = 0
+    llm_requests = 0
+    cache_hits = 0
+    signatures = {}
+    entries = {}
+    # analysis_id -> (cached_from, similarity, cached job) for hits re-checked by the LLM
+    audits = {}
+    false_reuses = 0
     
-    for result in results:
-        analysis_id, response_text = result
-        job_info = extract_current_job_via_openai(response_text, analysis_id)
-        job_extractions.append({
+    def finish(analysis_id, response_text, job_info):
+        nonlocal false_reuses
+        if on_extraction and not is_retryable(job_info):
+            on_extraction(analysis_id, response_text, job_info)
+        if cache is not None and job_info.get("source") != "cache":
+            sig = signatures.get(analysis_id)
+            if "error" in job_info:
+                cache.discard(analysis_id)
+            else:
+                if sig is None:
+                    sig = minhash_cache.signature(response_text)
+                entry = entries.get(analysis_id)
+                if entry is None:
+                    entry = minhash_cache.top_entry(response_text)
+                cache.store(analysis_id, sig, {"found": job_info["found"], "current_job": job_info.get("current_job")}, entry)
+            if analysis_id in audits and "error" not in job_info:
+                cached_from, score, cached = audits[analysis_id]
+                if not cache.record_audit(analysis_id, cached_from, score, cached, job_info):
+                    false_reuses += 1
+                    print(f"🚨 False reuse: analysis #{analysis_id} differs from cached #{cached_from} ({score:.2f})")
+        print_job_info(analysis_id, job_info)
+        extractions[analysis_id] = {
             "analysis_id": analysis_id,
             "job_info": job_info,
             "timestamp": datetime.now().isoformat()
+        }
+        
+        completed = len(extractions)
+        if completed % PROGRESS_EVERY == 0 or completed == len(rows):
+            elapsed = time.monotonic() - started
+            rate = completed / elapsed if elapsed else 0
+            eta = (len(rows) - completed) / rate if rate else 0
+            print(f"⏳ Progress: {completed}/{len(rows)} ({completed / len(rows) * 100:.1f}%) | "
+                  f"{rate * 60:.0f} analyses/min | ETA {eta:.0f}s")
+    
+    async def call_with_retries(func, request_tokens, label, *args):
+        nonlocal llm_requests
+        async with semaphore:
+            for attempt in range(JOB_MAX_RETRIES + 1):
+                await requests_bucket.acquire()
+                await tokens_bucket.acquire(request_tokens)
+                llm_requests += 1
+                outcome = await loop.run_in_executor(executor, func, *args)
+                if not is_retryable(outcome) or attempt == JOB_MAX_RETRIES:
+                    return outcome
+                delay = 2 ** attempt
+                print(f"🔁 {label}: {outcome['error']}, retry in {delay}s")
+                await asyncio.sleep(delay)
+    
+    async def extract_single(analysis_id, response_text):
+        request_tokens = estimate_tokens(build_job_prompt(response_text), JOB_MAX_TOKENS)
+        job_info = await call_with_retries(
+            extract_current_job_via_openai, request_tokens, f"Analysis #{analysis_id}", response_text, analysis_id
+        )
+        finish(analysis_id, response_text, job_info)
+    
+    async def extract_pack(pack):
+        if not pack:
+            return
+        if len(pack) == 1:
+            await extract_single(*pack[0])
+            return
+        request_tokens = estimate_tokens(build_packed_prompt(pack), JOB_PACK_TOKENS_PER_RECORD * len(pack))
+        outcome = await call_with_retries(
+            extract_current_jobs_packed, request_tokens, f"Pack of {len(pack)}", pack
+        )
+        if is_retryable(outcome):
+            # Rate limit, server error or timeout: smaller packs would only hit it twice as often.
+            # The records aren't stored, so the next run picks the whole pack up again
+            print(f"⏸️  Pack of {len(pack)} left for the next run: {outcome['error']}")
+            for analysis_id, response_text in pack:
+                finish(analysis_id, response_text, outcome)
+            return
+        results = outcome.get("results", {})
+        for analysis_id, response_text in pack:
+            if analysis_id in results:
+                finish(analysis_id, response_text, results[analysis_id])
+        
+        # Truncated, unparseable or refused answers: retry what's missing in two smaller packs
+        missing = [record for record in pack if record[0] not in results]
+        if missing:
+            print(f"✂️  {len(missing)} of {len(pack)} packed analyses missing, splitting")
+            middle = (len(missing) + 1) // 2
+            await asyncio.gather(extract_pack(missing[:middle]), extract_pack(missing[middle:]))
+    
+    llm_rows = []
+    for analysis_id, response_text in rows:
+        rule_result = job_rules.extract_current_job(response_text)
+        if rule_result["found"] and rule_result["confidence"] >= JOB_RULES_MIN_CONFIDENCE:
+            rule_hits += 1
+            finish(analysis_id, response_text, {**rule_result, "source": "rules"})
+        else:
+            llm_rows.append((analysis_id, response_text))
+    
+    def reuse(analysis_id, response_text, cached_from, score):
+        nonlocal cache_hits
+        cache_hits += 1
+        finish(analysis_id, response_text, {
+            **cache.job(cached_from), "source": "cache", "cached_from": cached_from, "similarity": round(score, 3)
         })
-        print(f"\n📋 ANALYSIS #{analysis_id}:")
-        if job_info.get("found", False):
-            current_job = job_info.get("current_job", {})
-            print(f"   🏢 Company: {current_job.get('company', 'N/A')}")
-            print(f"   👔 Position: {current_job.get('position', 'N/A')}")
-            print(f"   📅 Period: {current_job.get('period', 'N/A')}")
-            print(f"   ✅ Current: {current_job.get('is_current', 'Unknown')}")
+    
+    async def run_llm(batch):
+        if pack_budget:
+            packs = pack_records(batch, token_budget=pack_budget)
+            print(f"📦 Packing {len(batch)} analyses into {len(packs)} requests")
+            await asyncio.gather(*(extract_pack(pack) for pack in packs))
         else:
-            print(f"   ❌ Current job not found")
-            if "error" in job_info:
-                print(f"   🔴 Error: {job_info['error']}")
+            await asyncio.gather(*(extract_single(analysis_id, text) for analysis_id, text in batch))
     
-    return job_extractions
+    to_llm = llm_rows
+    # Texts waiting for a near-duplicate from this batch: cached_from -> [(row, similarity)]
+    followers = {}
+    if cache is not None:
+        to_llm = []
+        for analysis_id, response_text in llm_rows:
+            sig = signatures[analysis_id] = minhash_cache.signature(response_text)
+            entry = entries[analysis_id] = minhash_cache.top_entry(response_text)
+            # A re-analysed (changed) text must not match its own stale entry
+            match = cache.query(sig, entry, exclude=analysis_id)
+            if match is None:
+                cache.add_pending(analysis_id, sig, entry)
+                to_llm.append((analysis_id, response_text))
+                continue
+            cached_from, score = match
+            if cache.job(cached_from) is None:
+                followers.setdefault(cached_from, []).append(((analysis_id, response_text), score))
+            elif random.random() < audit_rate:
+                audits[analysis_id] = (cached_from, score, cache.job(cached_from))
+                to_llm.append((analysis_id, response_text))
+            else:
+                reuse(analysis_id, response_text, cached_from, score)
+    
+    try:
+        await run_llm(to_llm)
+        # Duplicates whose original failed get their own request
+        orphans = []
+        for cached_from, waiting in followers.items():
+            for (analysis_id, response_text), score in waiting:
+                if cache.job(cached_from) is not None:
+                    reuse(analysis_id, response_text, cached_from, score)
+                else:
+                    orphans.append((analysis_id, response_text))
+        if orphans:
+            await run_llm(orphans)
+    finally:
+        executor.shutdown(wait=False)
+    
+    if rows:
+        print(f"\n⚡ Rule fast path: {rule_hits}/{len(rows)} analyses ({rule_hits / len(rows) * 100:.1f}%) skipped the LLM")
+        if cache is not None:
+            total_audits, total_false = cache.audit_stats()
+            print(f"♻️  Near-duplicate cache: {cache_hits} reused, {len(audits)} audited ({false_reuses} false) | "
+                  f"all-time false reuse: {total_false}/{total_audits}")
+        print(f"📨 LLM requests: {llm_requests} for {len(llm_rows) - cache_hits} analyses")
+    return [extractions[analysis_id] for analysis_id, _ in rows]
+
+def analyze_all_jobs(db_path=DB_PATH):
+    """Analyze current job for new or changed successful analyses; returns all stored extractions"""
+    
+    init_job_tables(db_path)
+    job_history.init_history_table(db_path)
+    rows, max_row_id = select_rows_to_analyze(db_path)
+    
+    print("🏢 CURRENT JOB ANALYZER")
+    print("="*80)
+    print(f"Found {len(rows)} new or changed successful analyses to process (watermark: row {get_watermark(db_path)})")
+    
+    if rows:
+        print(f"⚙️  Concurrency: {JOB_CONCURRENCY} | limits: {OPENAI_RPM_LIMIT} RPM, {OPENAI_TPM_LIMIT} TPM")
+        cache = minhash_cache.MinHashCache(db_path, threshold=JOB_CACHE_THRESHOLD) if JOB_CACHE_ENABLED else None
+        final = {}
+        
+        def on_extraction(analysis_id, text, job_info):
+            save_job_extraction(analysis_id, text, job_info, db_path)
+            final[analysis_id] = job_info
+        
+        asyncio.run(run_job_batch(rows, on_extraction=on_extraction, cache=cache))
+        if update_job_history(final, db_path):
+            # The bot's worker would pick them up too; deliver now when run standalone
+            delivered = event_outbox.WebhookDeliveryWorker(db_path).deliver_once()
+            print(f"📤 Job change events delivered: {delivered}")
+    # Rows that failed with a retryable error have no stored hash and are picked up again below the watermark
+    set_watermark(max_row_id, db_path)
+    
+    return load_job_extractions(db_path)
+
+def update_job_history(job_infos, db_path=DB_PATH):
+    """Apply new extractions ({analysis_id: job_info}) to job_history in screenshot order; returns the changes"""
+    
+    if not job_infos:
+        return []
+    # Screenshots of one person share a profile id whatever their file names
+    resolved = profile_identity.resolve_pending(db_path)
+    if resolved:
+        print(f"👤 Profiles resolved for {resolved} new snapshots")
+    conn = sqlite3.connect(db_path)
+    ids = list(job_infos)
+    snapshots = []
+    # Chunks keep the IN list under SQLite's bound-parameter limit
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        snapshots += conn.execute(
+            f'''
+            SELECT ar.id, ar.analysis_id, COALESCE('profile:' || ps.profile_id, ar.image_file), ar.created_at
+            FROM analysis_results ar
+            LEFT JOIN profile_snapshots ps ON ps.source = 'analysis' AND ps.source_id = ar.id
+            WHERE ar.status = 'SUCCESS' AND ar.analysis_id IN ({",".join("?" * len(chunk))})
+            ''',
+            chunk
+        ).fetchall()
+    conn.close()
+    snapshots = [(analysis_id, profile_key, created_at) for _, analysis_id, profile_key, created_at in sorted(
+        snapshots, key=lambda snapshot: (snapshot[3] or "", snapshot[0])
+    )]
+    
+    changes = []
+    for analysis_id, profile_key, created_at in snapshots:
+        # Texts without a readable name fall back to their image file as the profile handle
+        change = job_history.record_snapshot(
+            db_path, profile_key, job_infos[analysis_id], observed_at=created_at, source=f"analysis #{analysis_id}"
+        )
+        if change:
+            changes.append(change)
+            print(f"🔄 Job change for {profile_key} at {created_at}: "
+                  f"{change['previous']['position']} @ {change['previous']['company']} → "
+                  f"{change['current']['position']} @ {change['current']['company']}")
+    print(f"🗂️  Job history: {len(snapshots)} snapshots applied, {len(changes)} changes")
+    return changes
+
+def print_value_groups(title, noun, plural, groups):
+    """Print fuzzy-grouped values with the analyses they came from"""
+    print(f"\n{title}")
+    if len(groups) == 1:
+        print(f"   ✅ {noun.capitalize()} unchanged: {groups[0][0]}")
+    else:
+        print(f"   🔄 Detected {len(groups)} different {plural}:")
+        for i, (label, analyses) in enumerate(groups, 1):
+            print(f"      {i}. '{label}' (analyses: {', '.join(map(str, analyses))})")
 
 def compare_job_changes(job_extractions):
     """Compare job changes across analyses"""
@@ -149,35 +616,19 @@ def compare_job_changes(job_extractions):
     
     for job in found_jobs:
         current_job = job["job_info"]["current_job"]
-        company = current_job.get("company", "").strip().lower()
-        position = current_job.get("position", "").strip().lower()
+        company = (current_job.get("company") or "").strip()
+        position = (current_job.get("position") or "").strip()
         
         if company:
             companies.append((job["analysis_id"], company))
         if position:
             positions.append((job["analysis_id"], position))
     
-    print(f"\n🏢 COMPANY CHANGES:")
-    unique_companies = list(set([comp[1] for comp in companies]))
-    
-    if len(unique_companies) == 1:
-        print(f"   ✅ Company unchanged: {unique_companies[0]}")
-    else:
-        print(f"   🔄 Detected {len(unique_companies)} different companies:")
-        for i, company in enumerate(unique_companies, 1):
-            analyses = [comp[0] for comp in companies if comp[1] == company]
-            print(f"      {i}. '{company}' (analyses: {', '.join(map(str, analyses))})")
-    
-    print(f"\n👔 POSITION CHANGES:")
-    unique_positions = list(set([pos[1] for pos in positions]))
-    
-    if len(unique_positions) == 1:
-        print(f"   ✅ Position unchanged: {unique_positions[0]}")
-    else:
-        print(f"   🔄 Detected {len(unique_positions)} different positions:")
-        for i, position in enumerate(unique_positions, 1):
-            analyses = [pos[0] for pos in positions if pos[1] == position]
-            print(f"      {i}. '{position}' (analyses: {', '.join(map(str, analyses))})")
+    # Spelling variants ("Ecoisme." / "ECOISME Inc", "Founder, CEO" / "CEO & Founder") are one value;
+    # positions only on equal keys, since "CEO" / "CTO" are a trigram apart
+    print_value_groups("🏢 COMPANY CHANGES:", "company", "companies", group_values(companies, normalize_company))
+    print_value_groups("👔 POSITION CHANGES:", "position", "positions",
+                       group_values(positions, normalize_position, fuzzy=False))
 
 def save_job_analysis_results(job_extractions):
     """Save analysis results to JSON file"""
@@ -211,22 +662,23 @@ def create_summary_report(job_extractions):
     print(f"   • Found current job: {len(found_jobs)}")
     print(f"   • Not found: {len(job_extractions) - len(found_jobs)}")
     print(f"   • Success rate: {len(found_jobs)/len(job_extractions)*100:.1f}%")
+    rule_jobs = [job for job in job_extractions if job["job_info"].get("source") == "rules"]
+    print(f"   • Read by rules (no LLM call): {len(rule_jobs)} ({len(rule_jobs)/len(job_extractions)*100:.1f}%)")
     
     if found_jobs:
-        companies = [job["job_info"]["current_job"].get("company", "").strip().lower() 
-                    for job in found_jobs if job["job_info"]["current_job"].get("company")]
+        companies = [(job["analysis_id"], job["job_info"]["current_job"]["company"].strip())
+                     for job in found_jobs if job["job_info"]["current_job"].get("company")]
         
         if companies:
-            from collections import Counter
-            company_counts = Counter(companies)
-            most_common_company = company_counts.most_common(1)[0]
+            company_groups = group_values(companies, normalize_company)
+            most_common_company = max(company_groups, key=lambda group: len(group[1]))
             
             print(f"\n🏢 Companies:")
             print(f"   • Total mentions: {len(companies)}")
-            print(f"   • Unique companies: {len(set(companies))}")
-            print(f"   • Most common: '{most_common_company[0]}' ({most_common_company[1]} times)")
+            print(f"   • Unique companies: {len(company_groups)}")
+            print(f"   • Most common: '{most_common_company[0]}' ({len(most_common_company[1])} times)")
             
-            if len(set(companies)) > 1:
+            if len(company_groups) > 1:
                 print(f"   ⚠️  NOTE: Different companies detected — possible job change.")
             else:
                 print(f"   ✅ Company is consistent across analyses")
@@ -240,13 +692,16 @@ def main():
     print()
     
     try:
+        if JOB_ALIASES_FILE:
+            load_aliases(JOB_ALIASES_FILE)
         job_extractions = analyze_all_jobs()
         compare_job_changes(job_extractions)
         create_summary_report(job_extractions)
-        filename = save_job_analysis_results(job_extractions)
         
         print(f"\n✅ Analysis completed!")
-        print(f"📁 Details: {filename}")
+        print(f"📁 Details: job_extractions table in {DB_PATH}")
+        if JOB_EXPORT_JSON:
+            save_job_analysis_results(job_extractions)
         
     except Exception as e:
         print(f"❌ Error during analysis: {e}")
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Event outbox and webhook delivery.
+
+Job changes and new profile activity are written to event_outbox in the
+same transaction as the snapshot that caused them, with one delivery row
+per subscriber, so an event is never lost between "detected" and "queued".
+A delivery worker POSTs due events to each subscriber in batches, signed
+with HMAC-SHA256, retries failures with exponential backoff and records
+how long every event waited (delivery lag).
+
+Batches are claimed with a lease (status 'sending' until lease_until) in one
+write transaction, so several workers or replicas never send the same event
+twice, and a subscriber only gets its oldest undelivered events: while they
+are backing off, nothing newer is sent to it, which keeps delivery in order.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+EVENT_JOB_CHANGE = "job_change"
+EVENT_NEW_ACTIVITY = "new_activity"
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_DELIVERED = "delivered"
+STATUS_FAILED = "failed"
+
+# Subscriber registered on start (optional; more via `python event_outbox.py subscribe URL SECRET`)
+EVENT_WEBHOOK_URL = os.getenv("EVENT_WEBHOOK_URL", "")
+EVENT_WEBHOOK_SECRET = os.getenv("EVENT_WEBHOOK_SECRET", "")
+# Events per POST
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "50"))
+# Attempts before a delivery is given up as failed
+EVENT_MAX_ATTEMPTS = int(os.getenv("EVENT_MAX_ATTEMPTS", "8"))
+# Seconds between outbox checks when nothing wakes the worker
+EVENT_POLL_INTERVAL = float(os.getenv("EVENT_POLL_INTERVAL", "2"))
+EVENT_HTTP_TIMEOUT = float(os.getenv("EVENT_HTTP_TIMEOUT", "10"))
+# Seconds a claimed batch belongs to its worker; a crashed worker's batch is sent again after it
+EVENT_LEASE_SECONDS = float(os.getenv("EVENT_LEASE_SECONDS", "60"))
+# Retry delay: 2, 4, 8... seconds, capped
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 600.0
+# Seconds between delivery lag log lines
+STATS_INTERVAL = 300
+
+SIGNATURE_HEADER = "X-Event-Signature"
+TIMESTAMP_HEADER = "X-Event-Timestamp"
+
+# Set by wake_worker so an in-process worker delivers without waiting for the next poll
+_wakeup = threading.Event()
+
+
+def init_outbox_tables(db_path: str):
+    """Create outbox, subscriber and delivery tables"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT NOT NULL,
+            profile_key TEXT,
+            payload TEXT NOT NULL,
+            created_ts REAL NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS webhook_subscribers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL UNIQUE,
+            secret TEXT NOT NULL,
+            active INTEGER NOT NULL DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS webhook_deliveries (
+            subscriber_id INTEGER NOT NULL,
+            event_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_ts REAL NOT NULL,
+            delivered_ts REAL,
+            lag_ms INTEGER,
+            last_error TEXT,
+            lease_until REAL,
+            PRIMARY KEY (subscriber_id, event_id)
+        )
+    ''')
+    cursor.execute("PRAGMA table_info(webhook_deliveries)")
+    if "lease_until" not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE webhook_deliveries ADD COLUMN lease_until REAL")
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_webhook_deliveries_due
+        ON webhook_deliveries (status, subscriber_id, next_attempt_ts)
+    ''')
+    # Undelivered events of a subscriber in order: the head of its queue is one seek
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_webhook_deliveries_queue
+        ON webhook_deliveries (subscriber_id, event_id) WHERE status IN ('pending', 'sending')
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def add_subscriber(db_path: str, url: str, secret: str) -> int:
+    """Register (or re-activate) a webhook subscriber; only events emitted afterwards are sent to it"""
+    init_outbox_tables(db_path)
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute(
+            '''
+            INSERT INTO webhook_subscribers (url, secret) VALUES (?, ?)
+            ON CONFLICT(url) DO UPDATE SET secret = excluded.secret, active = 1
+            ''',
+            (url, secret)
+        )
+        subscriber_id = conn.execute("SELECT id FROM webhook_subscribers WHERE url = ?", (url,)).fetchone()[0]
+    conn.close()
+    return subscriber_id
+
+
+def emit_event(conn: sqlite3.Connection, event_type: str, profile_key: Optional[str], payload: dict) -> int:
+    """Queue an event for every active subscriber on the caller's connection (and transaction)"""
+    now = time.time()
+    event_id = conn.execute(
+        "INSERT INTO event_outbox (event_type, profile_key, payload, created_ts) VALUES (?, ?, ?, ?)",
+        (event_type, profile_key, json.dumps(payload, ensure_ascii=False), now)
+    ).lastrowid
+    conn.execute(
+        '''
+        INSERT INTO webhook_deliveries (subscriber_id, event_id, next_attempt_ts)
+        SELECT id, ?, ? FROM webhook_subscribers WHERE active = 1
+        ''',
+        (event_id, now)
+    )
+    return event_id
+
+
+def wake_worker():
+    """Let an in-process worker deliver right away; call after committing emitted events"""
+    _wakeup.set()
+
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    """Signature header value: HMAC-SHA256 over "<timestamp>.<body>"
+
+    Subscribers recompute it with their secret and reject stale timestamps, so a
+    captured request can't be replayed later.
+    """
+    digest = hmac.new(secret.encode("utf-8"), timestamp.encode("utf-8") + b"." + body, hashlib.sha256)
+    return "sha256=" + digest.hexdigest()
+
+
+def verify(secret: str, timestamp: str, body: bytes, signature: str) -> bool:
+    """Check a signature the way a subscriber would"""
+    return hmac.compare_digest(sign(secret, timestamp, body), signature or "")
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds until the next attempt after this many failures, with jitter"""
+    return min(BACKOFF_BASE ** attempts, BACKOFF_MAX) * random.uniform(0.8, 1.2)
+
+
+class WebhookDeliveryWorker:
+    """Delivers due outbox events to subscribers in signed batches"""
+
+    def __init__(self, db_path: str, batch_size: int = EVENT_BATCH_SIZE, max_attempts: int = EVENT_MAX_ATTEMPTS,
+                 timeout: float = EVENT_HTTP_TIMEOUT, lease_seconds: float = EVENT_LEASE_SECONDS):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.lease_seconds = lease_seconds
+        self.session = requests.Session()
+        init_outbox_tables(db_path)
+
+    def claim_batch(self, subscriber_id: int, now: float) -> Tuple[List[tuple], Optional[float]]:
+        """Lease the oldest undelivered events of a subscriber
+
+        Returns the batch (event_id, event_type, profile_key, payload, created_ts,
+        attempts) and its lease; nothing while the oldest event is backing off or
+        leased by another worker.
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            # The write lock makes checking the head and claiming one step across workers
+            conn.execute("BEGIN IMMEDIATE")
+            head = conn.execute(
+                '''
+                SELECT status, next_attempt_ts, lease_until FROM webhook_deliveries
+                WHERE subscriber_id = ? AND status IN ('pending', 'sending')
+                ORDER BY event_id LIMIT 1
+                ''',
+                (subscriber_id,)
+            ).fetchone()
+            if head is None or head[1] > now or (head[0] == STATUS_SENDING and head[2] > now):
+                conn.execute("COMMIT")
+                return [], None
+            lease_until = now + self.lease_seconds
+            claimed = [event_id for (event_id,) in conn.execute(
+                '''
+                UPDATE webhook_deliveries SET status = 'sending', lease_until = ?
+                WHERE subscriber_id = ? AND event_id IN (
+                    SELECT event_id FROM webhook_deliveries
+                    WHERE subscriber_id = ? AND status IN ('pending', 'sending')
+                    ORDER BY event_id LIMIT ?
+                )
+                RETURNING event_id
+                ''',
+                (lease_until, subscriber_id, subscriber_id, self.batch_size)
+            ).fetchall()]
+            rows = conn.execute(
+                f'''
+                SELECT e.id, e.event_type, e.profile_key, e.payload, e.created_ts, d.attempts
+                FROM webhook_deliveries d JOIN event_outbox e ON e.id = d.event_id
+                WHERE d.subscriber_id = ? AND d.event_id IN ({", ".join("?" * len(claimed))})
+                ORDER BY e.id
+                ''',
+                (subscriber_id, *claimed)
+            ).fetchall()
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return rows, lease_until
+
+    def post_batch(self, url: str, secret: str, rows: List[tuple]) -> Optional[str]:
+        """POST one batch; returns None on success, the error otherwise"""
+        body = json.dumps({
+            "events": [
+                {"id": event_id, "type": event_type, "profile_key": profile_key,
+                 "created_at": round(created_ts, 3), "data": json.loads(payload)}
+                for event_id, event_type, profile_key, payload, created_ts, _ in rows
+            ]
+        }, ensure_ascii=False).encode("utf-8")
+        timestamp = str(int(time.time()))
+        try:
+            response = self.session.post(
+                url,
+                data=body,
+                headers={
+                    "Content-Type": "application/json",
+                    TIMESTAMP_HEADER: timestamp,
+                    SIGNATURE_HEADER: sign(secret, timestamp, body),
+                },
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            return f"{type(e).__name__}: {e}"
+        if 200 <= response.status_code < 300:
+            return None
+        return f"HTTP {response.status_code}: {response.text[:200]}"
+
+    def record_result(self, subscriber_id: int, rows: List[tuple], lease_until: float, error: Optional[str]):
+        """Mark a batch delivered (with lag) or schedule its retry
+
+        Only rows still under this worker's lease are updated; if the lease ran
+        out and another worker took the batch over, its result wins.
+        """
+        now = time.time()
+        # The oldest event sets the retry time of the whole subscriber queue
+        next_attempt_ts = now + retry_delay(rows[0][5] + 1)
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            for event_id, _, _, _, created_ts, attempts in rows:
+                if error is None:
+                    conn.execute(
+                        '''
+                        UPDATE webhook_deliveries SET status = 'delivered', attempts = ?, delivered_ts = ?, lag_ms = ?,
+                            last_error = NULL, lease_until = NULL
+                        WHERE subscriber_id = ? AND event_id = ? AND status = 'sending' AND lease_until = ?
+                        ''',
+                        (attempts + 1, now, int((now - created_ts) * 1000), subscriber_id, event_id, lease_until)
+                    )
+                else:
+                    status = STATUS_FAILED if attempts + 1 >= self.max_attempts else STATUS_PENDING
+                    conn.execute(
+                        '''
+                        UPDATE webhook_deliveries SET status = ?, attempts = ?, next_attempt_ts = ?, last_error = ?,
+                            lease_until = NULL
+                        WHERE subscriber_id = ? AND event_id = ? AND status = 'sending' AND lease_until = ?
+                        ''',
+                        (status, attempts + 1, next_attempt_ts, error[:500], subscriber_id, event_id, lease_until)
+                    )
+        conn.close()
+
+    def deliver_once(self) -> int:
+        """Send every due batch once; returns the number of events delivered"""
+        conn = sqlite3.connect(self.db_path)
+        subscribers = conn.execute(
+            '''
+            SELECT DISTINCT s.id, s.url, s.secret
+            FROM webhook_subscribers s JOIN webhook_deliveries d ON d.subscriber_id = s.id
+            WHERE s.active = 1 AND d.status IN ('pending', 'sending')
+            '''
+        ).fetchall()
+        conn.close()
+
+        delivered = 0
+        for subscriber_id, url, secret in subscribers:
+            # A failing subscriber stops after one failed batch; the others keep going
+            while True:
+                rows, lease_until = self.claim_batch(subscriber_id, time.time())
+                if not rows:
+                    break
+                error = self.post_batch(url, secret, rows)
+                self.record_result(subscriber_id, rows, lease_until, error)
+                if error:
+                    logger.warning(f"⚠️ Webhook {url}: {len(rows)} events not delivered ({error})")
+                    break
+                delivered += len(rows)
+                logger.info(f"📤 Webhook {url}: {len(rows)} events delivered")
+        return delivered
+
+    def run(self, stop_event: threading.Event, poll_interval: float = EVENT_POLL_INTERVAL):
+        """Deliver until stop_event is set; new events in this process wake the worker immediately"""
+        last_stats = time.time()
+        while not stop_event.is_set():
+            _wakeup.clear()
+            try:
+                delivered = self.deliver_once()
+            except Exception as e:
+                logger.error(f"❌ Webhook delivery error: {e}", exc_info=True)
+                delivered = 0
+            if time.time() - last_stats >= STATS_INTERVAL:
+                last_stats = time.time()
+                stats = delivery_stats(self.db_path)
+                if stats["delivered"] or stats["pending"]:
+                    logger.info(format_stats(stats))
+            if not delivered:
+                _wakeup.wait(poll_interval)
+
+
+def delivery_stats(db_path: str, window: int = 1000) -> dict:
+    """Queue depth, failures and lag percentiles (ms) over the last `window` deliveries"""
+    init_outbox_tables(db_path)
+    conn = sqlite3.connect(db_path)
+    pending, failed, oldest = conn.execute(
+        '''
+        SELECT COALESCE(SUM(d.status IN ('pending', 'sending')), 0), COALESCE(SUM(d.status = 'failed'), 0),
+               MIN(CASE WHEN d.status IN ('pending', 'sending') THEN e.created_ts END)
+        FROM webhook_deliveries d JOIN event_outbox e ON e.id = d.event_id
+        '''
+    ).fetchone()
+    lags = sorted(lag for (lag,) in conn.execute(
+        "SELECT lag_ms FROM webhook_deliveries WHERE status = 'delivered' ORDER BY delivered_ts DESC LIMIT ?",
+        (window,)
+    ))
+    conn.close()
+
+    def percentile(share):
+        return lags[min(len(lags) - 1, int(share * len(lags)))] if lags else None
+
+    return {
+        "pending": pending,
+        "failed": failed,
+        "oldest_pending_s": round(time.time() - oldest, 1) if oldest else None,
+        "delivered": len(lags),
+        "lag_p50_ms": percentile(0.5),
+        "lag_p95_ms": percentile(0.95),
+        "lag_max_ms": lags[-1] if lags else None,
+    }
+
+
+def format_stats(stats: dict) -> str:
+    """One-line summary of delivery_stats"""
+    line = f"📊 Webhooks: {stats['pending']} pending, {stats['failed']} failed"
+    if stats["oldest_pending_s"] is not None:
+        line += f" (oldest {stats['oldest_pending_s']}s)"
+    if stats["delivered"]:
+        line += (f" | lag over last {stats['delivered']}: p50 {stats['lag_p50_ms']} ms, "
+                 f"p95 {stats['lag_p95_ms']} ms, max {stats['lag_max_ms']} ms")
+    return line
+
+
+def start_worker(db_path: str) -> Optional[threading.Event]:
+    """Register EVENT_WEBHOOK_URL and run the worker in a daemon thread; returns its stop event"""
+    init_outbox_tables(db_path)
+    if EVENT_WEBHOOK_URL:
+        if not EVENT_WEBHOOK_SECRET:
+            logger.error("❌ EVENT_WEBHOOK_SECRET is not set, event webhooks disabled")
+            return None
+        add_subscriber(db_path, EVENT_WEBHOOK_URL, EVENT_WEBHOOK_SECRET)
+    conn = sqlite3.connect(db_path)
+    subscribers = conn.execute("SELECT COUNT(*) FROM webhook_subscribers WHERE active = 1").fetchone()[0]
+    conn.close()
+    if not subscribers:
+        return None
+
+    stop_event = threading.Event()
+    worker = WebhookDeliveryWorker(db_path)
+    threading.Thread(target=worker.run, args=(stop_event,), name="webhook-delivery", daemon=True).start()
+    logger.info(f"📤 Event webhook delivery started ({subscribers} subscribers)")
+    return stop_event
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+    db = 'image_analysis_results.db'
+    command = sys.argv[1] if len(sys.argv) > 1 else "deliver"
+    if command == "subscribe" and len(sys.argv) == 4:
+        print(f"✅ Subscriber #{add_subscriber(db, sys.argv[2], sys.argv[3])}: {sys.argv[2]}")
+    elif command == "stats":
+        print(format_stats(delivery_stats(db)))
+    elif command == "deliver":
+        stop = threading.Event()
+        try:
+            WebhookDeliveryWorker(db).run(stop)
+        except KeyboardInterrupt:
+            print("⏹️ Stopped")
+    else:
+        print("Usage: python event_outbox.py [deliver | stats | subscribe URL SECRET]")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tiling of tall screenshots for OCR.
+
+GPT-4o downsizes an image to fit 2048px and then to 768px on the short side,
+so a full-page profile capture loses most of its resolution. Splitting it into
+overlapping strips keeps text legible; the per-strip transcriptions are then
+merged by locating the lines both strips saw in the overlap.
+"""
+
+import re
+from difflib import SequenceMatcher
+from io import BytesIO
+from typing import List
+
+from PIL import Image
+
+# Height / width ratio above which an image is tiled
+TALL_RATIO = 2.0
+# Tile height as a multiple of image width (1.0 = square tiles, rendered at 768x768)
+TILE_ASPECT = 1.0
+# Fraction of a tile repeated in the next one
+TILE_OVERLAP = 0.15
+MAX_TILES = 8
+JPEG_QUALITY = 90
+
+# How many lines at the end/start of neighbouring tiles are searched for the overlap
+OVERLAP_SEARCH_LINES = 25
+# Consecutive matching lines that prove an overlap anywhere in the searched lines
+MIN_OVERLAP_LINES = 2
+# A single matching line only counts at the tile edges: within this many lines of the end of
+# the upper text and the start of the lower one (allowing for lines cut by the edge)...
+EDGE_SLACK_LINES = 2
+# ...and only if it is long enough to be unlikely to repeat ("Posts", "Follow" are not)
+MIN_SINGLE_LINE_CHARS = 12
+
+_MARKUP_RE = re.compile(r"[*_#`>|]+")
+_BULLET_RE = re.compile(r"^\s*(?:[-•·]|\d+[.)])\s+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def is_tall(width: int, height: int, ratio: float = TALL_RATIO) -> bool:
+    """True if the image is tall enough to be tiled"""
+    return width > 0 and height / width > ratio
+
+
+def tile_boxes(width: int, height: int, aspect: float = TILE_ASPECT,
+               overlap: float = TILE_OVERLAP, max_tiles: int = MAX_TILES) -> List[tuple]:
+    """Crop boxes (left, top, right, bottom) of overlapping horizontal strips"""
+    tile_height = max(1, int(width * aspect))
+    if tile_height >= height:
+        return [(0, 0, width, height)]
+
+    # Grow tiles until they fit the cap
+    while True:
+        step = max(1, int(tile_height * (1 - overlap)))
+        count = 1 + -(-(height - tile_height) // step)
+        if count <= max_tiles:
+            break
+        tile_height = int(tile_height * 1.25)
+
+    tops = [min(i * step, height - tile_height) for i in range(count)]
+    return [(0, top, width, top + tile_height) for top in tops]
+
+
+def split_into_tiles(image_bytes: bytes, **kwargs) -> List[bytes]:
+    """Split an image into overlapping strips, returned as JPEG bytes top to bottom"""
+    image = Image.open(BytesIO(image_bytes)).convert("RGB")
+    tiles = []
+    for box in tile_boxes(image.width, image.height, **kwargs):
+        buffer = BytesIO()
+        image.crop(box).save(buffer, format="JPEG", quality=JPEG_QUALITY)
+        tiles.append(buffer.getvalue())
+    return tiles
+
+
+def normalize_line(line: str) -> str:
+    """Line key used to match text seen by two tiles"""
+    line = _BULLET_RE.sub("", line)
+    line = _MARKUP_RE.sub("", line)
+    return _SPACE_RE.sub(" ", line).strip().lower()
+
+
+def merge_tile_texts(texts: List[str]) -> str:
+    """Merge per-tile transcriptions, dropping lines repeated in the overlaps"""
+    merged: List[str] = []
+    for text in texts:
+        lines = [line for line in (text or "").splitlines() if line.strip()]
+        if not merged:
+            merged = lines
+            continue
+        merged = _join_overlapping(merged, lines)
+    return "\n".join(merged)
+
+
+def _join_overlapping(upper: List[str], lower: List[str]) -> List[str]:
+    """Append lower to upper, cutting at the longest run of lines both contain"""
+    tail_start = max(0, len(upper) - OVERLAP_SEARCH_LINES)
+    tail = [normalize_line(line) for line in upper[tail_start:]]
+    head = [normalize_line(line) for line in lower[:OVERLAP_SEARCH_LINES]]
+
+    match = SequenceMatcher(None, tail, head, autojunk=False).find_longest_match(0, len(tail), 0, len(head))
+    if match.size < MIN_OVERLAP_LINES and not _edge_line_match(match, tail):
+        return upper + lower
+
+    # Upper tile wins inside the overlap; lines cut by the tile edge around it are dropped
+    cut_upper = tail_start + match.a + match.size
+    return upper[:cut_upper] + lower[match.b + match.size:]
+
+
+def _edge_line_match(match, tail: List[str]) -> bool:
+    """Whether a one-line match sits where the overlap must be: the end of the upper text, the start of the lower"""
+    if match.size != 1 or len(tail[match.a]) < MIN_SINGLE_LINE_CHARS:
+        return False
+    return len(tail) - (match.a + 1) <= EDGE_SLACK_LINES and match.b <= EDGE_SLACK_LINES
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Per-profile job history with validity periods.
+
+Each profile has at most one open row (valid_to IS NULL): its current job.
+A new snapshot is compared with that row only, found through a partial
+unique index, so detecting a change costs the same whatever the history
+size. A different job closes the open row and opens a new one in the same
+transaction.
+"""
+
+import sqlite3
+from datetime import datetime, timezone
+from typing import Optional
+
+import event_outbox
+from job_normalize import CLUSTER_THRESHOLD, normalize_company, normalize_position, trigrams
+
+
+def init_history_table(db_path: str):
+    """Create the job_history table and its indexes"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            profile_key TEXT NOT NULL,
+            company TEXT,
+            position TEXT,
+            period TEXT,
+            company_key TEXT NOT NULL,
+            position_key TEXT NOT NULL,
+            valid_from TIMESTAMP NOT NULL,
+            valid_to TIMESTAMP,
+            last_seen_at TIMESTAMP NOT NULL,
+            snapshots INTEGER NOT NULL DEFAULT 1,
+            opened_by TEXT
+        )
+    ''')
+    # One open version per profile; also the index behind the current-row lookup
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_job_history_current
+        ON job_history (profile_key) WHERE valid_to IS NULL
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_job_history_profile
+        ON job_history (profile_key, valid_from)
+    ''')
+    conn.commit()
+    conn.close()
+    event_outbox.init_outbox_tables(db_path)
+
+
+def similar_companies(first: str, second: str) -> bool:
+    """Same normalized company, allowing for OCR typos
+
+    Positions are compared exactly: "Founder, CEO" / "Founder, CTO" and "Senior" /
+    "Staff Software Engineer" are a trigram apart but a real change.
+    """
+    if first == second:
+        return True
+    if not first or not second:
+        return False
+    first_grams, second_grams = trigrams(first), trigrams(second)
+    return len(first_grams & second_grams) / len(first_grams | second_grams) >= CLUSTER_THRESHOLD
+
+
+def record_snapshot(db_path: str, profile_key: str, job_info: dict, observed_at: Optional[str] = None,
+                    source: Optional[str] = None) -> Optional[dict]:
+    """Apply one extraction to the profile's history; returns the change if the job changed
+
+    Snapshots without a found job, or older than the current version, leave the history as is.
+    """
+    if not job_info.get("found"):
+        return None
+    current_job = job_info.get("current_job") or {}
+    company, position = current_job.get("company"), current_job.get("position")
+    company_key, position_key = normalize_company(company), normalize_position(position)
+    # Same format and clock (UTC) as SQLite CURRENT_TIMESTAMP
+    observed_at = observed_at or datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        # Write lock up front: two snapshots of one profile can't both open a version
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            '''
+            SELECT id, company, position, company_key, position_key, valid_from
+            FROM job_history WHERE profile_key = ? AND valid_to IS NULL
+            ''',
+            (profile_key,)
+        ).fetchone()
+
+        if row is not None:
+            row_id, previous_company, previous_position, previous_company_key, previous_position_key, valid_from = row
+            if observed_at < valid_from:
+                conn.execute("COMMIT")
+                return None
+            if similar_companies(company_key, previous_company_key) and position_key == previous_position_key:
+                conn.execute(
+                    "UPDATE job_history SET last_seen_at = MAX(last_seen_at, ?), snapshots = snapshots + 1 WHERE id = ?",
+                    (observed_at, row_id)
+                )
+                conn.execute("COMMIT")
+                return None
+            conn.execute("UPDATE job_history SET valid_to = ? WHERE id = ?", (observed_at, row_id))
+
+        conn.execute(
+            '''
+            INSERT INTO job_history
+                (profile_key, company, position, period, company_key, position_key, valid_from, last_seen_at, opened_by)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''',
+            (profile_key, company, position, current_job.get("period"), company_key, position_key,
+             observed_at, observed_at, source)
+        )
+        change = None
+        if row is not None:
+            change = {
+                "profile_key": profile_key,
+                "changed_at": observed_at,
+                "previous": {"company": previous_company, "position": previous_position},
+                "current": {"company": company, "position": position},
+                "source": source,
+            }
+            # Queued in the same transaction: the change and its event exist together or not at all
+            event_outbox.emit_event(conn, event_outbox.EVENT_JOB_CHANGE, profile_key, change)
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    if change:
+        event_outbox.wake_worker()
+    return change
+
+
+def current_job(db_path: str, profile_key: str) -> Optional[dict]:
+    """Open history row of a profile"""
+    conn = sqlite3.connect(db_path)
+    row = conn.execute(
+        '''
+        SELECT company, position, period, valid_from, last_seen_at, snapshots
+        FROM job_history WHERE profile_key = ? AND valid_to IS NULL
+        ''',
+        (profile_key,)
+    ).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    company, position, period, valid_from, last_seen_at, snapshots = row
+    return {"company": company, "position": position, "period": period, "valid_from": valid_from,
+            "last_seen_at": last_seen_at, "snapshots": snapshots}
+
+
+def job_at(db_path: str, profile_key: str, moment: str) -> Optional[dict]:
+    """Job version of a profile valid at a moment"""
+    conn = sqlite3.connect(db_path)
+    row = conn.execute(
+        '''
+        SELECT company, position, period, valid_from, valid_to
+        FROM job_history
+        WHERE profile_key = ? AND valid_from <= ? AND (valid_to IS NULL OR valid_to > ?)
+        ORDER BY valid_from DESC LIMIT 1
+        ''',
+        (profile_key, moment, moment)
+    ).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    company, position, period, valid_from, valid_to = row
+    return {"company": company, "position": position, "period": period, "valid_from": valid_from, "valid_to": valid_to}
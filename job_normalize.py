@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Company and position normalization for job change detection.
+
+OCR and LLM output spell the same job many ways ("Ecoisme.", "ECOISME Inc",
+"Founder, CEO" / "CEO & Founder"). Values are first normalized (accents,
+punctuation, legal suffixes, aliases), then near-identical company keys are
+grouped by a trigram index so that OCR typos don't show up as job changes
+either. Positions are only grouped on equal keys: "CEO" / "CTO" or "PM" /
+"Senior PM" are a trigram apart and are real changes.
+"""
+
+import json
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+# Minimum trigram Jaccard similarity for two keys to be the same value
+CLUSTER_THRESHOLD = 0.6
+# Trigrams shared by more clusters than this are too common to narrow candidates
+MAX_POSTINGS = 200
+
+LEGAL_SUFFIXES = {
+    "inc", "incorporated", "llc", "ltd", "limited", "corp", "corporation", "co", "company",
+    "gmbh", "ag", "sa", "sas", "sarl", "srl", "spa", "bv", "nv", "plc", "llp", "lp",
+    "oy", "ab", "as", "kft", "sro", "pte", "pty", "tov", "ooo", "sp z o o", "group",
+}
+_LEGAL_SUFFIX_RE = re.compile(
+    r"(?:\s+(?:" + "|".join(sorted((re.escape(s) for s in LEGAL_SUFFIXES), key=len, reverse=True)) + r"))+$"
+)
+
+# Normalized spelling -> canonical key
+COMPANY_ALIASES: Dict[str, str] = {}
+POSITION_ALIASES: Dict[str, str] = {
+    "chief executive officer": "ceo",
+    "chief technology officer": "cto",
+    "chief financial officer": "cfo",
+    "chief operating officer": "coo",
+    "chief marketing officer": "cmo",
+    "chief product officer": "cpo",
+}
+# Word-level spellings in positions
+_POSITION_WORDS = {
+    "co": None, "cofounder": "founder", "sr": "senior", "jr": "junior", "mgr": "manager",
+    "dev": "developer", "eng": "engineer", "vp": "vice president", "hr": "human resources",
+}
+_POSITION_STOPWORDS = {"and", "of", "the", "at", "for", "in"}
+
+# Letter pairs OCR reads as one letter and back
+_OCR_CONFUSIONS = (("rn", "m"), ("vv", "w"), ("cl", "d"))
+
+_PUNCT_RE = re.compile(r"[^\w\s]+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def fold_text(value: str) -> str:
+    """Lowercase ASCII-folded text with punctuation turned into spaces"""
+    value = unicodedata.normalize("NFKD", value or "")
+    value = "".join(char for char in value if not unicodedata.combining(char)).lower()
+    value = value.replace("&", " and ").replace("'", "")
+    return _SPACE_RE.sub(" ", _PUNCT_RE.sub(" ", value)).strip()
+
+
+@lru_cache(maxsize=65536)
+def normalize_company(name: Optional[str]) -> str:
+    """Comparison key of a company name"""
+    key = fold_text(name)
+    # "Ecoisme Inc." and "Ecoisme" are one company; a bare "Group" stays a name
+    stripped = _LEGAL_SUFFIX_RE.sub("", key).strip()
+    key = stripped or key
+    return COMPANY_ALIASES.get(key, key)
+
+
+@lru_cache(maxsize=65536)
+def normalize_position(title: Optional[str]) -> str:
+    """Comparison key of a position: word order, separators and abbreviations ignored"""
+    key = fold_text(title).replace("co founder", "cofounder")
+    for full, short in POSITION_ALIASES.items():
+        key = re.sub(rf"\b{full}\b", short, key)
+    words = []
+    for word in key.split():
+        if word in _POSITION_STOPWORDS:
+            continue
+        replacement = _POSITION_WORDS.get(word, word)
+        if replacement:
+            words.extend(replacement.split())
+    # "Founder, CEO" == "CEO & Founder"
+    key = " ".join(sorted(set(words)))
+    return POSITION_ALIASES.get(key, key)
+
+
+def load_aliases(path: str):
+    """Merge {"companies": {...}, "positions": {...}} alias spellings from a JSON file"""
+    with open(path, encoding="utf-8") as f:
+        aliases = json.load(f)
+    COMPANY_ALIASES.update({fold_text(k): normalize_company(v) for k, v in aliases.get("companies", {}).items()})
+    POSITION_ALIASES.update({fold_text(k): normalize_position(v) for k, v in aliases.get("positions", {}).items()})
+    normalize_company.cache_clear()
+    normalize_position.cache_clear()
+
+
+def trigrams(key: str) -> set:
+    """Character trigrams of a key, padded so short words still have some"""
+    for confused, letter in _OCR_CONFUSIONS:
+        key = key.replace(confused, letter)
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramClusterer:
+    """Incremental clustering of normalized keys through an inverted trigram index
+
+    Exact keys are a dict lookup; a new key is compared only with the
+    clusters sharing its trigrams, so adding n values costs about O(n).
+    """
+
+    def __init__(self, threshold: float = CLUSTER_THRESHOLD):
+        self.threshold = threshold
+        self.key_cluster: Dict[str, int] = {}
+        # Representative trigram set per cluster
+        self.representatives: List[set] = []
+        self.postings: Dict[str, List[int]] = {}
+        self.labels: List[Counter] = []
+
+    def add(self, key: str, label: Optional[str] = None) -> int:
+        """Cluster id of the key; label is the original spelling, counted for display"""
+        cluster = self.key_cluster.get(key)
+        if cluster is None:
+            cluster = self._match(key)
+            self.key_cluster[key] = cluster
+        self.labels[cluster][label if label is not None else key] += 1
+        return cluster
+
+    def _match(self, key: str) -> int:
+        grams = trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            posting = self.postings.get(gram, ())
+            if len(posting) <= MAX_POSTINGS:
+                shared.update(posting)
+
+        best, best_score = None, self.threshold
+        for cluster, common in shared.most_common(10):
+            other = self.representatives[cluster]
+            score = common / (len(grams) + len(other) - common)
+            if score >= best_score:
+                best, best_score = cluster, score
+        if best is not None:
+            return best
+
+        cluster = len(self.representatives)
+        self.representatives.append(grams)
+        self.labels.append(Counter())
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(cluster)
+        return cluster
+
+    def label(self, cluster: int) -> str:
+        """Most common original spelling in the cluster"""
+        return self.labels[cluster].most_common(1)[0][0]
+
+
+def group_values(items, normalizer, threshold: float = CLUSTER_THRESHOLD, fuzzy: bool = True):
+    """[(analysis_id, raw value)] -> [(label, [analysis_ids])] of equal values, in first-seen order
+
+    With fuzzy, near-identical keys are one value; without, only equal normalized keys.
+    """
+    clusterer = TrigramClusterer(threshold if fuzzy else float("inf"))
+    groups: Dict[int, List] = {}
+    for analysis_id, value in items:
+        key = normalizer(value)
+        if not key:
+            continue
+        groups.setdefault(clusterer.add(key, value.strip()), []).append(analysis_id)
+    return [(clusterer.label(cluster), analysis_ids) for cluster, analysis_ids in groups.items()]
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Rule-based current job extraction from OCR text.
+
+Most profile transcriptions list the current job plainly in the Experience
+section ("Founder, CEO / Ecoisme / 2014 - Present"). This parser finds that
+section, splits it into entries and takes the first one whose period ends in
+"Present", with a confidence score; only texts it can't read confidently need
+the LLM.
+"""
+
+import re
+from typing import List, Optional
+
+# Confidence at or above which the LLM call is skipped
+MIN_CONFIDENCE = 0.8
+# Lines longer than this are descriptions, not titles or company names
+MAX_NAME_LENGTH = 60
+# An entry with more name-like lines than this is too tangled to read
+MAX_CANDIDATES = 2
+
+_MONTH = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+_DATE = rf"(?:{_MONTH}\s+)?(?:19|20)\d{{2}}"
+_RANGE_RE = re.compile(rf"(?P<start>{_DATE})\s*[-–—]+\s*(?P<end>present|current|now|{_DATE})", re.IGNORECASE)
+_CURRENT_END_RE = re.compile(r"^(?:present|current|now)$", re.IGNORECASE)
+
+_TITLE_RE = re.compile(
+    r"\b(?:co-?founder|founder|ceo|cto|cfo|coo|cmo|cpo|chief|head|director|manager|lead|leader|"
+    r"engineer|developer|programmer|architect|scientist|researcher|analyst|designer|"
+    r"advisor|adviser|consultant|administrator|president|vp|partner|owner|officer|"
+    r"specialist|coordinator|executive|associate|assistant|intern|member|board|"
+    r"teacher|professor|lecturer|recruiter|editor|volunteer|entrepreneur|mentor)\b",
+    re.IGNORECASE
+)
+# "CEO at Ecoisme", "Founder @ Marble"
+_INLINE_RE = re.compile(r"^(?P<position>.+?)\s+(?:at|@)\s+(?P<company>.+?)$", re.IGNORECASE)
+
+_SECTION_NAMES = {
+    "about", "activity", "analytics", "featured", "experience", "work experience", "education",
+    "licenses & certifications", "licenses and certifications", "certifications", "volunteering",
+    "volunteer experience", "skills", "recommendations", "honors & awards", "honors and awards",
+    "projects", "publications", "courses", "languages", "organizations", "interests", "causes",
+}
+_EXPERIENCE_NAMES = {"experience", "work experience"}
+
+_MARKUP_RE = re.compile(r"[*_#`]+")
+_BULLET_RE = re.compile(r"^\s*(?:[-•·]|\d+[.)])\s*")
+_ENTRY_START_RE = re.compile(r"^\s*\d+[.)]\s")
+_HEADER_EDGE_RE = re.compile(r"^[^\w]+|[^\w&]+$")
+_DURATION_RE = re.compile(r"^[\s•·|,\\]*(?:\d+\s*(?:yrs?|years?|mos?|months?)\s*)+$", re.IGNORECASE)
+_EMPLOYMENT_RE = re.compile(
+    r"^(?:full-time|part-time|self-employed|freelance|contract|internship|seasonal|remote|hybrid|on-site)$",
+    re.IGNORECASE
+)
+_EMPLOYMENT_SUFFIX_RE = re.compile(
+    r"\s*(?:[·|]\s*|\()(?:full-time|part-time|self-employed|freelance|contract|internship)\)?\s*$",
+    re.IGNORECASE
+)
+_PERIOD_TAIL_RE = re.compile(r"[\s(,·|\\-]+$")
+
+
+def clean_line(line: str) -> str:
+    """Line without markdown, list markers and trailing dots"""
+    line = _MARKUP_RE.sub("", line)
+    line = _BULLET_RE.sub("", line)
+    return line.strip().rstrip(".").strip()
+
+
+def section_name(line: str) -> Optional[str]:
+    """Lowercase section name if the line is a section header ("**Experience:**", "[Experience]")"""
+    name = _HEADER_EDGE_RE.sub("", clean_line(line).strip("[]")).lower()
+    return name if name in _SECTION_NAMES else None
+
+
+def experience_block(text: str) -> Optional[List[str]]:
+    """Raw lines of the first Experience section, or None if there is none"""
+    block = None
+    for line in text.splitlines():
+        name = section_name(line)
+        if block is None:
+            if name in _EXPERIENCE_NAMES:
+                block = []
+            continue
+        if name or line.strip() == "---":
+            break
+        block.append(line)
+    return block
+
+
+def split_entries(block: List[str]) -> List[List[str]]:
+    """Entries of the block: split on blank lines and numbered items, then after each period line"""
+    entries, current = [], []
+    for line in block:
+        if not line.strip() or _ENTRY_START_RE.match(line):
+            if current:
+                entries.append(current)
+            current = [line] if line.strip() else []
+        else:
+            current.append(line)
+    if current:
+        entries.append(current)
+
+    # Transcriptions without blank lines run several jobs together
+    split = []
+    for entry in entries:
+        if sum(1 for line in entry if _RANGE_RE.search(line)) < 2:
+            split.append(entry)
+            continue
+        current = []
+        for line in entry:
+            if current and _RANGE_RE.search(" ".join(current)) and not is_noise(clean_line(line)):
+                split.append(current)
+                current = []
+            current.append(line)
+        split.append(current)
+    return split
+
+
+def is_noise(line: str) -> bool:
+    """Durations, employment types and UI leftovers that name neither the job nor the company"""
+    return (
+        not line
+        or bool(_DURATION_RE.match(line))
+        or bool(_EMPLOYMENT_RE.match(line))
+        or line.lower().startswith(("see details", "add descr", "show all"))
+    )
+
+
+def parse_entry(entry: List[str]) -> Optional[dict]:
+    """Company, position and period of one entry with its confidence points, or None without a period"""
+    period_match = None
+    candidates = []
+    inline = None
+    for raw in entry:
+        line = clean_line(raw)
+        match = _RANGE_RE.search(line)
+        if match and period_match is None:
+            period_match = match
+            # "Co-Founder, CEO at Ecoisme (2012 - Present)"
+            line = _PERIOD_TAIL_RE.sub("", line[:match.start()]).strip()
+            inline_match = _INLINE_RE.match(line)
+            if inline_match and _TITLE_RE.search(inline_match.group("position")):
+                inline = inline_match
+                continue
+        elif match:
+            continue
+        line = _EMPLOYMENT_SUFFIX_RE.sub("", line).strip()
+        if is_noise(line) or len(line) > MAX_NAME_LENGTH or line.startswith(('"', '…', '...')):
+            continue
+        candidates.append(line)
+
+    if period_match is None:
+        return None
+
+    result = {
+        "period": period_match.group(0),
+        "is_current": bool(_CURRENT_END_RE.match(period_match.group("end"))),
+        "company": None,
+        "position": None,
+        "score": 0.0,
+    }
+    if inline:
+        # Other "X at Y" lines around it are jobs without a period
+        score = 0.5 if not candidates else 0.4
+        result.update(position=inline.group("position").strip(), company=inline.group("company").strip(), score=score)
+        return result
+    if len(candidates) > MAX_CANDIDATES:
+        return result
+
+    titles = [line for line in candidates if _TITLE_RE.search(line)]
+    others = [line for line in candidates if not _TITLE_RE.search(line)]
+    if len(titles) == 1:
+        result["position"] = titles[0]
+        result["score"] += 0.3
+        if len(others) == 1:
+            result["company"] = others[0]
+            result["score"] += 0.2
+    return result
+
+
+def extract_current_job(text: str) -> dict:
+    """Current job in the extract_current_job_via_openai format plus a confidence in [0, 1]"""
+    block = experience_block(text or "")
+    if block is None:
+        return {"found": False, "confidence": 0.0}
+
+    has_earlier_entries = False
+    for entry in split_entries(block):
+        parsed = parse_entry(entry)
+        if parsed is None or not parsed["is_current"]:
+            has_earlier_entries = has_earlier_entries or any(clean_line(line) for line in entry)
+            continue
+
+        # Experience section found and a running period: half the way there
+        confidence = 0.4 + parsed["score"]
+        # LinkedIn lists the current job first; anything above it makes the pick less certain
+        if not has_earlier_entries:
+            confidence += 0.1
+        return {
+            "found": bool(parsed["position"] and parsed["company"]),
+            "current_job": {
+                "company": parsed["company"],
+                "position": parsed["position"],
+                "period": parsed["period"],
+                "is_current": True
+            },
+            "confidence": round(min(confidence, 1.0), 2)
+        }
+
+    return {"found": False, "confidence": 0.0}
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Layout-aware cropping of LinkedIn screenshots before OCR.
+
+Finds the main profile column and its section cards with NumPy projection
+profiles and drops what carries no profile text: the page background between
+cards, side columns separated by a background gutter, and the sticky
+navigation/profile bars that a scrolling capture repeats down the page.
+Every vision tile removed is input tokens not paid for.
+
+Only card layouts are cropped: white cards on a flat page background, as
+LinkedIn draws them. Photos, documents and other screenshots are sent whole.
+
+Cards inside the main column are all kept, including the owner-only
+"Analytics", "Resources" and "Open to" cards: they look like any other card
+and only their header text tells them apart, which takes OCR. Analytics is
+also where profile_metrics reads profile views, post impressions and search
+appearances.
+"""
+
+import math
+import zlib
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# A pixel is "white" (card surface) above this level; the page background is darker
+WHITE_LEVEL = 250
+# Max spread of a background row/column
+FLAT_TOLERANCE = 6
+# Background columns needed to separate two columns, as a fraction of width
+MIN_GUTTER_FRACTION = 0.008
+# Background rows needed to separate two sections
+MIN_SECTION_GAP = 4
+MIN_SECTION_HEIGHT = 16
+# Sections needed to call the image a card layout (a single block has no cards to tell apart)
+MIN_CARDS = 2
+# Rows in a window used to spot repeated sticky bars
+REPEAT_WINDOW = 24
+# Mean absolute pixel difference for two rows to count as the same (JPEG noise)
+REPEAT_PIXEL_TOLERANCE = 3
+# Gap kept between stacked sections in the cropped image
+SECTION_SPACING = 12
+JPEG_QUALITY = 90
+
+
+def estimate_vision_tokens(width: int, height: int) -> int:
+    """GPT-4o high-detail image tokens: fit into 2048x2048, short side to 768, 170 per 512px tile + 85"""
+    if width <= 0 or height <= 0:
+        return 0
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def _runs(flags: np.ndarray) -> List[Tuple[int, int]]:
+    """(start, end) of consecutive True runs"""
+    padded = np.concatenate(([False], flags, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+def _background_mask(values: np.ndarray, axis: int, min_fraction: float) -> np.ndarray:
+    """Rows/columns that are mostly one flat, non-white colour (page background, not a card)"""
+    median = np.median(values, axis=axis)
+    close = np.abs(values.astype(np.int16) - np.expand_dims(median, axis).astype(np.int16)) <= FLAT_TOLERANCE
+    return (close.mean(axis=axis) >= min_fraction) & (median < WHITE_LEVEL)
+
+
+def find_main_column(gray: np.ndarray) -> Tuple[int, int]:
+    """Left/right bounds of the widest column between background gutters"""
+    height, width = gray.shape
+    # Columns are judged on their middle rows so headers spanning the page don't hide gutters
+    sample = gray[height // 10: height - height // 10 or height]
+    # Sticky bars crossing a gutter only cover a few rows of it
+    gutter = _background_mask(sample, axis=0, min_fraction=0.75)
+
+    min_gutter = max(2, int(width * MIN_GUTTER_FRACTION))
+    gutter_runs = [(start, end) for start, end in _runs(gutter) if end - start >= min_gutter]
+    # Margins touching the image edge are gutters whatever their width
+    gutter_runs += [(start, end) for start, end in _runs(gutter) if start == 0 or end == width]
+
+    content = np.ones(width, dtype=bool)
+    for start, end in gutter_runs:
+        content[start:end] = False
+    columns = _runs(content)
+    if not columns:
+        return 0, width
+    return max(columns, key=lambda run: run[1] - run[0])
+
+
+def find_sections(gray: np.ndarray, left: int, right: int) -> List[Tuple[int, int]]:
+    """Top/bottom bounds of cards in the column, split on background rows"""
+    column = gray[:, left:right]
+    gap = _background_mask(column, axis=1, min_fraction=0.98)
+
+    content = ~gap
+    # Short background runs inside a card (separator lines) don't split it
+    for start, end in _runs(gap):
+        if end - start < MIN_SECTION_GAP:
+            content[start:end] = True
+    return [(top, bottom) for top, bottom in _runs(content) if bottom - top >= MIN_SECTION_HEIGHT]
+
+
+def is_card_layout(gray: np.ndarray, left: int, right: int, sections: List[Tuple[int, int]]) -> bool:
+    """White cards split by page background, as in a LinkedIn profile; most sections must be card surface"""
+    if len(sections) < MIN_CARDS:
+        return False
+    cards = sum(np.median(gray[top:bottom, left:right]) >= WHITE_LEVEL for top, bottom in sections)
+    return bool(cards * 2 > len(sections))
+
+
+def find_repeated_bands(gray: np.ndarray, left: int, right: int) -> np.ndarray:
+    """Row mask of bands that already appeared higher up (sticky bars in stitched captures)"""
+    column = gray[:, left:right].astype(np.int16)
+    height, width = column.shape
+    repeated = np.zeros(height, dtype=bool)
+    if height < REPEAT_WINDOW * 2 or width < 64:
+        return repeated
+
+    # Coarse row signatures find candidate windows; pixel comparison confirms them
+    bins = width // 64
+    signatures = (column[:, :bins * 64].reshape(height, 64, bins).mean(axis=2) // 32).astype(np.uint8)
+    textured = signatures.max(axis=1) != signatures.min(axis=1)
+    row_hashes = [zlib.crc32(row.tobytes()) for row in signatures]
+
+    def rows_match(row: int, earlier: int) -> bool:
+        return np.abs(column[row] - column[earlier]).mean() <= REPEAT_PIXEL_TOLERANCE
+
+    seen = {}
+    for top in range(0, height - REPEAT_WINDOW + 1):
+        # Blank windows repeat everywhere and mean nothing
+        if repeated[top] or textured[top:top + REPEAT_WINDOW].sum() < REPEAT_WINDOW // 2:
+            continue
+        key = tuple(row_hashes[top:top + REPEAT_WINDOW])
+        first = seen.setdefault(key, top)
+        offset = top - first
+        if offset < REPEAT_WINDOW:
+            continue
+        if not all(rows_match(top + i, first + i) for i in range(REPEAT_WINDOW)):
+            continue
+
+        # Grow the band while rows keep matching at the same offset
+        start, end = top, top + REPEAT_WINDOW
+        while start - 1 - offset >= 0 and rows_match(start - 1, start - 1 - offset):
+            start -= 1
+        while end < height and rows_match(end, end - offset):
+            end += 1
+        repeated[start:end] = True
+    return repeated
+
+
+def crop_to_content(image_bytes: bytes, token_estimator=estimate_vision_tokens) -> Tuple[Optional[bytes], dict]:
+    """Main column sections stacked into a new image, plus a token report; (None, report) if nothing to drop
+
+    token_estimator(width, height) prices an image as it will be sent (e.g. tiled).
+    """
+    image = Image.open(BytesIO(image_bytes)).convert("RGB")
+    gray = np.asarray(image.convert("L"))
+    height, width = gray.shape
+
+    left, right = find_main_column(gray)
+    sections = find_sections(gray, left, right)
+    card_layout = is_card_layout(gray, left, right, sections)
+    repeated = find_repeated_bands(gray, left, right) if card_layout else np.zeros(height, dtype=bool)
+
+    # Cut repeated bands out of the sections they fall into
+    strips = []
+    for top, bottom in sections:
+        keep = ~repeated[top:bottom]
+        for start, end in _runs(keep):
+            if end - start >= MIN_SECTION_HEIGHT:
+                strips.append((top + start, top + end))
+
+    tokens_before = token_estimator(width, height)
+    report = {
+        "original_size": (width, height),
+        "column": (left, right),
+        "sections": len(sections),
+        "card_layout": card_layout,
+        "repeated_rows": int(repeated.sum()),
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_before,
+        "tokens_saved": 0,
+    }
+    if not card_layout or not strips:
+        return None, report
+
+    cropped_height = sum(bottom - top for top, bottom in strips) + SECTION_SPACING * (len(strips) - 1)
+    cropped_width = right - left
+    if cropped_width * cropped_height >= width * height * 0.95:
+        return None, report
+
+    cropped = Image.new("RGB", (cropped_width, cropped_height), (255, 255, 255))
+    y = 0
+    for top, bottom in strips:
+        cropped.paste(image.crop((left, top, right, bottom)), (0, y))
+        y += bottom - top + SECTION_SPACING
+
+    buffer = BytesIO()
+    cropped.save(buffer, format="JPEG", quality=JPEG_QUALITY)
+
+    tokens_after = token_estimator(cropped_width, cropped_height)
+    report.update({
+        "cropped_size": (cropped_width, cropped_height),
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+    })
+    return buffer.getvalue(), report
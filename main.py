@@ -1,18 +1,36 @@
 import asyncio
 import logging
+import signal
 import sys
+import time
 import os
-import base64
 import json
 from io import BytesIO, StringIO
 from PIL import Image
 import requests
-from telegram import Update
+from telegram import Message, Update
+from telegram.error import TelegramError
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from typing import Optional
 import sqlite3
 from datetime import datetime
 import csv
+from update_inbox import MediaGroupBuffer, UpdateInbox
+from pdf_pages import count_pages, iter_pdf_pages, pdf_support_available
+import activity_tracker
+import event_outbox
+import image_tiling
+import job_history
+import layout_regions
+import ocr_budget
+import ocr_consensus
+import ocr_quality
+import ocr_format
+import profile_identity
+import profile_metrics
+import snapshot_diff
+import structured_output
+import vision_payload
 
 # Logging configuration
 logging.basicConfig(
@@ -30,6 +48,91 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
 
+# Local Bot API server mode (self-hosted telegram-bot-api started with --local).
+# In this mode getFile returns an absolute path on the shared filesystem instead of a URL.
+TELEGRAM_LOCAL_MODE = os.getenv("TELEGRAM_LOCAL_MODE", "").lower() in ("1", "true", "yes")
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "")  # e.g. http://localhost:8081/bot
+TELEGRAM_FILE_BASE_URL = os.getenv("TELEGRAM_FILE_BASE_URL", "")  # e.g. http://localhost:8081/file/bot
+# Cloud Bot API only serves files up to 20 MB, a local server up to 2000 MB
+MAX_FILE_SIZE_MB = 2000 if TELEGRAM_LOCAL_MODE else 20
+
+# Update delivery: "polling" (default) or "webhook" with the embedded HTTP server.
+# Several webhook replicas can run behind one load balancer on the same WEBHOOK_URL.
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # public base URL, e.g. https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Bounded queue between the HTTP server and handlers: when full, the webhook request
+# waits, so Telegram backs off instead of the process buffering without limit
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "100"))
+# Album photos are held in flight until the whole album is processed, so keep this above
+# Telegram's 10-item media group limit
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))
+
+# Crash-safe polling: updates are stored in the inbox table before they are acknowledged,
+# the backlog left by a crash or deploy is replayed at INBOX_REPLAY_RATE updates/sec
+# (live updates are dispatched without delay),
+# and shutdown waits up to SHUTDOWN_DRAIN_TIMEOUT seconds for in-flight OCR
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "30"))
+INBOX_REPLAY_RATE = float(os.getenv("INBOX_REPLAY_RATE", "5"))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "60"))
+
+# Shared limit on simultaneous OpenAI OCR requests across all handlers
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", "4"))
+# Album photos arrive as separate updates; a media group is closed after this many
+# seconds without a new photo
+MEDIA_GROUP_WINDOW = float(os.getenv("MEDIA_GROUP_WINDOW", "1.5"))
+# Seconds a claimed album belongs to its process; an album left by a crash is processed again after it
+MEDIA_GROUP_LEASE = float(os.getenv("MEDIA_GROUP_LEASE", "600"))
+# Rendered PDF pages held in memory at once (rendering waits for OCR to free a slot)
+PDF_PAGE_WINDOW = int(os.getenv("PDF_PAGE_WINDOW", str(OCR_CONCURRENCY * 2)))
+MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", "50"))
+# Image files accepted as documents; other image types (SVG, HEIC, TIFF…) are declined with a hint
+DOCUMENT_IMAGE_TYPES = ("image/jpeg", "image/png", "image/webp")
+
+# Tall screenshots (full profile captures) are split into overlapping strips OCR'd concurrently
+TILING_ENABLED = os.getenv("TILING_ENABLED", "1").lower() in ("1", "true", "yes")
+TILE_TALL_RATIO = float(os.getenv("TILE_TALL_RATIO", str(image_tiling.TALL_RATIO)))
+TILE_ASPECT = float(os.getenv("TILE_ASPECT", str(image_tiling.TILE_ASPECT)))
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", str(image_tiling.TILE_OVERLAP)))
+
+# Crop profile screenshots to the main column before OCR (drops gutters, side columns,
+# repeated sticky bars); images without a card layout are sent whole. Savings are logged
+# per image and totalled in /status
+LAYOUT_CROP_ENABLED = os.getenv("LAYOUT_CROP_ENABLED", "1").lower() in ("1", "true", "yes")
+
+# max_tokens is predicted per image from size and ink density unless OCR_MAX_TOKENS is set;
+# responses cut off by the limit are continued up to OCR_MAX_CONTINUATIONS times
+OCR_MAX_TOKENS = int(os.getenv("OCR_MAX_TOKENS", "0"))
+OCR_MAX_CONTINUATIONS = int(os.getenv("OCR_MAX_CONTINUATIONS", "2"))
+
+# "verbose" (original prompt) or "compact" (bare lines + [Section] titles, rendered locally);
+# tokens and latency of every call are stored in ocr_call_metrics, compared by /ocrstats
+OCR_OUTPUT_MODE = os.getenv("OCR_OUTPUT_MODE", ocr_format.VERBOSE).lower()
+
+# One vision request returns both the text and the current job (json_schema structured
+# output) instead of OCR followed by a second job-analysis call
+OCR_COMBINED_JOB = os.getenv("OCR_COMBINED_JOB", "").lower() in ("1", "true", "yes")
+# Completion tokens added to the OCR budget for the JSON wrapper and job fields
+COMBINED_JOB_EXTRA_TOKENS = 200
+
+# Vision model for OCR; results the local quality score rejects (ocr_quality.py) are re-run
+# on OCR_ESCALATION_MODEL when set, otherwise on the same model
+OCR_MODEL = os.getenv("OCR_MODEL", "gpt-4o")
+OCR_ESCALATION_MODEL = os.getenv("OCR_ESCALATION_MODEL", "")
+
+OCR_PROMPT = "I am creating an audio version of this image for someone who cannot see it. Please extract and list all the text and numbers."
+TILE_OCR_PROMPT = (
+    "This is part {index} of {total} of a tall screenshot, cut into overlapping strips. "
+    "Transcribe all text and numbers in it line by line, top to bottom, exactly as shown. "
+    "Include partially visible lines at the edges. No introduction or commentary."
+)
+# Telegram message length limit is 4096 chars
+MESSAGE_CHUNK_SIZE = 4000
+
 logger.info("🤖 Initializing bot…")
 
 # Tokens validation
@@ -46,16 +149,59 @@ else:
     logger.info(f"✅ OpenAI token loaded (length: {len(OPENAI_API_KEY)} chars)")
     logger.info(f"🔗 OpenAI API URL: {OPENAI_API_URL}")
 
+if OCR_OUTPUT_MODE not in ocr_format.OUTPUT_MODES:
+    logger.error(f"❌ Unknown OCR_OUTPUT_MODE: {OCR_OUTPUT_MODE} (expected {' or '.join(ocr_format.OUTPUT_MODES)})")
+    sys.exit(1)
+
+if BOT_MODE not in ("polling", "webhook"):
+    logger.error(f"❌ Unknown BOT_MODE: {BOT_MODE} (expected polling or webhook)")
+    sys.exit(1)
+
+if BOT_MODE == "webhook":
+    if not WEBHOOK_URL:
+        logger.error("❌ WEBHOOK_URL is not set!")
+        sys.exit(1)
+    if not WEBHOOK_SECRET_TOKEN:
+        logger.error("❌ WEBHOOK_SECRET_TOKEN is not set!")
+        sys.exit(1)
+    logger.info(f"🌐 Webhook mode: {WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH} (listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT})")
+
+if TELEGRAM_LOCAL_MODE:
+    logger.info(f"🏠 Local Bot API mode: {TELEGRAM_API_BASE_URL or 'default base URL'} (max file size {MAX_FILE_SIZE_MB}MB)")
+
 class ImageAnalysisBot:
     def __init__(self):
         logger.info("🔧 Creating bot instance…")
         try:
             # Create application with standard Updater
-            self.application = Application.builder().token(TELEGRAM_TOKEN).build()
+            builder = (
+                Application.builder()
+                .token(TELEGRAM_TOKEN)
+                .post_init(self.close_media_groups_on_start)
+                .update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE))
+                .concurrent_updates(CONCURRENT_UPDATES)
+            )
+            if TELEGRAM_API_BASE_URL:
+                builder = builder.base_url(TELEGRAM_API_BASE_URL)
+            if TELEGRAM_FILE_BASE_URL:
+                builder = builder.base_file_url(TELEGRAM_FILE_BASE_URL)
+            if TELEGRAM_LOCAL_MODE:
+                builder = builder.local_mode(True)
+            self.application = builder.build()
             logger.info("✅ Telegram Application created")
             # Initialize DB for parsed results
             self.db_path = 'image_analysis_results.db'
             self.init_db()
+            self.inbox = UpdateInbox(self.db_path)
+            self.media_buffer = MediaGroupBuffer(self.db_path)
+            self.ocr_semaphore = asyncio.Semaphore(OCR_CONCURRENCY)
+            # (chat_id, media_group_id) -> timer that closes the album; the photos themselves are in SQLite
+            self.media_group_timers = {}
+            # Album jobs run outside any update; kept here so shutdown can drain them
+            self.album_tasks = set()
+            self.layout_stats = {"images": 0, "cropped": 0, "tokens_before": 0, "tokens_saved": 0}
+            # Stop event of the webhook delivery thread, None without subscribers
+            self.event_delivery = None
             self.setup_handlers()
             logger.info("✅ Handlers configured")
         except Exception as e:
@@ -72,9 +218,15 @@ class ImageAnalysisBot:
         self.application.add_handler(CommandHandler("status", self.status_command))
         self.application.add_handler(CommandHandler("results", self.results_command))
         self.application.add_handler(CommandHandler("export", self.export_command))
+        self.application.add_handler(CommandHandler("ocrstats", self.ocrstats_command))
         
         # Message handlers
         self.application.add_handler(MessageHandler(filters.PHOTO, self.handle_photo))
+        document_images = filters.Document.MimeType(DOCUMENT_IMAGE_TYPES[0])
+        for mime_type in DOCUMENT_IMAGE_TYPES[1:]:
+            document_images |= filters.Document.MimeType(mime_type)
+        self.application.add_handler(MessageHandler(document_images | filters.Document.PDF, self.handle_document))
+        self.application.add_handler(MessageHandler(filters.Document.IMAGE, self.handle_unsupported_document))
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_text))
         
         logger.info("✅ All handlers registered")
@@ -92,27 +244,120 @@ class ImageAnalysisBot:
                     parsed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ocr_call_metrics (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    output_mode TEXT NOT NULL,
+                    prompt_tokens INTEGER,
+                    completion_tokens INTEGER,
+                    latency_ms INTEGER,
+                    finish_reason TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            self.ensure_columns(cursor, 'file_parse_results', {
+                'media_group_id': 'TEXT',
+                'image_count': 'INTEGER DEFAULT 1',
+                'current_job_json': 'TEXT',
+                'ocr_passes': 'INTEGER',
+                'ocr_consistency': 'REAL',
+                'ocr_consensus_json': 'TEXT',
+                'ocr_quality': 'REAL',
+                'ocr_quality_json': 'TEXT',
+            })
+            self.ensure_columns(cursor, 'ocr_call_metrics', {'model': 'TEXT'})
             conn.commit()
             conn.close()
+            job_history.init_history_table(self.db_path)
+            profile_identity.init_identity_tables(self.db_path)
+            profile_metrics.init_metrics_tables(self.db_path)
+            snapshot_diff.init_snapshot_store(self.db_path)
+            activity_tracker.init_activity_tables(self.db_path)
+            # Texts saved before the chain became the source of truth are compacted once here
+            compacted = snapshot_diff.compact_sources(self.db_path)
+            if compacted:
+                logger.info(f"🗜️ Compacted {compacted} stored texts into the snapshot chain")
             logger.info("🗄️ Database ready (table file_parse_results)")
         except Exception as e:
             logger.error(f"❌ DB initialization error: {e}", exc_info=True)
 
-    def save_parse_result(self, file_name: str, full_text: str):
+    def ensure_columns(self, cursor, table: str, columns: dict):
+        """Add columns missing from an existing table (databases created by older versions)"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in cursor.fetchall()}
+        for name, column_type in columns.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+                logger.info(f"🗄️ Added column {table}.{name}")
+
+    def save_parse_result(self, file_name: str, full_text: str, media_group_id: Optional[str] = None, image_count: int = 1,
+                          job_info: Optional[dict] = None, ocr_report: Optional[dict] = None):
         """Save parsing result into DB"""
+        consensus = ocr_report["consensus"] if ocr_report else None
+        quality = ocr_report["quality"] if ocr_report else None
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             cursor.execute(
-                'INSERT INTO file_parse_results (file_name, full_text) VALUES (?, ?)',
-                (file_name, full_text)
+                '''
+                INSERT INTO file_parse_results
+                    (file_name, full_text, media_group_id, image_count, current_job_json,
+                     ocr_passes, ocr_consistency, ocr_consensus_json, ocr_quality, ocr_quality_json)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''',
+                (file_name, full_text, media_group_id, image_count,
+                 json.dumps(job_info, ensure_ascii=False) if job_info is not None else None,
+                 consensus["passes"] if consensus else None,
+                 consensus["consistency"] if consensus else None,
+                 json.dumps({"fields": consensus["fields"], "disputed": consensus["disputed"]}, ensure_ascii=False)
+                 if consensus else None,
+                 quality["score"] if quality else None,
+                 json.dumps(dict(quality, reruns=ocr_report["reruns"], model=ocr_report["model"]), ensure_ascii=False)
+                 if quality else None)
             )
+            row_id = cursor.lastrowid
             conn.commit()
             conn.close()
             logger.info("💾 Result saved to DB: %s", file_name)
+            
+            profile_id = profile_identity.resolve_profile(self.db_path, full_text, 'bot', row_id, image_file=file_name)
+            profile_key = f"profile:{profile_id}" if profile_id is not None else file_name
+            if profile_id is not None:
+                logger.info(f"👤 {file_name} → profile #{profile_id}")
+            delta = snapshot_diff.store_snapshot(self.db_path, profile_key, full_text, 'bot', row_id)
+            if delta and delta["sections"]:
+                logger.info(f"📝 {profile_key} changed in: {', '.join(delta['sections'])}")
+            new_posts = activity_tracker.track_posts(self.db_path, profile_key, full_text, 'bot', row_id)
+            if new_posts:
+                logger.info(f"🆕 {len(new_posts)} new posts for {profile_key}")
+            metrics = profile_metrics.record_metrics(self.db_path, profile_key, full_text, 'bot', row_id)
+            if metrics:
+                logger.info(f"🔢 Metrics for {profile_key}: " + ", ".join(f"{name}={value:,.0f}" for name, (value, _) in metrics.items()))
+            # Every reader has the text now; from here on it is rebuilt from the chain
+            snapshot_diff.compact_sources(self.db_path, 'bot', row_id)
+            if job_info:
+                change = job_history.record_snapshot(self.db_path, profile_key, job_info, source=f"bot:{file_name}")
+                if change:
+                    logger.info(
+                        f"🔄 Job change for {profile_key}: {change['previous']['position']} @ {change['previous']['company']} → "
+                        f"{change['current']['position']} @ {change['current']['company']}"
+                    )
         except Exception as e:
             logger.error(f"❌ DB save error: {e}", exc_info=True)
 
+    def save_call_metrics(self, output_mode: str, usage: dict, latency_ms: int, finish_reason: Optional[str], model: str = OCR_MODEL):
+        """Record tokens and latency of one OpenAI call"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute(
+                'INSERT INTO ocr_call_metrics (output_mode, prompt_tokens, completion_tokens, latency_ms, finish_reason, model) VALUES (?, ?, ?, ?, ?, ?)',
+                (output_mode, usage.get('prompt_tokens'), usage.get('completion_tokens'), latency_ms, finish_reason, model)
+            )
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"❌ Metrics save error: {e}", exc_info=True)
+
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """/start handler"""
         user = update.effective_user
@@ -145,13 +390,14 @@ class ImageAnalysisBot:
             "🆘 Usage Guide:\n\n"
             "📷 **Text extraction from images:**\n"
             "• Send any image with text\n"
+            "• Send it as a file for full resolution\n"
             "• Get all extracted text and numbers\n"
             "• Works with images containing text of any kind\n\n"
             "🔧 **Technical details:**\n"
             "• Model: OpenAI GPT-4o Vision\n"
             "• OCR: high-precision text extraction\n"
-            "• Max size: 20MB\n"
-            "• Supported formats: JPG, PNG, PDF\n\n"
+            f"• Max size: {MAX_FILE_SIZE_MB}MB\n"
+            f"• Supported formats: JPG, PNG, PDF (up to {MAX_PDF_PAGES} pages)\n\n"
             "❓ **Commands:**\n"
             "• /start — start\n"
             "• /help — this help\n"
@@ -181,6 +427,23 @@ class ImageAnalysisBot:
             "• Bot version: 4.1"
         )
         
+        if self.layout_stats["images"]:
+            stats = self.layout_stats
+            saved_pct = stats["tokens_saved"] / stats["tokens_before"] * 100 if stats["tokens_before"] else 0
+            status_message += (
+                "\n\n✂️ **Layout cropping (since start):**\n"
+                f"• Images: {stats['images']} ({stats['cropped']} cropped)\n"
+                f"• Vision tokens saved: {stats['tokens_saved']} ({saved_pct:.1f}%)"
+            )
+        
+        if self.event_delivery is not None:
+            stats = event_outbox.delivery_stats(self.db_path)
+            status_message += (
+                "\n\n📤 **Event webhooks:**\n"
+                f"• Pending: {stats['pending']}, failed: {stats['failed']}\n"
+                f"• Delivery lag p50/p95: {stats['lag_p50_ms']}/{stats['lag_p95_ms']} ms"
+            )
+        
         try:
             await update.message.reply_text(status_message)
             logger.info(f"✅ Status sent to user {user.id}")
@@ -197,7 +460,7 @@ class ImageAnalysisBot:
             cursor = conn.cursor()
             cursor.execute(
                 """
-                SELECT id, file_name, LENGTH(full_text) AS text_len, parsed_at
+                SELECT id, file_name, full_text, parsed_at
                 FROM file_parse_results
                 ORDER BY id DESC
                 LIMIT 5
@@ -211,8 +474,9 @@ class ImageAnalysisBot:
                 return
 
             lines = ["Latest results (max 5):\n"]
-            for rid, fname, tlen, ts in rows:
-                lines.append(f"#{rid} | {ts} | {fname} | {tlen} chars")
+            for rid, fname, text, ts in rows:
+                text = snapshot_diff.source_text(self.db_path, 'bot', rid, text) or ""
+                lines.append(f"#{rid} | {ts} | {fname} | {len(text)} chars")
 
             await update.message.reply_text("\n".join(lines))
             logger.info("✅ Results sent to user %s", user.id)
@@ -230,7 +494,7 @@ class ImageAnalysisBot:
             cursor = conn.cursor()
             cursor.execute(
                 """
-                SELECT parsed_at, file_name, full_text
+                SELECT id, parsed_at, file_name, full_text
                 FROM file_parse_results
                 ORDER BY id
                 """
@@ -246,8 +510,8 @@ class ImageAnalysisBot:
             csv_buffer = StringIO()
             writer = csv.writer(csv_buffer)
             writer.writerow(["parsed_at", "file_name", "full_text"])
-            for parsed_at, file_name, full_text in rows:
-                writer.writerow([parsed_at, file_name, full_text])
+            for row_id, parsed_at, file_name, full_text in rows:
+                writer.writerow([parsed_at, file_name, snapshot_diff.source_text(self.db_path, 'bot', row_id, full_text)])
 
             data = csv_buffer.getvalue().encode('utf-8')
             csv_bytes = BytesIO(data)
@@ -259,6 +523,53 @@ class ImageAnalysisBot:
             logger.error(f"❌ /export error: {e}", exc_info=True)
             await update.message.reply_text("❌ Export error. Please try again later.")
     
+    async def ocrstats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Compare completion tokens and latency of OCR output modes"""
+        user = update.effective_user
+        logger.info(f"📚 /ocrstats from {user.username} ({user.id})")
+
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT output_mode, COUNT(*), AVG(prompt_tokens), AVG(completion_tokens), AVG(latency_ms)
+                FROM ocr_call_metrics
+                GROUP BY output_mode
+                """
+            )
+            rows = cursor.fetchall()
+            conn.close()
+
+            if not rows:
+                await update.message.reply_text("No OCR calls recorded yet.")
+                return
+
+            stats = {mode: (calls, prompt, completion, latency) for mode, calls, prompt, completion, latency in rows}
+            lines = [f"OCR calls by output mode (current: {OCR_OUTPUT_MODE}):\n"]
+            for mode, (calls, prompt, completion, latency) in stats.items():
+                lines.append(f"{mode}: {calls} calls | avg in {prompt or 0:.0f} / out {completion or 0:.0f} tokens | {latency or 0:.0f} ms")
+
+            if ocr_format.COMPACT in stats:
+                _, _, compact_completion, compact_latency = stats[ocr_format.COMPACT]
+                if ocr_format.VERBOSE in stats:
+                    _, _, baseline_completion, baseline_latency = stats[ocr_format.VERBOSE]
+                    baseline_name = "verbose calls"
+                else:
+                    baseline_completion, baseline_latency = ocr_format.VERBOSE_BASELINE_COMPLETION_TOKENS, None
+                    baseline_name = "verbose test baseline"
+                lines.append("")
+                if baseline_completion:
+                    lines.append(f"Completion tokens vs {baseline_name}: {(1 - (compact_completion or 0) / baseline_completion) * 100:+.1f}% saved")
+                if baseline_latency:
+                    lines.append(f"Latency vs {baseline_name}: {(1 - (compact_latency or 0) / baseline_latency) * 100:+.1f}% saved")
+
+            await update.message.reply_text("\n".join(lines))
+            logger.info("✅ OCR stats sent to user %s", user.id)
+        except Exception as e:
+            logger.error(f"❌ /ocrstats error: {e}", exc_info=True)
+            await update.message.reply_text("❌ Database read error. Please try again later.")
+
     async def handle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle text messages"""
         user = update.effective_user
@@ -274,11 +585,26 @@ class ImageAnalysisBot:
         except Exception as e:
             logger.error(f"❌ Text response error: {e}")
     
+    async def handle_unsupported_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Decline image files the OCR pipeline can't read (SVG is not a raster, HEIC needs a codec)"""
+        document = update.message.document
+        logger.info(f"🚫 Unsupported image document: {document.file_name} ({document.mime_type})")
+        try:
+            await update.message.reply_text(
+                f"❌ {document.mime_type} files are not supported\n\n"
+                "📷 Please send the image as a photo, or as a JPEG, PNG or WebP file"
+            )
+        except Exception as e:
+            logger.error(f"❌ Failed to send unsupported file reply: {e}")
+    
     async def handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle images"""
         user = update.effective_user
         logger.info(f"📸 Image received from {user.username} ({user.id})")
         
+        if update.message.media_group_id and self.collect_media_group(update, context):
+            return
+        
         processing_message = None
         try:
             # Send processing message
@@ -312,7 +638,7 @@ class ImageAnalysisBot:
             logger.info("🤖 Sending request to OpenAI…")
             
             # Extract text
-            ocr_result = await self.extract_text_via_openai(image_bytes)
+            ocr_result, job_info, ocr_report = await self.ocr_image(image_bytes, with_job=OCR_COMBINED_JOB)
             
             if not ocr_result:
                 logger.error("❌ OpenAI could not extract text from image")
@@ -328,24 +654,15 @@ class ImageAnalysisBot:
             logger.info(f"✅ Text extracted, length: {len(ocr_result)} chars")
             
             # Имя файла для сохранения в БД
-            try:
-                file_name = os.path.basename(file.file_path) if file.file_path else f"{photo.file_id}.jpg"
-            except Exception:
-                file_name = f"{photo.file_id}.jpg"
-            
-            # Telegram message length limit handling (4096 chars)
-            if len(ocr_result) > 4000:
-                # Отправляем частями
-                await processing_message.edit_text(f"📋 **EXTRACTED TEXT (part 1):**\n{ocr_result[:4000]}")
-                await update.message.reply_text(f"📋 **EXTRACTED TEXT (part 2):**\n{ocr_result[4000:]}")
-            else:
-                # Отправляем одним сообщением
-                await processing_message.edit_text(f"📋 **EXTRACTED TEXT:**\n{ocr_result}")
+            file_name = self.file_name_for(file.file_path, photo.file_id)
             
+            await self.send_long_text(
+                processing_message, update.message, "EXTRACTED TEXT", self.display_text(ocr_result) + self.format_job(job_info)
+            )
             logger.info(f"📤 Text sent to user {user.id}")
 
             # Сохраняем результат в БД
-            self.save_parse_result(file_name=file_name, full_text=ocr_result)
+            self.save_parse_result(file_name=file_name, full_text=ocr_result, job_info=job_info, ocr_report=ocr_report)
                 
         except Exception as e:
             logger.error(f"💥 Critical error while processing image: {e}", exc_info=True)
@@ -357,18 +674,313 @@ class ImageAnalysisBot:
             except Exception as send_error:
                 logger.error(f"❌ Failed to send error message: {send_error}")
     
+    async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle image files and PDFs sent as documents (full resolution)"""
+        user = update.effective_user
+        document = update.message.document
+        logger.info(f"📄 Document received from {user.username} ({user.id}): {document.file_name} ({document.mime_type}, {document.file_size} bytes)")
+        
+        processing_message = None
+        try:
+            if document.file_size and document.file_size > MAX_FILE_SIZE_MB * 1024 * 1024:
+                await update.message.reply_text(f"❌ File is too large (max {MAX_FILE_SIZE_MB}MB)")
+                return
+            
+            is_pdf = document.mime_type == "application/pdf"
+            if is_pdf and not pdf_support_available():
+                logger.error("❌ pypdfium2 is not installed, PDF support disabled")
+                await update.message.reply_text("❌ PDF files are not supported on this server. Please send images.")
+                return
+            
+            processing_message = await update.message.reply_text("🔍 Analyzing document…")
+            
+            file = await context.bot.get_file(document.file_id)
+            logger.info(f"📂 Telegram file_path: {file.file_path}")
+            file_name = document.file_name or self.file_name_for(file.file_path, document.file_id)
+            
+            if is_pdf:
+                # A local Bot API server gives a path: pdfium reads pages lazily from disk
+                if TELEGRAM_LOCAL_MODE and os.path.isabs(file.file_path):
+                    source = file.file_path
+                else:
+                    source = await self.download_image(file.file_path)
+                    if not source:
+                        await processing_message.edit_text("❌ Error downloading document")
+                        return
+                
+                page_count = await asyncio.to_thread(count_pages, source)
+                if page_count > MAX_PDF_PAGES:
+                    await processing_message.edit_text(f"❌ PDF has {page_count} pages (max {MAX_PDF_PAGES})")
+                    return
+                
+                await processing_message.edit_text(f"🧠 Extracting text from {page_count} pages via OpenAI GPT-4o Vision…")
+                page_texts = await self.extract_pdf_text(source)
+                
+                if not any(page_texts):
+                    await processing_message.edit_text("❌ Failed to extract text from the PDF")
+                    return
+                
+                ocr_result = "\n\n".join(
+                    f"=== Page {index}/{page_count} ===\n{text or '❌ Text not extracted'}"
+                    for index, text in enumerate(page_texts, 1)
+                )
+                image_count = page_count
+                job_info = None
+                ocr_report = None
+            else:
+                image_bytes = await self.download_image(file.file_path)
+                if not image_bytes:
+                    await processing_message.edit_text("❌ Error downloading document")
+                    return
+                
+                await processing_message.edit_text("🧠 Extracting text via OpenAI GPT-4o Vision…")
+                ocr_result, job_info, ocr_report = await self.ocr_image(image_bytes, with_job=OCR_COMBINED_JOB)
+                
+                if not ocr_result:
+                    await processing_message.edit_text(
+                        "❌ Failed to extract text from image\n\n"
+                        "Please try again with a clearer image"
+                    )
+                    return
+                image_count = 1
+            
+            logger.info(f"✅ Text extracted, length: {len(ocr_result)} chars")
+            await self.send_long_text(
+                processing_message, update.message, "EXTRACTED TEXT", self.display_text(ocr_result) + self.format_job(job_info)
+            )
+            logger.info(f"📤 Text sent to user {user.id}")
+            
+            self.save_parse_result(file_name=file_name, full_text=ocr_result, image_count=image_count, job_info=job_info,
+                                   ocr_report=ocr_report)
+        
+        except Exception as e:
+            logger.error(f"💥 Critical error while processing document: {e}", exc_info=True)
+            try:
+                if processing_message:
+                    await processing_message.edit_text(f"❌ Processing error occurred:\n{str(e)[:200]}...")
+                else:
+                    await update.message.reply_text(f"❌ Processing error occurred:\n{str(e)[:200]}...")
+            except Exception as send_error:
+                logger.error(f"❌ Failed to send error message: {send_error}")
+    
+    async def extract_pdf_text(self, source) -> list:
+        """OCR PDF pages in parallel, rendering lazily; returns texts in page order"""
+        pages = iter_pdf_pages(source)
+        window = asyncio.Semaphore(PDF_PAGE_WINDOW)
+        texts = {}
+        tasks = []
+        
+        async def ocr_page(index: int, jpeg_bytes: bytes):
+            try:
+                texts[index] = await self.extract_text_via_openai(jpeg_bytes)
+            finally:
+                window.release()
+        
+        try:
+            while True:
+                # Render the next page only when a slot is free
+                await window.acquire()
+                page = await asyncio.to_thread(next, pages, None)
+                if page is None:
+                    window.release()
+                    break
+                index, jpeg_bytes = page
+                logger.info(f"📄 Page {index + 1} rendered, {len(jpeg_bytes)} bytes")
+                tasks.append(asyncio.create_task(ocr_page(index, jpeg_bytes)))
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            pages.close()
+        
+        return [texts.get(index) for index in range(len(tasks))]
+    
+    def collect_media_group(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+        """Buffer an album photo and return at once; False if its album was already processed"""
+        chat_id, media_group_id = update.effective_chat.id, update.message.media_group_id
+        if not self.media_buffer.add(chat_id, media_group_id, update.message.message_id, update.message.to_dict()):
+            logger.warning(f"⚠️ Album {media_group_id}: photo arrived after the album closed, processing it alone")
+            return False
+        logger.info(f"🗂️ Album {media_group_id}: photo {update.message.message_id} buffered")
+        
+        # Restart the window on every new photo; the album is closed by whichever process's timer fires last
+        key = (chat_id, media_group_id)
+        timer = self.media_group_timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        self.media_group_timers[key] = asyncio.get_running_loop().call_later(
+            MEDIA_GROUP_WINDOW, self.close_media_groups, context.bot, key
+        )
+        return True
+    
+    def close_media_groups(self, bot, key: Optional[tuple] = None):
+        """Claim every album whose window has passed (or whose lease ran out) and process each as one job"""
+        if key is not None:
+            self.media_group_timers.pop(key, None)
+        for chat_id, media_group_id, payloads in self.media_buffer.claim_closed(MEDIA_GROUP_WINDOW, MEDIA_GROUP_LEASE):
+            messages = [Message.de_json(payload, bot) for payload in payloads]
+            task = asyncio.create_task(self.process_media_group(chat_id, media_group_id, messages, bot))
+            self.album_tasks.add(task)
+            task.add_done_callback(self.album_tasks.discard)
+    
+    async def close_media_groups_on_start(self, application: Application):
+        """Albums left by a crash or a restart: process them once their lease or window has passed"""
+        pruned = self.media_buffer.prune()
+        if pruned:
+            logger.info(f"🗂️ Pruned {pruned} finished albums")
+        self.close_media_groups(application.bot)
+        # Albums still collecting when we went down get no new photo to set a timer; close them after the window
+        asyncio.get_running_loop().call_later(MEDIA_GROUP_WINDOW, self.close_media_groups, application.bot)
+    
+    async def process_media_group(self, chat_id: int, media_group_id: str, messages: list, bot):
+        """OCR all album photos concurrently and send one consolidated reply"""
+        messages = sorted(messages, key=lambda m: m.message_id)
+        first_message = messages[0]
+        total = len(messages)
+        logger.info(f"🗂️ Processing album {media_group_id} with {total} photos")
+        
+        processing_message = None
+        try:
+            processing_message = await first_message.reply_text(
+                f"🔍 Analyzing album ({total} images) via OpenAI GPT-4o Vision…"
+            )
+            
+            results = await asyncio.gather(
+                *(self.ocr_photo(message.photo[-1], bot) for message in messages)
+            )
+            
+            if not any(text for _, text, _, _ in results):
+                await processing_message.edit_text(
+                    "❌ Failed to extract text from the album images\n\n"
+                    "Please try again with clearer images"
+                )
+                return
+            
+            sections = []
+            for index, (file_name, text, _, _) in enumerate(results, 1):
+                sections.append(f"=== Image {index}/{total}: {file_name} ===\n{text or '❌ Text not extracted'}")
+            combined_text = "\n\n".join(sections)
+            job_info = self.first_found_job([job for _, _, job, _ in results])
+            
+            await self.send_long_text(
+                processing_message, first_message, f"EXTRACTED TEXT ({total} images)",
+                self.display_text(combined_text) + self.format_job(job_info)
+            )
+            logger.info(f"📤 Album {media_group_id} result sent")
+            
+            # One person's album is one snapshot; screenshots of different people are never merged into one
+            if profile_identity.distinct_people([text for _, text, _, _ in results if text]):
+                logger.warning(f"👥 Album {media_group_id} shows different people, saving each image separately")
+                for index, (file_name, text, image_job, report) in enumerate(results, 1):
+                    if text:
+                        self.save_parse_result(
+                            file_name=f"album_{media_group_id}_{index}",
+                            full_text=text,
+                            media_group_id=media_group_id,
+                            job_info=image_job,
+                            ocr_report=report
+                        )
+            else:
+                self.save_parse_result(
+                    file_name=f"album_{media_group_id}",
+                    full_text=combined_text,
+                    media_group_id=media_group_id,
+                    image_count=total,
+                    job_info=job_info,
+                    ocr_report=self.combine_ocr_reports([report for _, _, _, report in results])
+                )
+        except Exception as e:
+            logger.error(f"💥 Critical error while processing album: {e}", exc_info=True)
+            try:
+                if processing_message:
+                    await processing_message.edit_text(f"❌ Processing error occurred:\n{str(e)[:200]}...")
+                else:
+                    await first_message.reply_text(f"❌ Processing error occurred:\n{str(e)[:200]}...")
+            except Exception as send_error:
+                logger.error(f"❌ Failed to send error message: {send_error}")
+        finally:
+            # The user got a reply either way; a crash before this leaves the lease to expire and the album is retried
+            self.media_buffer.finish(chat_id, media_group_id)
+    
+    async def ocr_photo(self, photo, bot) -> tuple:
+        """Download one photo and extract its text; returns (file_name, text or None, job_info or None, OCR report or None)"""
+        file = await bot.get_file(photo.file_id)
+        file_name = self.file_name_for(file.file_path, photo.file_id)
+        
+        image_bytes = await self.download_image(file.file_path)
+        if not image_bytes:
+            logger.error(f"❌ Failed to download {file_name}")
+            return file_name, None, None, None
+        
+        text, job_info, ocr_report = await self.ocr_image(image_bytes, with_job=OCR_COMBINED_JOB)
+        return file_name, text, job_info, ocr_report
+    
+    def file_name_for(self, file_path: Optional[str], file_id: str) -> str:
+        """File name stored in DB"""
+        try:
+            return os.path.basename(file_path) if file_path else f"{file_id}.jpg"
+        except Exception:
+            return f"{file_id}.jpg"
+    
+    def first_found_job(self, job_infos: list) -> Optional[dict]:
+        """First job result that found a current job (images/tiles are in page order)"""
+        job_infos = [job for job in job_infos if job is not None]
+        if not job_infos:
+            return None
+        return next((job for job in job_infos if job.get("found")), job_infos[0])
+    
+    def format_job(self, job_info: Optional[dict]) -> str:
+        """Current job block appended to the reply in combined mode"""
+        if job_info is None:
+            return ""
+        if not job_info.get("found") or not job_info.get("current_job"):
+            return "\n\n💼 **CURRENT JOB:**\nNot detected"
+        current_job = job_info["current_job"]
+        return (
+            "\n\n💼 **CURRENT JOB:**\n"
+            f"🏢 Company: {current_job.get('company') or 'N/A'}\n"
+            f"👔 Position: {current_job.get('position') or 'N/A'}\n"
+            f"📅 Period: {current_job.get('period') or 'N/A'}"
+        )
+    
+    def display_text(self, text: str) -> str:
+        """Text as shown to the user (compact OCR output is rendered locally)"""
+        if OCR_OUTPUT_MODE == ocr_format.COMPACT:
+            return ocr_format.render_compact(text)
+        return text
+    
+    async def send_long_text(self, processing_message, message, title: str, text: str):
+        """Put the text into the processing message, continuing in replies past the length limit"""
+        chunks = [text[i:i + MESSAGE_CHUNK_SIZE] for i in range(0, len(text), MESSAGE_CHUNK_SIZE)] or [""]
+        
+        if len(chunks) == 1:
+            await processing_message.edit_text(f"📋 **{title}:**\n{text}")
+            return
+        
+        for index, chunk in enumerate(chunks, 1):
+            content = f"📋 **{title} (part {index}):**\n{chunk}"
+            if index == 1:
+                await processing_message.edit_text(content)
+            else:
+                await message.reply_text(content)
+    
     async def download_image(self, file_path: str) -> Optional[bytes]:
         """Download image by path"""
+        # Local Bot API server already stored the file on disk — no download hop
+        if TELEGRAM_LOCAL_MODE and os.path.isabs(file_path):
+            return await asyncio.to_thread(self.read_local_file, file_path)
+        
         # Формируем правильный URL
         if file_path.startswith('http'):
             url = file_path
         else:
-            url = f"https://api.telegram.org/file/bot{TELEGRAM_TOKEN}/{file_path}"
+            base_file_url = TELEGRAM_FILE_BASE_URL or "https://api.telegram.org/file/bot"
+            url = f"{base_file_url}{TELEGRAM_TOKEN}/{file_path}"
         
         logger.info(f"⬇️ Final download URL: {url}")
         
         try:
-            response = requests.get(url, timeout=30)
+            response = await asyncio.to_thread(requests.get, url, timeout=30)
             logger.info(f"📡 HTTP status: {response.status_code}")
             
             if response.status_code == 200:
@@ -382,97 +994,498 @@ class ImageAnalysisBot:
             logger.error(f"❌ Exception while downloading image: {e}", exc_info=True)
             return None
     
-    async def extract_text_via_openai(self, image_bytes: bytes) -> Optional[str]:
+    def read_local_file(self, file_path: str) -> Optional[bytes]:
+        """Read a file written by the local Bot API server (blocking; run it in a thread)"""
+        logger.info(f"📂 Reading local file: {file_path}")
+        
+        try:
+            file_size = os.path.getsize(file_path)
+            if file_size > MAX_FILE_SIZE_MB * 1024 * 1024:
+                logger.error(f"❌ File too large: {file_size} bytes (limit {MAX_FILE_SIZE_MB}MB)")
+                return None
+            
+            # Read whole rather than mmap'd: PIL/pypdfium2 decode every byte anyway, and cropping and
+            # tiling need the full resolution; vision_payload shrinks each request image before upload
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            
+            logger.info(f"✅ Local file read, size: {len(data)} bytes")
+            return data
+        except Exception as e:
+            logger.error(f"❌ Exception while reading local file: {e}", exc_info=True)
+            return None
+    
+    def estimate_image_tokens(self, width: int, height: int) -> int:
+        """Vision input tokens for an image as ocr_image would send it"""
+        if TILING_ENABLED and image_tiling.is_tall(width, height, TILE_TALL_RATIO):
+            boxes = image_tiling.tile_boxes(width, height, aspect=TILE_ASPECT, overlap=TILE_OVERLAP)
+            return sum(layout_regions.estimate_vision_tokens(right - left, bottom - top) for left, top, right, bottom in boxes)
+        return layout_regions.estimate_vision_tokens(width, height)
+    
+    async def crop_layout(self, image_bytes: bytes) -> bytes:
+        """Drop UI chrome around the main profile column, reporting vision token savings"""
+        try:
+            cropped, report = await asyncio.to_thread(
+                layout_regions.crop_to_content, image_bytes, self.estimate_image_tokens
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Layout detection failed, sending image as is: {e}")
+            return image_bytes
+        
+        self.layout_stats["images"] += 1
+        self.layout_stats["tokens_before"] += report["tokens_before"]
+        if cropped is None:
+            if report["card_layout"]:
+                logger.info(f"✂️ Layout: nothing to crop ({report['sections']} sections)")
+            else:
+                logger.info("✂️ Layout: not a profile card layout, sending image whole")
+            return image_bytes
+        
+        self.layout_stats["cropped"] += 1
+        self.layout_stats["tokens_saved"] += report["tokens_saved"]
+        logger.info(
+            f"✂️ Layout: {report['original_size']} → {report['cropped_size']}, {report['sections']} sections, "
+            f"{report['repeated_rows']} repeated rows dropped, vision tokens {report['tokens_before']} → "
+            f"{report['tokens_after']} (saved {report['tokens_saved']})"
+        )
+        return cropped
+    
+    async def ocr_image(self, image_bytes: bytes, with_job: bool = False) -> tuple:
+        """Extract text (and current job if with_job) from an image, cropping UI chrome and tiling tall screenshots
+
+        With OCR_CONSENSUS_PASSES > 1 the passes run concurrently and are merged by vote. The result is
+        scored locally and re-run (on OCR_ESCALATION_MODEL if set) only when the score is below OCR_QUALITY_MIN.
+        Returns (text or None, job_info or None, report or None); the report holds the quality score,
+        re-runs, model and consensus report.
+        """
+        if LAYOUT_CROP_ENABLED:
+            image_bytes = await self.crop_layout(image_bytes)
+        
+        text, job_info, consensus = await self.ocr_passes(image_bytes, with_job)
+        if not text:
+            return None, None, None
+        
+        model = OCR_MODEL
+        quality = await asyncio.to_thread(ocr_quality.assess, self.db_path, text)
+        reruns = 0
+        while ocr_quality.needs_rerun(quality, reruns):
+            reruns += 1
+            rerun_model = OCR_ESCALATION_MODEL or OCR_MODEL
+            logger.warning(f"🩺 OCR quality {ocr_quality.format_quality(quality)}, re-running on {rerun_model}")
+            rerun_text, rerun_job = await self.ocr_pass(image_bytes, with_job, rerun_model)
+            if not rerun_text:
+                continue
+            rerun_quality = await asyncio.to_thread(ocr_quality.assess, self.db_path, rerun_text)
+            logger.info(f"🩺 Re-run quality {ocr_quality.format_quality(rerun_quality)}")
+            if rerun_quality["score"] > quality["score"]:
+                text, job_info, quality, model, consensus = rerun_text, rerun_job, rerun_quality, rerun_model, None
+        if not reruns:
+            logger.info(f"🩺 OCR quality {ocr_quality.format_quality(quality)}")
+        return text, job_info, {"quality": quality, "reruns": reruns, "model": model, "consensus": consensus}
+    
+    async def ocr_passes(self, image_bytes: bytes, with_job: bool) -> tuple:
+        """One pass, or OCR_CONSENSUS_PASSES merged by vote; returns (text or None, job_info or None, consensus report or None)"""
+        if ocr_consensus.OCR_CONSENSUS_PASSES <= 1:
+            text, job_info = await self.ocr_pass(image_bytes, with_job)
+            return text, job_info, None
+        
+        results = list(await asyncio.gather(*(
+            self.ocr_pass(image_bytes, with_job) for _ in range(ocr_consensus.OCR_CONSENSUS_PASSES)
+        )))
+        while True:
+            succeeded = [(text, job_info) for text, job_info in results if text]
+            if not succeeded:
+                return None, None, None
+            report = ocr_consensus.merge_passes([text for text, _ in succeeded], [job_info for _, job_info in succeeded])
+            # Weak agreement buys one more pass, not a resend of the whole image by the user
+            if not ocr_consensus.needs_more_passes(report["consistency"], len(results)):
+                break
+            logger.info(f"🗳️ Consistency {report['consistency']:.2f} after {len(results)} passes, running another")
+            results.append(await self.ocr_pass(image_bytes, with_job))
+        
+        logger.info(f"🗳️ Consensus: {ocr_consensus.format_report(report)}")
+        return report["text"], report["job_info"], report
+    
+    def combine_ocr_reports(self, reports: list) -> Optional[dict]:
+        """Report of an album: the weakest image sets quality and consistency"""
+        reports = [report for report in reports if report]
+        if not reports:
+            return None
+        weakest = min(reports, key=lambda report: report["quality"]["score"])
+        return {
+            "quality": weakest["quality"],
+            "reruns": sum(report["reruns"] for report in reports),
+            "model": weakest["model"],
+            "consensus": ocr_consensus.combine_reports([report["consensus"] for report in reports]),
+        }
+    
+    async def ocr_pass(self, image_bytes: bytes, with_job: bool, model: str = OCR_MODEL) -> tuple:
+        """One OCR pass over an already cropped image; returns (text or None, job_info or None)"""
+        if not TILING_ENABLED:
+            return await self.transcribe(image_bytes, None, with_job, model)
+        
+        try:
+            with Image.open(BytesIO(image_bytes)) as image:
+                width, height = image.size
+        except Exception as e:
+            logger.warning(f"⚠️ Can't read image size, sending as is: {e}")
+            return await self.transcribe(image_bytes, None, with_job, model)
+        
+        if not image_tiling.is_tall(width, height, TILE_TALL_RATIO):
+            return await self.transcribe(image_bytes, None, with_job, model)
+        
+        tiles = await asyncio.to_thread(
+            image_tiling.split_into_tiles, image_bytes, aspect=TILE_ASPECT, overlap=TILE_OVERLAP
+        )
+        logger.info(f"🧩 Tall image {width}x{height} split into {len(tiles)} tiles")
+        
+        tile_prompt = ocr_format.COMPACT_TILE_OCR_PROMPT if OCR_OUTPUT_MODE == ocr_format.COMPACT else TILE_OCR_PROMPT
+        
+        results = await asyncio.gather(*(
+            self.transcribe(tile, tile_prompt.format(index=index, total=len(tiles)), with_job, model)
+            for index, tile in enumerate(tiles, 1)
+        ))
+        texts = [text for text, _ in results]
+        
+        if not any(texts):
+            return None, None
+        if not all(texts):
+            logger.warning(f"⚠️ {texts.count(None)} of {len(tiles)} tiles failed, merging the rest")
+        
+        merged = image_tiling.merge_tile_texts(texts)
+        logger.info(f"🧩 Tiles merged: {sum(len(t or '') for t in texts)} → {len(merged)} chars")
+        # Experience is listed once; the first tile that sees a current job has the latest one
+        return merged, self.first_found_job([job for _, job in results])
+    
+    async def transcribe(self, image_bytes: bytes, prompt: Optional[str], with_job: bool, model: str = OCR_MODEL) -> tuple:
+        """One image or tile: (text, job_info)"""
+        if with_job:
+            text, job_info = await self.extract_text_and_job_via_openai(image_bytes, prompt, model)
+            if text is not None:
+                return text, job_info
+            logger.warning("⚠️ Combined OCR + job request failed, falling back to plain OCR")
+        return await self.extract_text_via_openai(image_bytes, prompt, model), None
+    
+    async def extract_text_and_job_via_openai(self, image_bytes: bytes, prompt: Optional[str] = None,
+                                              model: str = OCR_MODEL) -> tuple:
+        """Text and current job in one vision request with a JSON schema response format"""
+        if prompt is None:
+            prompt = ocr_format.COMPACT_OCR_PROMPT if OCR_OUTPUT_MODE == ocr_format.COMPACT else OCR_PROMPT
+        prompt = (
+            f"{prompt}\n\n"
+            "Put the complete transcription into full_text. "
+            f"{structured_output.CURRENT_JOB_INSTRUCTIONS}"
+        )
+        
+        try:
+            image_url = await asyncio.to_thread(vision_payload.to_data_url, image_bytes)
+            max_tokens = (OCR_MAX_TOKENS or await asyncio.to_thread(ocr_budget.predict_max_tokens, image_bytes)) + COMBINED_JOB_EXTRA_TOKENS
+            messages = [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {"type": "image_url", "image_url": {"url": image_url}}
+                    ]
+                }
+            ]
+            
+            response_format = structured_output.response_format("ocr_with_current_job", structured_output.OCR_WITH_JOB_SCHEMA)
+            raw = ""
+            for attempt in range(OCR_MAX_CONTINUATIONS + 1):
+                content, finish_reason = await self.post_vision_request(
+                    messages,
+                    max_tokens,
+                    # A schema would make a continuation start a new object; it has to extend the cut-off one
+                    response_format=None if raw else response_format,
+                    output_mode=f"{OCR_OUTPUT_MODE}+job",
+                    model=model
+                )
+                if content is None:
+                    if not raw:
+                        return None, None
+                    # A failed continuation still leaves the JSON received so far
+                    break
+                
+                raw = ocr_budget.stitch_continuation(raw, content) if raw else content
+                if finish_reason != "length":
+                    break
+                
+                if attempt == OCR_MAX_CONTINUATIONS:
+                    logger.warning(f"⚠️ Combined response still truncated after {OCR_MAX_CONTINUATIONS} continuations")
+                    break
+                logger.info(f"✂️ Combined response truncated at {max_tokens} tokens, requesting continuation #{attempt + 1}")
+                messages = messages + [
+                    {"role": "assistant", "content": content},
+                    {"role": "user", "content": ocr_budget.CONTINUE_PROMPT}
+                ]
+            
+            # Tolerant parsing also reads a JSON object that is still cut off
+            data = structured_output.parse_tolerant(raw)
+            if not isinstance(data, dict) or "full_text" not in data:
+                logger.warning("⚠️ Combined response is not the expected JSON")
+                return None, None
+            # Cut off before the job fields: the text is usable, the job is left to the rules / job prompt
+            job_info = {"found": bool(data.get("found")), "current_job": data.get("current_job")} if "found" in data else None
+            text = (data.get("full_text") or "").strip()
+            logger.info(f"✅ Text extracted, length: {len(text)} chars, current job found: {job_info and job_info['found']}")
+            return text or None, job_info
+        
+        except Exception as e:
+            logger.error(f"💥 Combined extraction error: {e}", exc_info=True)
+            return None, None
+    
+    async def extract_text_via_openai(self, image_bytes: bytes, prompt: Optional[str] = None,
+                                      model: str = OCR_MODEL) -> Optional[str]:
         """Extract text from image via OpenAI GPT-4o Vision"""
         logger.info(f"🤖 Starting text extraction via OpenAI, image size: {len(image_bytes)} bytes")
+        if prompt is None:
+            prompt = ocr_format.COMPACT_OCR_PROMPT if OCR_OUTPUT_MODE == ocr_format.COMPACT else OCR_PROMPT
         
         try:
-            # Encode image to base64
-            img_b64 = base64.b64encode(image_bytes).decode('utf-8')
-            logger.info(f"🖼️ Image encoded to base64, length: {len(img_b64)} chars")
-            
-            # Prompt
-            prompt = "I am creating an audio version of this image for someone who cannot see it. Please extract and list all the text and numbers."
-            
-            # Headers
-            headers = {
-                "Authorization": f"Bearer {OPENAI_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            # Payload
-            payload = {
-                "model": "gpt-4o",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{img_b64}"
-                                }
+            # Downscaled/re-encoded to JPEG only if it exceeds the API limits or isn't a format the API reads
+            image_url = await asyncio.to_thread(vision_payload.to_data_url, image_bytes)
+            logger.info(f"🖼️ Image encoded to base64, length: {len(image_url)} chars")
+            
+            max_tokens = OCR_MAX_TOKENS or await asyncio.to_thread(ocr_budget.predict_max_tokens, image_bytes)
+            logger.info(f"🎯 max_tokens: {max_tokens}")
+            
+            messages = [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": prompt
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": image_url
                             }
-                        ]
-                    }
-                ],
-                "max_tokens": 1000,
-                "temperature": 0.1
-            }
+                        }
+                    ]
+                }
+            ]
             
             logger.info(f"💬 Prompt: {prompt}")
-            logger.info("🚀 Sending POST request to OpenAI…")
+            text = ""
+            for attempt in range(OCR_MAX_CONTINUATIONS + 1):
+                content, finish_reason = await self.post_vision_request(messages, max_tokens, model=model)
+                if content is None:
+                    # A failed continuation still leaves the text received so far
+                    return text.strip() or None
+                
+                text = ocr_budget.stitch_continuation(text, content) if text else content
+                if finish_reason != "length":
+                    break
+                
+                if attempt == OCR_MAX_CONTINUATIONS:
+                    logger.warning(f"⚠️ Still truncated after {OCR_MAX_CONTINUATIONS} continuations")
+                    break
+                logger.info(f"✂️ Response truncated at {max_tokens} tokens, requesting continuation #{attempt + 1}")
+                messages = messages + [
+                    {"role": "assistant", "content": content},
+                    {"role": "user", "content": ocr_budget.CONTINUE_PROMPT}
+                ]
             
-            response = requests.post(
+            text = text.strip()
+            logger.info(f"✅ Text extracted, length: {len(text)} chars")
+            logger.info(f"📝 First 100 chars: {text[:100]}...")
+            return text
+                
+        except Exception as e:
+            logger.error(f"💥 Text extraction error: {e}", exc_info=True)
+            return None
+    
+    async def post_vision_request(self, messages: list, max_tokens: int, response_format: Optional[dict] = None,
+                                  output_mode: str = OCR_OUTPUT_MODE, model: str = OCR_MODEL) -> tuple:
+        """One chat completion call; returns (content, finish_reason) or (None, None) on error"""
+        # Headers
+        headers = {
+            "Authorization": f"Bearer {OPENAI_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        
+        # Payload
+        payload = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": 0.1
+        }
+        if response_format:
+            payload["response_format"] = response_format
+        
+        logger.info("🚀 Sending POST request to OpenAI…")
+        
+        # Shared limit across single photos and album/document pages
+        async with self.ocr_semaphore:
+            started = time.monotonic()
+            response = await asyncio.to_thread(
+                requests.post,
                 OPENAI_API_URL,
                 headers=headers,
                 json=payload,
                 timeout=60
             )
+            latency_ms = int((time.monotonic() - started) * 1000)
+        
+        logger.info(f"📡 HTTP status: {response.status_code} ({latency_ms} ms)")
+        
+        if response.status_code != 200:
+            logger.error(f"❌ OpenAI API error: {response.status_code}")
+            logger.error(f"📄 Error text: {response.text[:500]}")
+            return None, None
+        
+        result = response.json()
+        logger.info("✅ Successful response from OpenAI")
+        
+        if 'choices' not in result or len(result['choices']) == 0:
+            logger.error("❌ Unexpected OpenAI response format")
+            return None, None
+        
+        choice = result['choices'][0]
+        usage = result.get('usage', {})
+        logger.info(
+            f"🔢 Tokens: in={usage.get('prompt_tokens')}, out={usage.get('completion_tokens')}, "
+            f"finish_reason={choice.get('finish_reason')}"
+        )
+        self.save_call_metrics(output_mode, usage, latency_ms, choice.get('finish_reason'), model)
+        return choice['message']['content'] or "", choice.get('finish_reason')
+    
+    async def run_inbox_polling(self):
+        """Poll updates through the persistent inbox and drain in-flight work on shutdown"""
+        bot = self.application.bot
+        stop_event = asyncio.Event()
+        new_updates = asyncio.Event()
+        in_flight = set()
+        
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+        
+        recovered = self.inbox.recover()
+        pruned = self.inbox.prune()
+        # Only the startup backlog is replayed slowly; it has the lowest update ids, so it is dispatched first
+        backlog = self.inbox.pending_count()
+        logger.info(f"📥 Inbox: {backlog} pending updates ({recovered} recovered after crash, {pruned} pruned)")
+        
+        async def fetch_updates():
+            offset = self.inbox.get_offset()
+            while not stop_event.is_set():
+                try:
+                    updates = await bot.get_updates(
+                        offset=offset,
+                        timeout=POLLING_TIMEOUT,
+                        allowed_updates=Update.ALL_TYPES
+                    )
+                except TelegramError as e:
+                    logger.error(f"❌ getUpdates error: {e}")
+                    await asyncio.sleep(5)
+                    continue
+                if updates:
+                    # Persist before the next getUpdates call acknowledges them
+                    offset = self.inbox.record([u.to_dict() for u in updates])
+                    logger.info(f"📥 {len(updates)} updates stored in inbox, next offset {offset}")
+                    new_updates.set()
+        
+        async def process(update_id: int, payload: dict):
+            try:
+                await self.application.process_update(Update.de_json(payload, bot))
+                self.inbox.mark_done(update_id)
+            except Exception as e:
+                logger.error(f"❌ Update {update_id} failed: {e}", exc_info=True)
+                self.inbox.mark_failed(update_id, str(e)[:500])
+        
+        async def dispatch_updates():
+            slots = asyncio.Semaphore(CONCURRENT_UPDATES)
+            interval = 1.0 / INBOX_REPLAY_RATE if INBOX_REPLAY_RATE > 0 else 0
+            replaying = backlog
+            while not stop_event.is_set():
+                new_updates.clear()
+                batch = self.inbox.fetch_pending(limit=CONCURRENT_UPDATES)
+                if not batch:
+                    try:
+                        await asyncio.wait_for(new_updates.wait(), timeout=1)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                for update_id, payload in batch:
+                    await slots.acquire()
+                    task = asyncio.create_task(process(update_id, payload))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+                    task.add_done_callback(lambda _: slots.release())
+                    if replaying > 0:
+                        replaying -= 1
+                        if interval:
+                            await asyncio.sleep(interval)
+                        if not replaying:
+                            logger.info("✅ Inbox backlog replayed, dispatching live updates")
+        
+        async with self.application:
+            # run_polling/run_webhook call post_init; the hand-rolled loop has to do it itself
+            await self.close_media_groups_on_start(self.application)
+            await self.application.start()
+            # getUpdates is refused while a webhook is set; keep whatever is queued
+            await bot.delete_webhook(drop_pending_updates=False)
             
-            logger.info(f"📡 HTTP status: {response.status_code}")
+            fetcher = asyncio.create_task(fetch_updates())
+            dispatcher = asyncio.create_task(dispatch_updates())
+            logger.info("✅ Inbox polling started")
             
-            if response.status_code == 200:
-                result = response.json()
-                logger.info("✅ Successful response from OpenAI")
-                
-                if 'choices' in result and len(result['choices']) > 0:
-                    content = result['choices'][0]['message']['content'].strip()
-                    logger.info(f"✅ Text extracted, length: {len(content)} chars")
-                    logger.info(f"📝 First 100 chars: {content[:100]}...")
-                    return content
-                else:
-                    logger.error("❌ Unexpected OpenAI response format")
-                    return None
-            else:
-                logger.error(f"❌ OpenAI API error: {response.status_code}")
-                logger.error(f"📄 Error text: {response.text[:500]}")
-                return None
-                
-        except Exception as e:
-            logger.error(f"💥 Text extraction error: {e}", exc_info=True)
-            return None
-    
-
+            await stop_event.wait()
+            logger.info("⏹️ Stop requested, draining in-flight updates…")
+            # Nothing unacknowledged is lost by cancelling: the offset only moves after record()
+            fetcher.cancel()
+            dispatcher.cancel()
+            await asyncio.gather(fetcher, dispatcher, return_exceptions=True)
+            
+            # Album jobs started from window timers hold no update; drain them too
+            for timer in self.media_group_timers.values():
+                timer.cancel()
+            if in_flight or self.album_tasks:
+                done, pending = await asyncio.wait(in_flight | self.album_tasks, timeout=SHUTDOWN_DRAIN_TIMEOUT)
+                logger.info(f"✅ Drained {len(done)} updates and albums, {len(pending)} left for replay on next start")
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+            
+            await self.application.stop()
     
     def run(self):
         """Start the bot"""
         logger.info("🚀 Starting bot…")
-        logger.info("🔄 Starting polling for updates…")
+        # Job change / new activity events go out from a background thread in both modes
+        self.event_delivery = event_outbox.start_worker(self.db_path)
         
         try:
-            # Use standard run_polling
-            self.application.run_polling(
-                allowed_updates=Update.ALL_TYPES,
-                drop_pending_updates=True
-            )
+            if BOT_MODE == "webhook":
+                logger.info("🌐 Starting webhook server…")
+                # Telegram keeps undelivered updates and retries, so nothing is dropped on deploy
+                self.application.run_webhook(
+                    listen=WEBHOOK_LISTEN,
+                    port=WEBHOOK_PORT,
+                    url_path=WEBHOOK_PATH,
+                    webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                    secret_token=WEBHOOK_SECRET_TOKEN,
+                    max_connections=WEBHOOK_MAX_CONNECTIONS,
+                    allowed_updates=Update.ALL_TYPES,
+                    drop_pending_updates=False
+                )
+            else:
+                logger.info("🔄 Starting inbox polling for updates…")
+                asyncio.run(self.run_inbox_polling())
         except Exception as e:
             logger.error(f"❌ Critical error while starting bot: {e}", exc_info=True)
             raise
+        finally:
+            if self.event_delivery is not None:
+                self.event_delivery.set()
 
 def main():
     """Main entry point"""
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate cache for job extraction.
+
+OCR of the same profile never comes out byte-identical, so results are
+looked up by similarity instead: each text becomes a MinHash signature over
+word shingles, an LSH band index finds candidates, and a result is reused
+when the estimated Jaccard similarity reaches the threshold and the first
+Experience entry reads the same (a new job changes only a few shingles of
+the whole text). Signatures and results are kept in SQLite; sampled reuses
+are re-checked against a fresh LLM answer and logged as audits.
+"""
+
+import json
+import re
+import sqlite3
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import job_rules
+from job_normalize import fold_text
+
+NUM_PERM = 128
+# 32 bands x 4 rows: pairs from ~0.45 Jaccard up become candidates, the threshold decides
+BANDS = 32
+SHINGLE_WORDS = 3
+# Estimated Jaccard similarity at which a cached result is reused
+THRESHOLD = 0.7
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20250716)
+# Fixed permutations so signatures stored in the DB stay comparable between runs
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> set:
+    """Hashed word shingles of the text, ignoring case, punctuation and markdown"""
+    words = _WORD_RE.findall((text or "").lower())
+    if len(words) < size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)}
+
+
+def signature(text: str) -> np.ndarray:
+    """MinHash signature (NUM_PERM uint32 values)"""
+    hashes = np.fromiter(shingles(text), dtype=np.uint64)
+    if hashes.size == 0:
+        return np.full(NUM_PERM, _PRIME, dtype=np.uint32)
+    # (a * x + b) mod p for every permutation and shingle; a, x < 2^32 so nothing overflows
+    permuted = (np.outer(_A, hashes % _PRIME) + _B[:, None]) % _PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(first == second))
+
+
+def top_entry(text: str) -> str:
+    """Folded first Experience entry; "" when the text has no Experience section"""
+    block = job_rules.experience_block(text or "") or []
+    for entry in job_rules.split_entries(block):
+        parsed = job_rules.parse_entry(entry)
+        period = parsed["period"] if parsed else None
+        lines = [job_rules.clean_line(line) for line in entry]
+        # The period without the running duration ("3 years 11 months" grows every month)
+        key = fold_text(" ".join(period if period and period in line else line
+                             for line in lines if line and not job_rules.is_noise(line)))
+        if key:
+            return key
+    return ""
+
+
+def band_keys(sig: np.ndarray) -> List[Tuple[int, int]]:
+    """(band, bucket) keys of a signature"""
+    rows = NUM_PERM // BANDS
+    return [(band, zlib.crc32(sig[band * rows:(band + 1) * rows].tobytes())) for band in range(BANDS)]
+
+
+class MinHashCache:
+    """LSH index of analysed texts with their job results, persisted in SQLite"""
+
+    def __init__(self, db_path: str, threshold: float = THRESHOLD):
+        self.db_path = db_path
+        self.threshold = threshold
+        self.signatures: Dict[int, np.ndarray] = {}
+        # None while the entry's extraction is still running (in-batch duplicates wait for it)
+        self.jobs: Dict[int, Optional[dict]] = {}
+        # top_entry() of each text; None for entries stored before it was recorded
+        self.entries: Dict[int, Optional[str]] = {}
+        self.buckets: Dict[Tuple[int, int], List[int]] = {}
+        self.init_db()
+        self.load()
+
+    def init_db(self):
+        """Create cache tables"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS minhash_cache (
+                analysis_id INTEGER PRIMARY KEY,
+                signature BLOB NOT NULL,
+                job_json TEXT NOT NULL,
+                top_entry TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute("PRAGMA table_info(minhash_cache)")
+        if "top_entry" not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute("ALTER TABLE minhash_cache ADD COLUMN top_entry TEXT")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_cache_audits (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                analysis_id INTEGER NOT NULL,
+                cached_from INTEGER NOT NULL,
+                similarity REAL NOT NULL,
+                cached_json TEXT NOT NULL,
+                fresh_json TEXT NOT NULL,
+                agreed INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def load(self):
+        """Index every stored entry"""
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute("SELECT analysis_id, signature, job_json, top_entry FROM minhash_cache").fetchall()
+        conn.close()
+        for analysis_id, blob, job_json, entry in rows:
+            self._index(analysis_id, np.frombuffer(blob, dtype=np.uint32), json.loads(job_json), entry)
+
+    def _index(self, analysis_id: int, sig: np.ndarray, job_info: Optional[dict], entry: Optional[str]):
+        if analysis_id in self.signatures:
+            self._unindex(analysis_id)
+        self.signatures[analysis_id] = sig
+        self.jobs[analysis_id] = job_info
+        self.entries[analysis_id] = entry
+        for key in band_keys(sig):
+            self.buckets.setdefault(key, []).append(analysis_id)
+
+    def _unindex(self, analysis_id: int):
+        for key in band_keys(self.signatures.pop(analysis_id)):
+            self.buckets[key].remove(analysis_id)
+        self.jobs.pop(analysis_id, None)
+        self.entries.pop(analysis_id, None)
+
+    def query(self, sig: np.ndarray, entry: str, exclude: Optional[int] = None) -> Optional[Tuple[int, float]]:
+        """Most similar indexed text at or above the threshold with the same top Experience entry: (analysis_id, similarity)"""
+        candidates = {analysis_id for key in band_keys(sig) for analysis_id in self.buckets.get(key, ())}
+        candidates.discard(exclude)
+        best = None
+        for analysis_id in candidates:
+            if self.entries[analysis_id] != entry:
+                continue
+            score = similarity(sig, self.signatures[analysis_id])
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (analysis_id, score)
+        return best
+
+    def job(self, analysis_id: int) -> Optional[dict]:
+        """Cached result of an entry, None while pending"""
+        return self.jobs.get(analysis_id)
+
+    def add_pending(self, analysis_id: int, sig: np.ndarray, entry: str):
+        """Index a text whose extraction is in flight, so duplicates in the same batch find it"""
+        self._index(analysis_id, sig, None, entry)
+
+    def discard(self, analysis_id: int):
+        """Drop a pending entry whose extraction failed"""
+        if analysis_id in self.signatures and self.jobs.get(analysis_id) is None:
+            self._unindex(analysis_id)
+
+    def store(self, analysis_id: int, sig: np.ndarray, job_info: dict, entry: str):
+        """Index and persist a final result"""
+        self._index(analysis_id, sig, job_info, entry)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "INSERT OR REPLACE INTO minhash_cache (analysis_id, signature, job_json, top_entry, created_at) VALUES (?, ?, ?, ?, ?)",
+            (analysis_id, sig.astype(np.uint32).tobytes(), json.dumps(job_info, ensure_ascii=False), entry,
+             datetime.now().isoformat())
+        )
+        conn.commit()
+        conn.close()
+
+    def record_audit(self, analysis_id: int, cached_from: int, score: float, cached: dict, fresh: dict) -> bool:
+        """Store a reuse check; returns whether the cached result matched the fresh one"""
+        agreed = same_job(cached, fresh)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            '''
+            INSERT INTO job_cache_audits (analysis_id, cached_from, similarity, cached_json, fresh_json, agreed)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''',
+            (analysis_id, cached_from, score, json.dumps(cached, ensure_ascii=False),
+             json.dumps(fresh, ensure_ascii=False), int(agreed))
+        )
+        conn.commit()
+        conn.close()
+        return agreed
+
+    def audit_stats(self) -> Tuple[int, int]:
+        """(audits, false reuses) over all runs"""
+        conn = sqlite3.connect(self.db_path)
+        total, agreed = conn.execute("SELECT COUNT(*), COALESCE(SUM(agreed), 0) FROM job_cache_audits").fetchone()
+        conn.close()
+        return total, total - agreed
+
+
+def same_job(first: dict, second: dict) -> bool:
+    """Whether two results name the same current job (case and spacing ignored)"""
+    if bool(first.get("found")) != bool(second.get("found")):
+        return False
+    if not first.get("found"):
+        return True
+
+    def key(job_info):
+        current_job = job_info.get("current_job") or {}
+        return tuple(" ".join((current_job.get(field) or "").lower().split()) for field in ("company", "position"))
+
+    return key(first) == key(second)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Completion budget for OCR requests.
+
+max_tokens is predicted from how much text an image can hold: the share of
+dark ("ink") pixels times the area GPT-4o actually sees after its resize.
+Responses that still stop on the limit are continued and stitched instead of
+being re-run from scratch.
+"""
+
+import math
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# Grey level below which a pixel counts as ink
+INK_LEVEL = 160
+# Ink pixels (at model resolution) per completion token, calibrated on profile screenshots
+INK_PIXELS_PER_TOKEN = 200
+# Room for list markers / headings the model adds around the text
+BASE_TOKENS = 150
+HEADROOM = 1.5
+MIN_MAX_TOKENS = 500
+MAX_MAX_TOKENS = 4096
+
+# Overlap searched when the continuation repeats the end of the previous part
+STITCH_OVERLAP_CHARS = 200
+
+CONTINUE_PROMPT = (
+    "Your answer was cut off. Continue exactly where you stopped. "
+    "Do not repeat anything already written and do not add any introduction."
+)
+
+
+def model_resolution(width: int, height: int) -> tuple:
+    """Size GPT-4o high-detail works at: fit into 2048x2048, then short side down to 768"""
+    scale = min(1.0, 2048 / max(width, height))
+    scale *= min(1.0, 768 / (min(width, height) * scale))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def ink_density(image: Image.Image) -> float:
+    """Share of ink pixels, measured on a thumbnail"""
+    thumbnail = image.convert("L")
+    thumbnail.thumbnail((512, 512))
+    return float((np.asarray(thumbnail) < INK_LEVEL).mean())
+
+
+def predict_max_tokens(image_bytes: bytes) -> int:
+    """max_tokens for transcribing the image"""
+    with Image.open(BytesIO(image_bytes)) as image:
+        width, height = model_resolution(*image.size)
+        density = ink_density(image)
+    expected = BASE_TOKENS + width * height * density / INK_PIXELS_PER_TOKEN
+    return int(min(MAX_MAX_TOKENS, max(MIN_MAX_TOKENS, math.ceil(expected * HEADROOM))))
+
+
+def stitch_continuation(previous: str, continuation: str) -> str:
+    """Append a continuation, dropping any text it repeats from the end of previous"""
+    window = previous[-STITCH_OVERLAP_CHARS:]
+    for size in range(min(len(window), len(continuation)), 0, -1):
+        if continuation.startswith(window[-size:]):
+            # A couple of matching characters is coincidence, not a repeat
+            if size >= 8:
+                return previous + continuation[size:]
+            break
+    return previous + continuation
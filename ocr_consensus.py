@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Cross-run OCR consensus.
+
+One screenshot transcribed several times comes back with different
+misreads each time (followers 9,004 / 1,038 / 13,461 in analysis_results).
+Instead of the user resending, k passes are run concurrently and merged:
+the most central pass is the pivot, every other pass is aligned to it line
+by line (patience diff on folded lines, replaced lines paired by trigram
+similarity), and each line takes the variant most passes agree on. Lines
+only a minority of passes saw are dropped, lines most passes saw but the
+pivot missed are inserted. Counters, name and current job are voted on as
+fields. The mean agreement is the consistency score; below
+OCR_CONSENSUS_MIN the bot adds passes one at a time instead of re-running
+blindly.
+"""
+
+import os
+import sqlite3
+import sys
+from collections import Counter, defaultdict
+from typing import List, Optional
+
+import profile_identity
+import profile_metrics
+from job_normalize import fold_text, normalize_company, normalize_position
+from snapshot_diff import patience_diff, source_text
+
+DB_PATH = 'image_analysis_results.db'
+
+# OCR passes per image; 1 turns consensus off
+OCR_CONSENSUS_PASSES = int(os.getenv("OCR_CONSENSUS_PASSES", "1"))
+# Consistency below which another pass is run...
+OCR_CONSENSUS_MIN = float(os.getenv("OCR_CONSENSUS_MIN", "0.8"))
+# ...up to this many passes in total
+OCR_CONSENSUS_MAX_PASSES = int(os.getenv("OCR_CONSENSUS_MAX_PASSES", str(OCR_CONSENSUS_PASSES + 2)))
+# Trigram similarity at which a replaced line is a misread of the pivot line, not another line
+LINE_MATCH_THRESHOLD = 0.5
+# Disputed lines kept in the report
+MAX_DISPUTED = 20
+# Below this share of the pivot's lines surviving the vote, passes are too different to
+# merge line by line and the pivot is returned as is
+MIN_KEPT_SHARE = 0.5
+
+
+def line_key(line: str) -> str:
+    """Comparison key of a line: folded, markup and bullets ignored (separators kept as is)"""
+    return fold_text(profile_identity.clean_line(line)) or line.strip()
+
+
+def text_similarity(first: List[str], second: List[str]) -> float:
+    """Jaccard similarity of two passes' line key sets"""
+    first, second = set(first) - {""}, set(second) - {""}
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+def choose_pivot(keys: List[List[str]]) -> int:
+    """Index of the pass most similar to all others (the medoid)"""
+    scores = [sum(text_similarity(keys[i], keys[j]) for j in range(len(keys)) if j != i) for i in range(len(keys))]
+    return max(range(len(keys)), key=lambda i: (scores[i], len(keys[i])))
+
+
+def align(pivot_keys: List[str], other_keys: List[str]) -> tuple:
+    """Map another pass onto the pivot
+
+    Returns ({pivot index: other index} for equal and misread lines,
+    [(pivot index the line follows, other index)] for lines the pivot lacks).
+    """
+    matched, extra = {}, []
+    i = j = 0
+    removed, added = [], []
+
+    def flush():
+        # Pair each replaced pivot line with its most similar unpaired added line
+        free = [index for index, _ in added]
+        for pivot_index in removed:
+            best = max(free, key=lambda index: profile_identity.similarity(pivot_keys[pivot_index], other_keys[index]), default=None)
+            if best is not None and profile_identity.similarity(pivot_keys[pivot_index], other_keys[best]) >= LINE_MATCH_THRESHOLD:
+                matched[pivot_index] = best
+                free.remove(best)
+        extra.extend((anchor, index) for index, anchor in added if index in free)
+        removed.clear()
+        added.clear()
+
+    for op, _ in patience_diff(pivot_keys, other_keys):
+        if op == "=":
+            flush()
+            matched[i] = j
+            i, j = i + 1, j + 1
+        elif op == "-":
+            removed.append(i)
+            i += 1
+        else:
+            added.append((j, i - 1))
+            j += 1
+    flush()
+    return matched, extra
+
+
+def vote_fields(texts: List[str], job_infos: Optional[List[Optional[dict]]] = None, merged_text: str = "") -> dict:
+    """Majority value and agreement share of every field the passes report
+
+    Ties between counter values go to the value in the merged text.
+    """
+    n = len(texts)
+    fields = {}
+    per_pass = [profile_metrics.extract_metrics(text) for text in texts]
+    merged_metrics = profile_metrics.extract_metrics(merged_text)
+    for metric in profile_metrics.METRICS:
+        votes = Counter(metrics[metric][0] for metrics in per_pass if metric in metrics)
+        if votes:
+            merged_value = merged_metrics.get(metric, (None,))[0]
+            value = max(votes, key=lambda value: (votes[value], value == merged_value))
+            fields[metric] = {"value": value, "agreement": votes[value] / n}
+
+    names = Counter(profile_identity.extract_identity(text)["name"] for text in texts)
+    names.pop(None, None)
+    if names:
+        # Same name up to case and accents counts as one vote
+        folded = Counter()
+        for name, count in names.items():
+            folded[fold_text(name)] += count
+        key, count = folded.most_common(1)[0]
+        fields["name"] = {"value": next(name for name, _ in names.most_common() if fold_text(name) == key),
+                          "agreement": count / n}
+
+    job_votes = defaultdict(list)
+    for job_info in job_infos or []:
+        if job_info is None:
+            continue
+        current_job = job_info.get("current_job") or {}
+        key = (bool(job_info.get("found")), normalize_company(current_job.get("company")),
+               normalize_position(current_job.get("position")))
+        job_votes[key].append(job_info)
+    if job_votes:
+        winners = max(job_votes.values(), key=len)
+        fields["current_job"] = {"value": winners[0], "agreement": len(winners) / n}
+    return fields
+
+
+def merge_passes(texts: List[str], job_infos: Optional[List[Optional[dict]]] = None) -> dict:
+    """Consensus of several transcriptions of the same image
+
+    Returns {"text", "job_info", "passes", "consistency", "disputed", "fields"}:
+    the voted text, the job most passes found, the mean share of passes
+    agreeing per line, the lines passes disagreed on (with their support) and
+    the voted fields.
+    """
+    n = len(texts)
+    lines = [(text or "").strip().splitlines() for text in texts]
+    keys = [[line_key(line) for line in pass_lines] for pass_lines in lines]
+    pivot = choose_pivot(keys) if n > 1 else 0
+
+    # Variants of every pivot line, and lines other passes add between pivot lines
+    variants = [[(keys[pivot][index], line)] for index, line in enumerate(lines[pivot])]
+    inserted = defaultdict(lambda: defaultdict(list))
+    for other in range(n):
+        if other == pivot:
+            continue
+        matched, extra = align(keys[pivot], keys[other])
+        for pivot_index, other_index in matched.items():
+            variants[pivot_index].append((keys[other][other_index], lines[other][other_index]))
+        for anchor, other_index in extra:
+            if keys[other][other_index]:
+                inserted[anchor][keys[other][other_index]].append((other, lines[other][other_index]))
+
+    merged, agreements, disputed = [], [], []
+    kept = 0
+
+    def emit_inserted(anchor: int):
+        for key, seen in inserted.get(anchor, {}).items():
+            support = len({other for other, _ in seen})
+            agreements.append(max(support, n - support) / n)
+            if support * 2 > n:
+                merged.append(Counter(line for _, line in seen).most_common(1)[0][0])
+            if support < n:
+                disputed.append({"line": seen[0][1], "support": support / n})
+
+    emit_inserted(-1)
+    for index, line_variants in enumerate(variants):
+        if not keys[pivot][index]:
+            # Blank lines separate blocks; keep the pivot's layout
+            if merged and merged[-1].strip():
+                merged.append("")
+            emit_inserted(index)
+            continue
+        support = len(line_variants)
+        counts = Counter(key for key, _ in line_variants)
+        # Ties go to the pivot's reading, which comes first
+        best_key = max(counts, key=lambda key: (counts[key], key == line_variants[0][0]))
+        best_line = Counter(line for key, line in line_variants if key == best_key).most_common(1)[0][0]
+        if support * 2 >= n:
+            merged.append(best_line)
+            kept += 1
+            agreements.append(counts[best_key] / n)
+        else:
+            agreements.append((n - support) / n)
+        if counts[best_key] < n:
+            disputed.append({"line": best_line, "support": counts[best_key] / n})
+        emit_inserted(index)
+
+    text = "\n".join(merged).strip()
+    if kept < MIN_KEPT_SHARE * sum(1 for key in keys[pivot] if key):
+        text = "\n".join(lines[pivot])
+    fields = vote_fields(texts, job_infos, text)
+    # A transcription is only as consistent as its weaker part, lines or fields
+    line_consistency = sum(agreements) / len(agreements) if agreements else 1.0
+    field_agreements = [field["agreement"] for field in fields.values()]
+    field_consistency = sum(field_agreements) / len(field_agreements) if field_agreements else 1.0
+    disputed.sort(key=lambda item: item["support"])
+    return {
+        "text": text or None,
+        "job_info": fields["current_job"]["value"] if "current_job" in fields else None,
+        "passes": n,
+        "consistency": min(line_consistency, field_consistency),
+        "disputed": disputed[:MAX_DISPUTED],
+        "fields": {name: field for name, field in fields.items() if name != "current_job"},
+    }
+
+
+def needs_more_passes(consistency: float, passes: int) -> bool:
+    """Whether the consensus is weak enough, and passes still allowed, to run another one"""
+    return consistency < OCR_CONSENSUS_MIN and passes < OCR_CONSENSUS_MAX_PASSES
+
+
+def combine_reports(reports: List[Optional[dict]]) -> Optional[dict]:
+    """Summary of the per-image reports of an album: the weakest image sets the consistency"""
+    reports = [report for report in reports if report]
+    if not reports:
+        return None
+    return {
+        "passes": sum(report["passes"] for report in reports),
+        "consistency": min(report["consistency"] for report in reports),
+        "disputed": [item for report in reports for item in report["disputed"]][:MAX_DISPUTED],
+        "fields": {},
+    }
+
+
+def format_report(report: dict) -> str:
+    """One-line summary plus the field votes that were not unanimous"""
+    summary = f"{report['passes']} passes, consistency {report['consistency']:.2f}, {len(report['disputed'])} disputed lines"
+    split = [f"{name}={field['value']:,.0f}" if isinstance(field["value"], float) else f"{name}={field['value']}"
+             for name, field in report["fields"].items() if field["agreement"] < 1]
+    return summary + (f"; split votes: {', '.join(split)}" if split else "")
+
+
+def print_image_consensus(db_path: str = DB_PATH):
+    """Merge the stored transcriptions of each image in analysis_results"""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute('''
+        SELECT id, image_file, response_text FROM analysis_results
+        WHERE status = 'SUCCESS' AND response_text IS NOT NULL
+        ORDER BY image_file, id
+    ''').fetchall()
+    conn.close()
+
+    by_image = defaultdict(list)
+    for row_id, image_file, text in rows:
+        by_image[image_file].append(source_text(db_path, 'analysis', row_id, text))
+    print("🗳️ OCR CONSENSUS")
+    print("=" * 80)
+    for image_file, texts in by_image.items():
+        report = merge_passes(texts)
+        print(f"{image_file}: {format_report(report)}")
+        for name, field in report["fields"].items():
+            value = f"{field['value']:,.0f}" if isinstance(field["value"], float) else field["value"]
+            print(f"   {name:<20} {value:<30} agreement {field['agreement']:.0%}")
+
+
+if __name__ == "__main__":
+    print_image_consensus(sys.argv[1] if len(sys.argv) > 1 else DB_PATH)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+OCR output formats.
+
+"verbose" is the original audio-description prompt: the model answers with
+chatty wrappers, markdown bold and separators. "compact" asks for bare lines
+with bracketed section titles, which costs far fewer completion tokens; the
+human-friendly reply is rendered locally from it.
+"""
+
+import re
+
+VERBOSE = "verbose"
+COMPACT = "compact"
+OUTPUT_MODES = (VERBOSE, COMPACT)
+
+# Average completion tokens per image with the verbose prompt
+# (10-request consistency test, see unit_economics_calculator.TEST_RESULTS)
+VERBOSE_BASELINE_COMPLETION_TOKENS = 408.4
+
+COMPACT_OCR_PROMPT = (
+    "Transcribe all text and numbers in this image in reading order. "
+    "Output one text line per line. Put each section title on its own line in square brackets, "
+    "e.g. [Experience]. No introduction, no commentary, no markdown, no bullets, no blank lines."
+)
+COMPACT_TILE_OCR_PROMPT = (
+    "This is part {index} of {total} of a tall screenshot, cut into overlapping strips. "
+    "Transcribe all text and numbers in it in reading order, including partially visible lines at the edges. "
+    "Output one text line per line. Put each section title on its own line in square brackets, "
+    "e.g. [Experience]. No introduction, no commentary, no markdown, no bullets, no blank lines."
+)
+
+_SECTION_RE = re.compile(r"^\[(.+)\]$")
+
+
+def render_compact(text: str) -> str:
+    """Human-friendly reply from compact OCR output"""
+    rendered = []
+    in_section = False
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = _SECTION_RE.match(line)
+        if match:
+            if rendered:
+                rendered.append("")
+            rendered.append(f"📌 {match.group(1).upper()}")
+            in_section = True
+        elif line.startswith("==="):
+            # Image/page separators of albums and PDFs
+            if rendered:
+                rendered.append("")
+            rendered.append(line)
+            in_section = False
+        else:
+            rendered.append(f"• {line}" if in_section else line)
+    return "\n".join(rendered)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Local quality score of an OCR transcription.
+
+Runs after every OCR, without any API call, and decides whether a result is
+worth paying for a re-run (on OCR_ESCALATION_MODEL when set). Components, each
+0..1 with 1 = good:
+
+- coverage: profile sections found (against the previous snapshot's sections
+  when there is one)
+- numeric: share of number tokens in a plausible band (a profile has dates and
+  counters; none means a refusal or a summary, too many means digit soup)
+- repetition: duplicated lines and looping output
+- garbage: tokens that are mostly symbols or replacement characters
+- prior: share of words shared with the profile's latest snapshot
+
+Coverage, numeric density and the short-text penalty measure a profile.
+They only count when the text is one: a previous snapshot exists, or the
+text has profile markers (section headers, follower/connection counters).
+A short, clean transcription of any other image is not re-run for being
+short. The score is the weighted mean of the components that apply; a
+refusal scores 0.
+"""
+
+import os
+import re
+import sqlite3
+import sys
+from collections import Counter
+from typing import Optional
+
+import profile_identity
+import profile_metrics
+import snapshot_diff
+from job_rules import section_name
+from minhash_cache import shingles
+
+DB_PATH = 'image_analysis_results.db'
+
+# Results scoring below this are re-run...
+OCR_QUALITY_MIN = float(os.getenv("OCR_QUALITY_MIN", "0.6"))
+# ...at most this many times per image
+OCR_QUALITY_RERUNS = int(os.getenv("OCR_QUALITY_RERUNS", "1"))
+
+# Sections a full-profile screenshot shows at least, when there is no previous snapshot
+EXPECTED_SECTIONS = 3
+# Plausible share of number tokens
+MIN_NUMERIC_DENSITY = 0.01
+MAX_NUMERIC_DENSITY = 0.3
+# Profile texts shorter than this (in words) lose score proportionally
+MIN_WORDS = 30
+WEIGHTS = {"coverage": 0.25, "numeric": 0.15, "repetition": 0.2, "garbage": 0.2, "prior": 0.2}
+# Components that only apply to profile texts
+PROFILE_COMPONENTS = ("coverage", "numeric")
+
+_TOKEN_RE = re.compile(r"\S+")
+_NUMBER_RE = re.compile(r"^\W*\d[\d,.:/%+kKmM-]*\W*$")
+_MARKUP_RE = re.compile(r"[*_#`>|•·…\-–—=~©®™]+|\.{2,}")
+_REFUSAL_RE = re.compile(
+    r"\b(?:I'?m sorry|I am sorry|I can(?:no|')t (?:help|assist|read|transcribe)|unable to (?:help|assist|read|transcribe))\b",
+    re.IGNORECASE
+)
+
+
+def coverage_score(sections: set, prior_sections: Optional[set]) -> float:
+    """Share of expected sections present"""
+    if prior_sections:
+        return len(sections & prior_sections) / len(prior_sections)
+    return min(1.0, len(sections) / EXPECTED_SECTIONS)
+
+
+def numeric_score(density: float) -> float:
+    """1 inside the plausible band, falling off linearly outside it"""
+    if density < MIN_NUMERIC_DENSITY:
+        return density / MIN_NUMERIC_DENSITY
+    if density > MAX_NUMERIC_DENSITY:
+        return max(0.0, 1 - (density - MAX_NUMERIC_DENSITY) / MAX_NUMERIC_DENSITY)
+    return 1.0
+
+
+def repetition_ratio(lines: list, words: list) -> float:
+    """Share of repeated content: duplicate lines, or 4-word sequences seen before (loops)"""
+    keys = [key for key in (" ".join(line.lower().split()) for line in lines) if len(key) > 3]
+    duplicate_lines = 1 - len(set(keys)) / len(keys) if keys else 0.0
+    grams = Counter(tuple(words[i:i + 4]) for i in range(len(words) - 3))
+    repeated_grams = sum(count - 1 for count in grams.values()) / max(1, len(words) - 3)
+    return max(duplicate_lines, repeated_grams)
+
+
+def garbage_ratio(tokens: list) -> float:
+    """Share of tokens that are mostly symbols (markdown and separators don't count)"""
+    checked = garbage = 0
+    for token in tokens:
+        token = _MARKUP_RE.sub("", token)
+        if not token:
+            continue
+        checked += 1
+        alphanumeric = sum(char.isalnum() for char in token)
+        if "�" in token or alphanumeric < len(token) / 2:
+            garbage += 1
+    return garbage / checked if checked else 0.0
+
+
+def containment(text: str, prior_text: str) -> float:
+    """Word containment of the smaller text in the other (screenshots crop differently)"""
+    first, second = shingles(text, 1), shingles(prior_text, 1)
+    if not first or not second:
+        return 0.0
+    return len(first & second) / min(len(first), len(second))
+
+
+def is_profile_text(sections: set, text: str, prior_text: Optional[str]) -> bool:
+    """Whether the profile-only components apply: a previous snapshot, section headers or profile counters"""
+    return bool(prior_text or sections or profile_metrics.extract_metrics(text))
+
+
+def score_text(text: Optional[str], prior_text: Optional[str] = None) -> dict:
+    """Quality score and its components; a component is None where it doesn't apply
+
+    "prior" needs a previous snapshot; "coverage", "numeric" and the short-text
+    penalty need a profile text (see is_profile_text).
+    """
+    text = text or ""
+    lines = [line for line in text.splitlines() if line.strip()]
+    tokens = _TOKEN_RE.findall(text)
+    words = [token.lower() for token in tokens]
+    sections = {name for name in map(section_name, lines) if name}
+    prior_sections = {name for name in map(section_name, (prior_text or "").splitlines()) if name}
+
+    repetition = repetition_ratio(lines, words)
+    garbage = garbage_ratio(tokens)
+    components = {
+        "coverage": coverage_score(sections, prior_sections),
+        "numeric": numeric_score(sum(bool(_NUMBER_RE.match(token)) for token in tokens) / len(tokens) if tokens else 0.0),
+        "repetition": max(0.0, 1 - 2 * repetition),
+        "garbage": max(0.0, 1 - 4 * garbage),
+        "prior": containment(text, prior_text) if prior_text else None,
+    }
+    profile = is_profile_text(sections, text, prior_text)
+    if not profile:
+        components.update(dict.fromkeys(PROFILE_COMPONENTS))
+    available = {name: value for name, value in components.items() if value is not None}
+    score = sum(WEIGHTS[name] * value for name, value in available.items()) / sum(WEIGHTS[name] for name in available)
+    if profile:
+        score *= min(1.0, len(tokens) / MIN_WORDS)
+    refusal = bool(_REFUSAL_RE.search(text)) and len(tokens) < MIN_WORDS * 3
+    # An empty transcription is never good
+    if not tokens:
+        score = 0.0
+    return dict(components, score=0.0 if refusal else score, refusal=refusal, profile=profile,
+                sections=sorted(sections), words=len(tokens))
+
+
+def prior_text(db_path: str, text: str) -> Optional[str]:
+    """Latest stored snapshot of the profile the text shows, found without writing anything"""
+    identity = profile_identity.extract_identity(text)
+    # sqlite3.connect would create an empty database file
+    if not identity["name"] or not os.path.exists(db_path):
+        return None
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        match = profile_identity.find_profile(conn, identity)
+    except sqlite3.OperationalError:
+        # Identity tables not created yet
+        match = None
+    conn.close()
+    if not match:
+        return None
+    try:
+        return snapshot_diff.latest_text(db_path, f"profile:{match[0]}")
+    except sqlite3.OperationalError:
+        # Snapshot store not created yet
+        return None
+
+
+def assess(db_path: str, text: Optional[str]) -> dict:
+    """Score a fresh transcription against the profile's previous snapshot"""
+    return score_text(text, prior_text(db_path, text) if text else None)
+
+
+def needs_rerun(quality: dict, reruns: int) -> bool:
+    """Whether a result is bad enough, and re-runs still allowed, to pay for another call"""
+    return quality["score"] < OCR_QUALITY_MIN and reruns < OCR_QUALITY_RERUNS
+
+
+def format_quality(quality: dict) -> str:
+    """Score with its components on one line"""
+    if quality["refusal"]:
+        return "0.00 (refusal)"
+    parts = ", ".join(f"{name} {quality[name]:.2f}" for name in WEIGHTS if quality[name] is not None)
+    return f"{quality['score']:.2f} ({parts})"
+
+
+def print_stored_quality(db_path: str = DB_PATH):
+    """Score every stored analysis and show how many would have been re-run"""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute('''
+        SELECT id, image_file, response_text FROM analysis_results
+        WHERE status = 'SUCCESS' AND response_text IS NOT NULL ORDER BY id
+    ''').fetchall()
+    conn.close()
+
+    print("🩺 OCR QUALITY")
+    print("=" * 80)
+    reruns = 0
+    for analysis_id, image_file, text in rows:
+        quality = score_text(snapshot_diff.source_text(db_path, 'analysis', analysis_id, text))
+        flag = quality["score"] < OCR_QUALITY_MIN
+        reruns += flag
+        print(f"{'⚠️ ' if flag else '✅'} #{analysis_id:<4} {image_file}: {format_quality(quality)}")
+    if rows:
+        print(f"\nRe-runs at OCR_QUALITY_MIN={OCR_QUALITY_MIN}: {reruns}/{len(rows)} ({reruns / len(rows):.0%})")
+
+
+if __name__ == "__main__":
+    print_stored_quality(sys.argv[1] if len(sys.argv) > 1 else DB_PATH)
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Profile identity resolution.
+
+Screenshots carry no profile id, so the person is recognised from the OCR
+text: name, headline and location are pulled from the top card, candidate
+profiles are found through indexed blocking keys derived from the name, and
+the best fuzzy match above the threshold wins (a new profile is created
+otherwise). Every analysed screenshot becomes a row in profile_snapshots,
+indexed so that "latest snapshot of profile X" is a single index seek.
+"""
+
+import re
+import sqlite3
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import snapshot_sources
+from job_normalize import fold_text, trigrams
+
+# Trigram Jaccard below which two names are never the same person
+NAME_THRESHOLD = 0.5
+# Name similarity plus headline/location evidence needed when the names are not identical
+MATCH_THRESHOLD = 0.6
+# Lines of the top card searched for the name
+NAME_SEARCH_LINES = 8
+
+_PREAMBLE_RE = re.compile(r"^(?:sure|certainly|of course|here\b|here's|below)\b.*:?$", re.IGNORECASE)
+_LABEL_RE = re.compile(r"^(name|headline|location)\s*:\s*(.*)$", re.IGNORECASE)
+_MARKUP_RE = re.compile(r"[*_#`>]+")
+_BULLET_RE = re.compile(r"^\s*(?:[-•·]|\d+[.)])\s+")
+_NAME_WORD_RE = re.compile(r"^[A-ZÀ-ÖØ-ÞА-ЯЁІЇЄҐ][a-zà-öø-ÿа-яёіїєґ'’-]+\.?$")
+# Connection degree, badges and other decorations after the name
+_NAME_TAIL_RE = re.compile(r"\s+(?:\d(?:st|nd|rd|th)\+?|with\b|\(|\||·|-\s).*$", re.IGNORECASE)
+_LOCATION_RE = re.compile(r"^[A-Z][\w .'’-]+,\s*[A-Z][\w .'’-]+(?:,\s*[A-Z][\w .'’-]+)?$")
+_NOISE_LINE_RE = re.compile(
+    r"(?:\bbadge\b|\bfollowers?\b|\bconnections?\b|^open to\b|contact info|^[\d,.+k\s|]+$)", re.IGNORECASE
+)
+_SECTION_RE = re.compile(
+    r"^(?:about|analytics|activity|experience|education|skills|featured|resources|interests|open to)\b:?$",
+    re.IGNORECASE
+)
+
+
+def clean_line(line: str) -> str:
+    """Line without markdown, bullets and emoji"""
+    line = _BULLET_RE.sub("", _MARKUP_RE.sub("", line))
+    line = "".join(char for char in line if char.isalnum() or char.isspace() or char in ",.'’&|/-:()+")
+    return " ".join(line.split()).strip()
+
+
+def parse_name(line: str) -> Optional[str]:
+    """Person name at the start of a line: 2-4 capitalised words"""
+    line = _NAME_TAIL_RE.sub("", line)
+    words = []
+    for word in line.split():
+        if not _NAME_WORD_RE.match(word):
+            break
+        words.append(word)
+        if len(words) == 4:
+            break
+    return " ".join(words) if len(words) >= 2 else None
+
+
+def extract_identity(text: str) -> dict:
+    """{"name", "headline", "location"} from the top card of an OCR text (missing ones are None)"""
+    identity = {"name": None, "headline": None, "location": None}
+    lines = [clean_line(line) for line in (text or "").splitlines()]
+    lines = [line for line in lines if line and line != "---" and not _PREAMBLE_RE.match(line)]
+
+    # Transcriptions that label the fields ("Name:" then the value)
+    for index, line in enumerate(lines[:NAME_SEARCH_LINES * 2]):
+        match = _LABEL_RE.match(line)
+        if match:
+            value = match.group(2) or (lines[index + 1] if index + 1 < len(lines) else "")
+            field = match.group(1).lower()
+            if not identity[field]:
+                identity[field] = parse_name(value) if field == "name" else value or None
+
+    name_index = None
+    if not identity["name"]:
+        for index, line in enumerate(lines[:NAME_SEARCH_LINES]):
+            name = parse_name(line)
+            if name:
+                identity["name"], name_index = name, index
+                break
+    if name_index is None:
+        return identity
+
+    # Headline and location follow the name, before the first section
+    for line in lines[name_index + 1:name_index + 1 + NAME_SEARCH_LINES]:
+        if _SECTION_RE.match(line):
+            break
+        if _NOISE_LINE_RE.search(line):
+            continue
+        if not identity["location"] and _LOCATION_RE.match(line) and len(line) < 60:
+            identity["location"] = line
+        elif not identity["headline"] and len(line.split()) >= 2:
+            identity["headline"] = line
+    return identity
+
+
+def name_key(name: Optional[str]) -> str:
+    """Comparison key of a name"""
+    return fold_text(name)
+
+
+def blocking_keys(key: str) -> List[str]:
+    """Index keys that near-identical names share even with an OCR typo in either word"""
+    words = key.split()
+    if len(words) < 2:
+        return [key] if key else []
+    first, last = words[0], words[-1]
+    return [f"f:{first}|{last[:2]}", f"l:{last[:4]}|{first[:1]}"]
+
+
+def similarity(first: Optional[str], second: Optional[str]) -> float:
+    """Trigram Jaccard similarity of two folded strings"""
+    first, second = fold_text(first), fold_text(second)
+    if not first or not second:
+        return 0.0
+    first_grams, second_grams = trigrams(first), trigrams(second)
+    return len(first_grams & second_grams) / len(first_grams | second_grams)
+
+
+def init_identity_tables(db_path: str):
+    """Create profiles and profile_snapshots with their indexes"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS profiles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            name_key TEXT NOT NULL,
+            headline TEXT,
+            location TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS profile_blocking_keys (
+            block_key TEXT NOT NULL,
+            profile_id INTEGER NOT NULL,
+            PRIMARY KEY (block_key, profile_id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS profile_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            profile_id INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            image_file TEXT,
+            observed_at TIMESTAMP NOT NULL,
+            match_score REAL,
+            UNIQUE (source, source_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_profiles_name_key ON profiles (name_key)')
+    # Latest snapshot of a profile = first entry of this index for the profile
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_profile_snapshots_latest
+        ON profile_snapshots (profile_id, observed_at DESC)
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def find_profile(conn: sqlite3.Connection, identity: dict) -> Optional[tuple]:
+    """(profile_id, score) of the best matching profile, or None"""
+    key = name_key(identity["name"])
+    exact = conn.execute("SELECT id, headline, location FROM profiles WHERE name_key = ?", (key,)).fetchall()
+    keys = blocking_keys(key)
+    fuzzy = conn.execute(
+        f'''
+        SELECT p.id, p.name_key, p.headline, p.location
+        FROM profile_blocking_keys b JOIN profiles p ON p.id = b.profile_id
+        WHERE b.block_key IN ({",".join("?" * len(keys))})
+        ''',
+        keys
+    ).fetchall() if keys else []
+
+    candidates = {profile_id: (key, headline, location) for profile_id, headline, location in exact}
+    for profile_id, candidate_key, headline, location in fuzzy:
+        candidates.setdefault(profile_id, (candidate_key, headline, location))
+
+    best = None
+    for profile_id, (candidate_key, headline, location) in candidates.items():
+        score = match_score(identity, candidate_key, headline, location)
+        if score is not None and (best is None or score > best[1]):
+            best = (profile_id, score)
+    return best
+
+
+def match_score(identity: dict, candidate_key: str, headline: Optional[str], location: Optional[str]) -> Optional[float]:
+    """Score of an identity against a known person (name key, headline, location); None if not the same person"""
+    key = name_key(identity["name"])
+    name_score = 1.0 if candidate_key == key else similarity(candidate_key, key)
+    if name_score < NAME_THRESHOLD:
+        return None
+    # Headline and location change over time, so they only tip close calls
+    score = name_score
+    if identity["headline"] and headline:
+        score += 0.2 * similarity(identity["headline"], headline)
+    if identity["location"] and location:
+        score += 0.1 if similarity(identity["location"], location) >= 0.5 else -0.1
+    return score if name_score == 1.0 or score >= MATCH_THRESHOLD else None
+
+
+def distinct_people(texts: List[str]) -> bool:
+    """Whether the texts name two people find_profile would not take for the same one
+
+    Texts without a name (a scrolled-down part of a profile) never conflict.
+    """
+    identities = [identity for identity in map(extract_identity, texts) if identity["name"]]
+    return any(
+        match_score(first, name_key(second["name"]), second["headline"], second["location"]) is None
+        for index, first in enumerate(identities) for second in identities[index + 1:]
+    )
+
+
+def resolve_profile(db_path: str, text: str, source: str, source_id: int,
+                    image_file: Optional[str] = None, observed_at: Optional[str] = None) -> Optional[int]:
+    """Profile id of an OCR snapshot (created if new), recorded in profile_snapshots; None without a name"""
+    identity = extract_identity(text)
+    if not identity["name"]:
+        return None
+    observed_at = observed_at or datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        existing = conn.execute(
+            "SELECT profile_id FROM profile_snapshots WHERE source = ? AND source_id = ?", (source, source_id)
+        ).fetchone()
+        if existing:
+            conn.execute("COMMIT")
+            return existing[0]
+
+        match = find_profile(conn, identity)
+        if match:
+            profile_id, score = match
+            # Keep the headline/location of the newest snapshot (backfills arrive out of order)
+            conn.execute(
+                '''
+                UPDATE profiles SET headline = COALESCE(?, headline), location = COALESCE(?, location), updated_at = ?
+                WHERE id = ? AND updated_at <= ?
+                ''',
+                (identity["headline"], identity["location"], observed_at, profile_id, observed_at)
+            )
+        else:
+            score = None
+            key = name_key(identity["name"])
+            profile_id = conn.execute(
+                'INSERT INTO profiles (name, name_key, headline, location, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (identity["name"], key, identity["headline"], identity["location"], observed_at)
+            ).lastrowid
+            conn.executemany(
+                'INSERT OR IGNORE INTO profile_blocking_keys (block_key, profile_id) VALUES (?, ?)',
+                [(block_key, profile_id) for block_key in blocking_keys(key)]
+            )
+
+        conn.execute(
+            '''
+            INSERT INTO profile_snapshots (profile_id, source, source_id, image_file, observed_at, match_score)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''',
+            (profile_id, source, source_id, image_file, observed_at, min(score, 1.0) if score is not None else None)
+        )
+        conn.execute("COMMIT")
+        return profile_id
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def latest_snapshot(db_path: str, profile_id: int) -> Optional[dict]:
+    """Newest snapshot of a profile (index seek on idx_profile_snapshots_latest)"""
+    conn = sqlite3.connect(db_path)
+    row = conn.execute(
+        '''
+        SELECT source, source_id, image_file, observed_at FROM profile_snapshots
+        WHERE profile_id = ? ORDER BY observed_at DESC LIMIT 1
+        ''',
+        (profile_id,)
+    ).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    source, source_id, image_file, observed_at = row
+    return {"source": source, "source_id": source_id, "image_file": image_file, "observed_at": observed_at}
+
+
+def resolve_pending(db_path: str) -> int:
+    """Assign profiles to analysis_results / file_parse_results rows that have none yet; returns how many"""
+    init_identity_tables(db_path)
+    resolved = 0
+    for source, source_id, text, _, image_file, observed_at in snapshot_sources.pending_rows(db_path, "profile_snapshots"):
+        if resolve_profile(db_path, text, source, source_id, image_file, observed_at) is not None:
+            resolved += 1
+    return resolved
+
+
+if __name__ == "__main__":
+    count = resolve_pending('image_analysis_results.db')
+    print(f"👤 Resolved profiles for {count} snapshots")
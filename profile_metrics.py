@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Numeric profile metrics as a time series.
+
+Profile texts carry counters ("9,004 followers", "500+ connections",
+"211 search appearances"). They are parsed into profile_metrics, one typed
+row per (snapshot, metric). Trends are computed for every profile and
+metric in one NumPy pass over the sorted series: step deltas, daily rates,
+overall growth, and anomalies (steps far outside the metric's usual change,
+typically OCR misreads).
+"""
+
+import re
+import sqlite3
+from typing import Optional
+
+import numpy as np
+
+import profile_identity
+import snapshot_sources
+
+DB_PATH = 'image_analysis_results.db'
+
+# Metric name -> label variants as they appear in the text
+METRICS = {
+    "followers": r"followers?",
+    "connections": r"connections?",
+    "profile_views": r"profile\s+views?",
+    "post_impressions": r"post\s+impressions?",
+    "search_appearances": r"search\s+appearances?",
+}
+# Robust z-score of a step's log change above which it is an anomaly
+ANOMALY_Z = 3.5
+# ...and the step must also change the value by at least this factor
+ANOMALY_MIN_RATIO = 1.5
+
+# Thousands separators: comma, space, no-break space; never a line break ("Posts 12\n345 followers")
+_NUMBER = r"(?P<number>\d{1,3}(?:[, \u00a0]\d{3})+|\d+(?:\.\d+)?)\s*(?P<suffix>[kKmM]\b)?(?P<plus>\+)?"
+_LABELS = "|".join(f"(?P<{name}>{label})" for name, label in METRICS.items())
+# "9,004 followers"; a word in between ("83 article followers", "156k other connections") is someone else's count
+_VALUE_FIRST_RE = re.compile(rf"(?<![\w.,]){_NUMBER}\s*(?:{_LABELS})\b", re.IGNORECASE)
+# "Connections: 500+"
+_LABEL_FIRST_RE = re.compile(rf"(?:{_LABELS})\s*:\s*{_NUMBER}", re.IGNORECASE)
+_MULTIPLIERS = {"k": 1_000, "m": 1_000_000}
+
+
+def parse_number(match: re.Match) -> tuple:
+    """(value, lower_bound) of a number match"""
+    value = float(re.sub(r"[, \u00a0]", "", match.group("number")))
+    suffix = (match.group("suffix") or "").lower()
+    value *= _MULTIPLIERS.get(suffix, 1)
+    return value, bool(match.group("plus"))
+
+
+def extract_metrics(text: str) -> dict:
+    """{metric: (value, lower_bound)} of the profile's own counters
+
+    The first occurrence of each metric wins: the profile's own counters come in
+    the top card and analytics, counts of other people's posts follow later.
+    """
+    found = {}
+    matches = list(_VALUE_FIRST_RE.finditer(text or "")) + list(_LABEL_FIRST_RE.finditer(text or ""))
+    for match in sorted(matches, key=lambda match: match.start()):
+        metric = next(name for name in METRICS if match.group(name))
+        if metric not in found:
+            found[metric] = parse_number(match)
+    return found
+
+
+def init_metrics_tables(db_path: str):
+    """Create profile_metrics and the scan log"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS profile_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            profile_key TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            value REAL NOT NULL,
+            lower_bound INTEGER NOT NULL DEFAULT 0,
+            observed_at TIMESTAMP NOT NULL,
+            source TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            UNIQUE (source, source_id, metric)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_profile_metrics_series
+        ON profile_metrics (metric, profile_key, observed_at)
+    ''')
+    # Texts already parsed, including those without any metric
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS profile_metric_scans (
+            source TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            PRIMARY KEY (source, source_id)
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def record_metrics(db_path: str, profile_key: str, text: str, source: str, source_id: int,
+                   observed_at: Optional[str] = None) -> dict:
+    """Parse and store the metrics of one snapshot; returns them"""
+    metrics = extract_metrics(text)
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(
+            '''
+            INSERT OR REPLACE INTO profile_metrics
+                (profile_key, metric, value, lower_bound, observed_at, source, source_id)
+            VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?)
+            ''',
+            [(profile_key, metric, value, int(lower_bound), observed_at, source, source_id)
+             for metric, (value, lower_bound) in metrics.items()]
+        )
+        conn.execute("INSERT OR IGNORE INTO profile_metric_scans (source, source_id) VALUES (?, ?)", (source, source_id))
+    conn.close()
+    return metrics
+
+
+def extract_pending(db_path: str = DB_PATH) -> int:
+    """Parse metrics of every snapshot not scanned yet; returns how many were scanned"""
+    init_metrics_tables(db_path)
+    # Series are per profile, so snapshots get their profile first
+    profile_identity.resolve_pending(db_path)
+    pending = snapshot_sources.pending_rows(db_path, "profile_metric_scans")
+    for source, source_id, text, profile_key, _, observed_at in pending:
+        record_metrics(db_path, profile_key, text, source, source_id, observed_at)
+    return len(pending)
+
+
+def load_series(db_path: str = DB_PATH) -> dict:
+    """All metric rows as arrays sorted by (metric, profile, time)"""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute('''
+        SELECT metric, profile_key, observed_at, value FROM profile_metrics
+        ORDER BY metric, profile_key, observed_at, id
+    ''').fetchall()
+    conn.close()
+    if not rows:
+        return {"metric": np.array([], dtype=object), "profile_key": np.array([], dtype=object),
+                "observed_at": np.array([], dtype="datetime64[s]"), "value": np.array([], dtype=float)}
+    metric, profile_key, observed_at, value = zip(*rows)
+    return {
+        "metric": np.array(metric, dtype=object),
+        "profile_key": np.array(profile_key, dtype=object),
+        # SQLite timestamps come as "YYYY-MM-DD HH:MM:SS" or ISO with fractions
+        "observed_at": np.array([moment[:19] for moment in observed_at], dtype="datetime64[s]"),
+        "value": np.array(value, dtype=float),
+    }
+
+
+def compute_trends(series: dict) -> dict:
+    """Per-step and per-series statistics of every (metric, profile) series at once
+
+    Returns step arrays aligned with the input (delta, rate_per_day, anomaly;
+    NaN/False at the first point of a series) and a "series" dict with one
+    entry per (metric, profile): first/last value, total delta and growth.
+    """
+    value = series["value"]
+    n = len(value)
+    if n == 0:
+        return {"delta": value, "rate_per_day": value, "anomaly": np.zeros(0, dtype=bool), "series": {}}
+
+    metric, profile_key = series["metric"], series["profile_key"]
+    # Input is sorted by (metric, profile), so a series starts where either changes
+    continues = np.r_[False, (metric[1:] == metric[:-1]) & (profile_key[1:] == profile_key[:-1])]
+    starts = np.flatnonzero(~continues)
+    ends = np.r_[starts[1:], n] - 1
+
+    previous = np.r_[np.nan, value[:-1]]
+    delta = np.where(continues, value - previous, np.nan)
+    seconds = np.r_[0, np.diff(series["observed_at"]).astype("timedelta64[s]").astype(float)]
+    days = np.where(continues, seconds / 86400, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate_per_day = np.where(days > 0, delta / days, np.nan)
+        log_change = np.where(continues, np.log1p(value) - np.log1p(np.nan_to_num(previous)), np.nan)
+
+    # Robust z-score of each step's log change against all steps of the same metric
+    anomaly = np.zeros(n, dtype=bool)
+    metric_starts = np.flatnonzero(np.r_[True, metric[1:] != metric[:-1]])
+    for start, end in zip(metric_starts, np.r_[metric_starts[1:], n]):
+        steps = np.zeros(n, dtype=bool)
+        steps[start:end] = continues[start:end]
+        if steps.sum() < 3:
+            continue
+        changes = log_change[steps]
+        median = np.median(changes)
+        mad = max(np.median(np.abs(changes - median)), 0.01)
+        z = 0.6745 * (changes - median) / mad
+        anomaly[steps] = (np.abs(z) > ANOMALY_Z) & (np.abs(changes) > np.log(ANOMALY_MIN_RATIO))
+
+    first, last = value[starts], value[ends]
+    span_days = (series["observed_at"][ends] - series["observed_at"][starts]).astype("timedelta64[s]").astype(float) / 86400
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = np.where(first > 0, (last - first) / first, np.nan)
+    anomalies = np.add.reduceat(anomaly.astype(int), starts)
+
+    summary = {
+        (metric_name, key): {"points": points, "first": first_value, "last": last_value, "delta": last_value - first_value,
+                             "growth": growth_value, "days": days_value, "anomalies": anomaly_count}
+        for metric_name, key, points, first_value, last_value, growth_value, days_value, anomaly_count in zip(
+            metric[starts], profile_key[starts], (ends - starts + 1).tolist(), first.tolist(), last.tolist(),
+            growth.tolist(), span_days.tolist(), anomalies.tolist()
+        )
+    }
+    return {"delta": delta, "rate_per_day": rate_per_day, "anomaly": anomaly, "series": summary}
+
+
+def print_report(db_path: str = DB_PATH):
+    """Print growth per profile and metric, and the anomalous steps"""
+    series = load_series(db_path)
+    trends = compute_trends(series)
+    print("📈 PROFILE METRICS")
+    print("=" * 80)
+    if not trends["series"]:
+        print("No metrics yet")
+        return
+    for (metric, profile_key), stats in sorted(trends["series"].items(), key=lambda item: (item[0][1], item[0][0])):
+        growth = f"{stats['growth'] * 100:+.1f}%" if np.isfinite(stats["growth"]) else "n/a"
+        print(f"{profile_key:<25} {metric:<20} {stats['first']:>12,.0f} → {stats['last']:>12,.0f} "
+              f"({growth}, {stats['points']} points over {stats['days']:.0f} days, {stats['anomalies']} anomalies)")
+
+    flagged = np.flatnonzero(trends["anomaly"])
+    if flagged.size:
+        print(f"\n⚠️  Anomalous steps ({flagged.size}):")
+        for index in flagged:
+            print(f"   {series['profile_key'][index]} {series['metric'][index]} at {series['observed_at'][index]}: "
+                  f"{series['value'][index] - trends['delta'][index]:,.0f} → {series['value'][index]:,.0f}")
+
+
+if __name__ == "__main__":
+    scanned = extract_pending()
+    print(f"🔢 Scanned {scanned} new snapshots for metrics\n")
+    print_report()
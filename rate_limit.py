@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Client-side pacing for OpenAI rate limits.
+
+OpenAI limits both requests and tokens per minute. A token bucket per limit
+lets a concurrent batch run at the allowed rate instead of bursting into
+429 responses and backing off.
+"""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at rate_per_minute"""
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float = 10.0):
+        self.rate = rate_per_minute / 60.0
+        # Up to burst_seconds worth of budget can be spent at once
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        """Wait until amount can be taken; requests larger than the bucket wait for a full bucket"""
+        amount = min(amount, self.capacity)
+        # The lock keeps waiters in arrival order, so large requests aren't starved by small ones
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def estimate_tokens(text: str, max_tokens: int = 0) -> int:
+    """Rough request size for TPM pacing: ~4 characters per token plus the completion limit"""
+    return len(text) // 4 + max_tokens
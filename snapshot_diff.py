@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+Snapshot-to-snapshot diffs, stored as a delta chain per profile.
+
+Consecutive OCR texts of a profile are mostly the same lines. Each new
+snapshot is diffed line by line against the profile's previous one
+(patience diff: lines unique to both sides anchor the alignment, Myers
+O(ND) diff fills the gaps) and stored as that delta; every
+KEYFRAME_INTERVAL-th snapshot, or one whose delta would be too large, is
+stored whole (zlib) as a keyframe. A text is rebuilt from the nearest
+keyframe plus the deltas after it, and "what changed" reports read the
+deltas directly.
+
+The chain is the source of truth for the texts: once a snapshot is archived
+and every backfill reading its text has handled it, compact_sources blanks
+full_text / response_text of its row, and readers go through source_text,
+which rebuilds a blanked text from the chain.
+"""
+
+import json
+import sqlite3
+import sys
+import zlib
+from bisect import bisect_left
+from typing import List, Optional
+
+import profile_identity
+import snapshot_sources
+from job_rules import section_name
+
+DB_PATH = 'image_analysis_results.db'
+
+# Every n-th snapshot of a profile is stored whole, bounding the rebuild chain
+KEYFRAME_INTERVAL = 20
+# A delta bigger than this share of the compressed text is stored as a keyframe instead
+MAX_DELTA_RATIO = 0.5
+# Edit distance beyond which Myers gives up and replaces the whole gap
+MAX_EDIT_DISTANCE = 2000
+# Tables of the backfills that read a row's original text; a row is compacted once it is in all of them
+TEXT_READERS = ("profile_snapshots", "snapshot_store", "profile_metric_scans", "activity_scans")
+
+
+def myers_diff(a: List[str], b: List[str]) -> List[tuple]:
+    """Shortest edit script between two line lists as ("=" | "-" | "+", line) pairs"""
+    n, m = len(a), len(b)
+    if not n or not m or set(a).isdisjoint(b):
+        return [("-", line) for line in a] + [("+", line) for line in b]
+
+    offset = n + m
+    v = [0] * (2 * offset + 2)
+    trace = []
+    for d in range(min(n + m, MAX_EDIT_DISTANCE) + 1):
+        trace.append(v[:])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x, y = x + 1, y + 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _backtrack(a, b, trace, offset, d)
+    return [("-", line) for line in a] + [("+", line) for line in b]
+
+
+def _backtrack(a: List[str], b: List[str], trace: List[list], offset: int, d: int) -> List[tuple]:
+    """Edit script from the saved Myers frontiers, walking back from the end"""
+    script = []
+    x, y = len(a), len(b)
+    for depth in range(d, 0, -1):
+        v = trace[depth]
+        k = x - y
+        if k == -depth or (k != depth and v[offset + k - 1] < v[offset + k + 1]):
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+        previous_x = v[offset + previous_k]
+        previous_y = previous_x - previous_k
+        while x > previous_x and y > previous_y:
+            x, y = x - 1, y - 1
+            script.append(("=", a[x]))
+        if x == previous_x:
+            y -= 1
+            script.append(("+", b[y]))
+        else:
+            x -= 1
+            script.append(("-", a[x]))
+    while x > 0 and y > 0:
+        x, y = x - 1, y - 1
+        script.append(("=", a[x]))
+    script.reverse()
+    return script
+
+
+def _unique_anchors(a: List[str], b: List[str]) -> List[tuple]:
+    """(i, j) of lines occurring once on each side, longest run in order on both"""
+    counts = {}
+    for index, line in enumerate(a):
+        seen = counts.get(line)
+        counts[line] = [index, None, 1 if seen is None else 2]
+    for index, line in enumerate(b):
+        entry = counts.get(line)
+        if entry is None or entry[2] != 1:
+            continue
+        if entry[1] is None:
+            entry[1] = index
+        else:
+            entry[2] = 2
+    pairs = sorted((i, j) for i, j, count in counts.values() if count == 1 and j is not None)
+
+    # Longest increasing subsequence of j (patience sorting)
+    tails, tail_index, previous = [], [], [None] * len(pairs)
+    for position, (_, j) in enumerate(pairs):
+        pile = bisect_left(tails, j)
+        if pile == len(tails):
+            tails.append(j)
+            tail_index.append(position)
+        else:
+            tails[pile] = j
+            tail_index[pile] = position
+        previous[position] = tail_index[pile - 1] if pile else None
+    anchors = []
+    position = tail_index[-1] if tail_index else None
+    while position is not None:
+        anchors.append(pairs[position])
+        position = previous[position]
+    anchors.reverse()
+    return anchors
+
+
+def patience_diff(a: List[str], b: List[str]) -> List[tuple]:
+    """Line diff aligned on unique lines, Myers between them"""
+    # Common prefix and suffix never need diffing
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a, end_b = end_a - 1, end_b - 1
+
+    script = [("=", line) for line in a[:start]]
+    middle_a, middle_b = a[start:end_a], b[start:end_b]
+    anchors = _unique_anchors(middle_a, middle_b)
+    if not anchors:
+        script += myers_diff(middle_a, middle_b)
+    else:
+        i = j = 0
+        for anchor_i, anchor_j in anchors + [(len(middle_a), len(middle_b))]:
+            script += patience_diff(middle_a[i:anchor_i], middle_b[j:anchor_j])
+            if anchor_i < len(middle_a):
+                script.append(("=", middle_a[anchor_i]))
+            i, j = anchor_i + 1, anchor_j + 1
+    script += [("=", line) for line in a[end_a:]]
+    return script
+
+
+def make_delta(old_text: str, new_text: str) -> dict:
+    """Delta from old to new: run-length ops plus the sections the change touches"""
+    old_lines, new_lines = old_text.splitlines(keepends=True), new_text.splitlines(keepends=True)
+    ops, sections = [], []
+    section = {"old": None, "new": None}
+    for tag, line in patience_diff(old_lines, new_lines):
+        name = section_name(line)
+        if tag != "+" and name:
+            section["old"] = name
+        if tag != "-" and name:
+            section["new"] = name
+        if tag != "=":
+            touched = section["new" if tag == "+" else "old"] or "header"
+            if touched not in sections:
+                sections.append(touched)
+        if ops and ops[-1][0] == tag:
+            if tag == "=":
+                ops[-1][1] += 1
+            else:
+                ops[-1][1].append(line)
+        else:
+            ops.append([tag, 1 if tag == "=" else [line]])
+    return {"ops": ops, "sections": sections}
+
+
+def apply_delta(old_text: str, delta: dict) -> str:
+    """Rebuild the new text from the old one and a delta"""
+    old_lines = old_text.splitlines(keepends=True)
+    result, position = [], 0
+    for tag, payload in delta["ops"]:
+        if tag == "=":
+            result += old_lines[position:position + payload]
+            position += payload
+        elif tag == "-":
+            position += len(payload)
+        else:
+            result += payload
+    return "".join(result)
+
+
+def init_snapshot_store(db_path: str):
+    """Create the snapshot store"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS snapshot_store (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            profile_key TEXT NOT NULL,
+            source TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            observed_at TIMESTAMP,
+            seq INTEGER NOT NULL,
+            keyframe BLOB,
+            delta BLOB,
+            raw_size INTEGER NOT NULL,
+            UNIQUE (source, source_id),
+            UNIQUE (profile_key, seq)
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def _compress(value: str) -> bytes:
+    return zlib.compress(value.encode("utf-8"), 9)
+
+
+def _decompress(blob: bytes) -> str:
+    return zlib.decompress(blob).decode("utf-8")
+
+
+def _rebuild(conn: sqlite3.Connection, profile_key: str, seq: int) -> str:
+    """Text of a profile's snapshot: latest keyframe at or before seq, then the deltas after it"""
+    key_seq, keyframe = conn.execute(
+        '''
+        SELECT seq, keyframe FROM snapshot_store
+        WHERE profile_key = ? AND seq <= ? AND keyframe IS NOT NULL
+        ORDER BY seq DESC LIMIT 1
+        ''',
+        (profile_key, seq)
+    ).fetchone()
+    text = _decompress(keyframe)
+    for (delta,) in conn.execute(
+        'SELECT delta FROM snapshot_store WHERE profile_key = ? AND seq > ? AND seq <= ? ORDER BY seq',
+        (profile_key, key_seq, seq)
+    ):
+        text = apply_delta(text, json.loads(_decompress(delta)))
+    return text
+
+
+def store_snapshot(db_path: str, profile_key: str, text: str, source: str, source_id: int,
+                   observed_at: Optional[str] = None) -> Optional[dict]:
+    """Append a snapshot to the profile's chain; returns its delta against the previous one (None for the first)"""
+    text = text or ""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute(
+            "SELECT 1 FROM snapshot_store WHERE source = ? AND source_id = ?", (source, source_id)
+        ).fetchone():
+            conn.execute("COMMIT")
+            return None
+        last = conn.execute(
+            'SELECT seq, keyframe IS NOT NULL FROM snapshot_store WHERE profile_key = ? ORDER BY seq DESC LIMIT 1',
+            (profile_key,)
+        ).fetchone()
+
+        delta, keyframe = None, None
+        if last is None:
+            seq = 0
+            keyframe = _compress(text)
+        else:
+            seq = last[0] + 1
+            delta = make_delta(_rebuild(conn, profile_key, last[0]), text)
+            packed = _compress(json.dumps(delta, ensure_ascii=False))
+            full = _compress(text)
+            if len(packed) > MAX_DELTA_RATIO * len(full):
+                # Mostly rewritten (e.g. another OCR prompt): line lists would cost more than the text itself
+                keyframe = full
+                summary = {"ops": [[tag, payload if tag == "=" else len(payload)] for tag, payload in delta["ops"]],
+                           "sections": delta["sections"], "rewritten": True}
+                packed = _compress(json.dumps(summary, ensure_ascii=False))
+            elif seq % KEYFRAME_INTERVAL == 0:
+                # Periodic keyframes keep their delta too, so change reports never rebuild texts
+                keyframe = full
+        conn.execute(
+            '''
+            INSERT INTO snapshot_store (profile_key, source, source_id, observed_at, seq, keyframe, delta, raw_size)
+            VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ?, ?)
+            ''',
+            (profile_key, source, source_id, observed_at, seq, keyframe,
+             packed if delta is not None else None, len(text.encode("utf-8")))
+        )
+        conn.execute("COMMIT")
+        return delta
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def snapshot_text(db_path: str, source: str, source_id: int) -> Optional[str]:
+    """Rebuilt text of a stored snapshot"""
+    conn = sqlite3.connect(db_path)
+    row = conn.execute(
+        "SELECT profile_key, seq FROM snapshot_store WHERE source = ? AND source_id = ?", (source, source_id)
+    ).fetchone()
+    text = _rebuild(conn, *row) if row else None
+    conn.close()
+    return text
+
+
+def latest_text(db_path: str, profile_key: str) -> Optional[str]:
+    """Rebuilt text of the profile's newest snapshot"""
+    conn = sqlite3.connect(db_path)
+    row = conn.execute(
+        "SELECT seq FROM snapshot_store WHERE profile_key = ? ORDER BY seq DESC LIMIT 1", (profile_key,)
+    ).fetchone()
+    text = _rebuild(conn, profile_key, row[0]) if row else None
+    conn.close()
+    return text
+
+
+def source_text(db_path: str, source: str, source_id: int, stored: Optional[str]) -> Optional[str]:
+    """Text of an analysis / bot row: its column while kept, rebuilt from the chain once compacted"""
+    if stored:
+        return stored
+    return snapshot_text(db_path, source, source_id) or stored
+
+
+def compact_sources(db_path: str = DB_PATH, source: Optional[str] = None, source_id: Optional[int] = None) -> int:
+    """Blank the original text of rows the chain rebuilds exactly; returns how many
+
+    Only rows every TEXT_READERS backfill has handled are touched, so those
+    backfills never see a blank text. Without source/source_id every such
+    row is compacted (the migration of existing databases).
+    """
+    conn = sqlite3.connect(db_path)
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if not tables.issuperset(TEXT_READERS):
+        conn.close()
+        return 0
+    handled = " AND ".join(
+        f"EXISTS (SELECT 1 FROM {table} r WHERE r.source = s.source AND r.source_id = s.source_id)"
+        for table in TEXT_READERS if table != "snapshot_store"
+    )
+    compacted = 0
+    for name in snapshot_sources.existing_sources(conn):
+        if source is not None and name != source:
+            continue
+        table, text_column, *_ = snapshot_sources.SOURCES[name]
+        rows = conn.execute(
+            f'''
+            SELECT t.id, t.{text_column}, s.profile_key, s.seq
+            FROM {table} t JOIN snapshot_store s ON s.source = ? AND s.source_id = t.id
+            WHERE t.{text_column} != '' AND {handled} AND (? IS NULL OR t.id = ?)
+            ''',
+            (name, source_id, source_id)
+        ).fetchall()
+        # A text goes only once the chain gives it back byte for byte
+        exact = [(row_id,) for row_id, text, profile_key, seq in rows if _rebuild(conn, profile_key, seq) == text]
+        conn.executemany(f"UPDATE {table} SET {text_column} = '' WHERE id = ?", exact)
+        compacted += len(exact)
+    conn.commit()
+    conn.close()
+    return compacted
+
+
+def what_changed(db_path: str, profile_key: str, since: Optional[str] = None) -> List[dict]:
+    """Changes between consecutive snapshots of a profile, read from the stored deltas
+
+    Each change lists the sections touched and the added/removed lines; for
+    rewritten snapshots ("rewritten": True) added/removed are line counts.
+    """
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        '''
+        SELECT source, source_id, observed_at, delta FROM snapshot_store
+        WHERE profile_key = ? AND delta IS NOT NULL AND (? IS NULL OR observed_at >= ?)
+        ORDER BY seq
+        ''',
+        (profile_key, since, since)
+    ).fetchall()
+    conn.close()
+
+    changes = []
+    for source, source_id, observed_at, blob in rows:
+        delta = json.loads(_decompress(blob))
+        change = {"source": source, "source_id": source_id, "observed_at": observed_at,
+                  "sections": delta["sections"], "rewritten": delta.get("rewritten", False)}
+        if change["rewritten"]:
+            # Only line counts are kept for rewrites
+            change["added"] = sum(payload for tag, payload in delta["ops"] if tag == "+")
+            change["removed"] = sum(payload for tag, payload in delta["ops"] if tag == "-")
+        else:
+            change["added"] = [line.rstrip("\n") for tag, payload in delta["ops"] if tag == "+" for line in payload]
+            change["removed"] = [line.rstrip("\n") for tag, payload in delta["ops"] if tag == "-" for line in payload]
+        if change["added"] or change["removed"]:
+            changes.append(change)
+    return changes
+
+
+def storage_stats(db_path: str) -> dict:
+    """Raw text bytes vs bytes stored, keyframe count"""
+    conn = sqlite3.connect(db_path)
+    snapshots, keyframes, raw, stored = conn.execute(
+        '''
+        SELECT COUNT(*), COUNT(keyframe), COALESCE(SUM(raw_size), 0),
+               COALESCE(SUM(LENGTH(keyframe)), 0) + COALESCE(SUM(LENGTH(delta)), 0)
+        FROM snapshot_store
+        '''
+    ).fetchone()
+    conn.close()
+    return {"snapshots": snapshots, "keyframes": keyframes, "raw_bytes": raw, "stored_bytes": stored,
+            "ratio": raw / stored if stored else None}
+
+
+def archive_pending(db_path: str = DB_PATH) -> int:
+    """Store every analysis / bot text not in the store yet, oldest first; returns how many"""
+    init_snapshot_store(db_path)
+    profile_identity.resolve_pending(db_path)
+    pending = snapshot_sources.pending_rows(db_path, "snapshot_store")
+    for source, source_id, text, profile_key, _, observed_at in pending:
+        store_snapshot(db_path, profile_key, text, source, source_id, observed_at)
+    return len(pending)
+
+
+def print_changes(db_path: str, profile_key: str):
+    """Print what changed between the profile's snapshots"""
+    changes = what_changed(db_path, profile_key)
+    print(f"📝 {profile_key}: {len(changes)} changed snapshots")
+    for change in changes:
+        print(f"\n🕒 {change['observed_at']} ({change['source']} #{change['source_id']}) "
+              f"sections: {', '.join(change['sections'])}")
+        if change["rewritten"]:
+            print(f"   rewritten: -{change['removed']} / +{change['added']} lines")
+            continue
+        for line in change["removed"]:
+            print(f"   - {line}")
+        for line in change["added"]:
+            print(f"   + {line}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "changes":
+        print_changes(DB_PATH, sys.argv[2])
+    else:
+        archived = archive_pending()
+        compacted = compact_sources()
+        if compacted:
+            # SQLite reuses the freed pages anyway; VACUUM hands them back to the filesystem now
+            conn = sqlite3.connect(DB_PATH)
+            conn.execute("VACUUM")
+            conn.close()
+        stats = storage_stats(DB_PATH)
+        print(f"🗃️  Archived {archived} snapshots | total {stats['snapshots']} ({stats['keyframes']} keyframes)")
+        print(f"🗜️  Compacted {compacted} source rows (text now read from the chain)")
+        if stats["ratio"]:
+            print(f"📦 {stats['raw_bytes']:,} bytes of text stored in {stats['stored_bytes']:,} ({stats['ratio']:.1f}x)")
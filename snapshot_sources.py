@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+The two sources of profile snapshots and their backfill queue.
+
+A snapshot is a successful row of analysis_results (source "analysis") or a
+bot result in file_parse_results (source "bot"). Every backfill (profile
+resolution, metrics, snapshot archive, activity) marks the rows it has
+handled in its own table keyed by (source, source_id); pending_rows finds
+the rows that table doesn't have yet.
+"""
+
+import sqlite3
+from typing import List
+
+# source -> (table, text column, file name column, capture time column, extra condition)
+SOURCES = {
+    "analysis": ("analysis_results", "response_text", "image_file", "created_at", "t.status = 'SUCCESS'"),
+    "bot": ("file_parse_results", "full_text", "file_name", "parsed_at", "1"),
+}
+
+
+def existing_sources(conn: sqlite3.Connection) -> List[str]:
+    """Sources whose table exists in the database"""
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [source for source, (table, *_) in SOURCES.items() if table in tables]
+
+
+def pending_rows(db_path: str, done_table: str) -> List[tuple]:
+    """Snapshots with no (source, source_id) row in done_table yet, oldest capture first
+
+    Rows are (source, source_id, text, profile_key, file_name, observed_at);
+    profile_key is "profile:<id>" once the snapshot is resolved (the file
+    name before that), so profile_snapshots must exist.
+    """
+    conn = sqlite3.connect(db_path)
+    pending = []
+    for source in existing_sources(conn):
+        table, text_column, file_column, time_column, condition = SOURCES[source]
+        pending += [(source,) + row for row in conn.execute(
+            f'''
+            SELECT t.id, t.{text_column}, COALESCE('profile:' || ps.profile_id, t.{file_column}),
+                   t.{file_column}, t.{time_column}
+            FROM {table} t
+            LEFT JOIN profile_snapshots ps ON ps.source = ? AND ps.source_id = t.id
+            LEFT JOIN {done_table} d ON d.source = ? AND d.source_id = t.id
+            WHERE {condition} AND d.source_id IS NULL
+            ''',
+            (source, source)
+        )]
+    conn.close()
+    # Chains and series follow capture order
+    return sorted(pending, key=lambda row: (row[5] or "", row[1]))
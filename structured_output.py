@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+JSON schemas for OpenAI structured outputs (response_format=json_schema).
+
+With strict schemas the model can only produce JSON of this shape, so the
+extraction results need no fence stripping or guesswork. Output cut off by
+max_tokens is still salvaged by the tolerant parser below.
+"""
+
+import json
+
+CURRENT_JOB_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "company": {"type": "string"},
+        "position": {"type": "string"},
+        "period": {"type": "string"},
+        "is_current": {"type": "boolean"}
+    },
+    "required": ["company", "position", "period", "is_current"],
+    "additionalProperties": False
+}
+
+# Same shape as extract_current_job_via_openai results: {"found": ..., "current_job": {...}}
+JOB_EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "found": {"type": "boolean"},
+        "current_job": {"anyOf": [CURRENT_JOB_SCHEMA, {"type": "null"}]}
+    },
+    "required": ["found", "current_job"],
+    "additionalProperties": False
+}
+
+# Several texts per request, one result per analysis_id
+PACKED_JOB_EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "analysis_id": {"type": "integer"},
+                    "found": {"type": "boolean"},
+                    "current_job": {"anyOf": [CURRENT_JOB_SCHEMA, {"type": "null"}]}
+                },
+                "required": ["analysis_id", "found", "current_job"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["results"],
+    "additionalProperties": False
+}
+
+# OCR and current job in one vision request
+OCR_WITH_JOB_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "full_text": {"type": "string"},
+        "found": {"type": "boolean"},
+        "current_job": {"anyOf": [CURRENT_JOB_SCHEMA, {"type": "null"}]}
+    },
+    "required": ["full_text", "found", "current_job"],
+    "additionalProperties": False
+}
+
+CURRENT_JOB_INSTRUCTIONS = (
+    "Current job: the position the person holds now. Look for keywords like "
+    "\"Present\", \"Current\", \"Founder\", \"CEO\", \"Head of\". Use the period as written. "
+    "If the current job can't be determined, set found to false and current_job to null."
+)
+
+
+def response_format(name: str, schema: dict) -> dict:
+    """response_format payload for a strict JSON schema"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": schema
+        }
+    }
+
+
+class IncrementalJSONParser:
+    """Tolerant JSON parser fed chunk by chunk (streamed or truncated output)
+
+    result() returns the value parsed so far: an unterminated string value is
+    closed, incomplete trailing members are dropped and open containers are
+    closed. Text around the JSON (code fences, chatter) is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = []
+        self.started = False
+        self.complete = False
+        # Closing characters for the open containers, innermost last
+        self.closers = []
+        # Per open container: True for an object expecting a key next
+        self.expect_key = []
+        self.in_string = False
+        self.string_is_key = False
+        self.escaped = False
+        self.length = 0
+        # (buffer length, closers) where the prefix plus closers is valid JSON
+        self.safe_point = None
+
+    def feed(self, chunk: str):
+        """Consume the next piece of text"""
+        for char in chunk:
+            if self.complete:
+                return
+            if not self.started:
+                if char not in "{[":
+                    continue
+                self.started = True
+            self._consume(char)
+
+    def _mark_safe(self, position: int):
+        self.safe_point = (position, "".join(reversed(self.closers)))
+
+    def _consume(self, char: str):
+        self.buffer.append(char)
+        self.length += 1
+
+        if self.in_string:
+            if self.escaped:
+                self.escaped = False
+            elif char == "\\":
+                self.escaped = True
+            elif char == '"':
+                self.in_string = False
+                if not self.string_is_key:
+                    self._mark_safe(self.length)
+            return
+
+        if char == '"':
+            self.in_string = True
+            self.string_is_key = bool(self.expect_key and self.expect_key[-1])
+            if self.string_is_key:
+                self.expect_key[-1] = False
+        elif char in "{[":
+            self.closers.append("}" if char == "{" else "]")
+            self.expect_key.append(char == "{")
+            self._mark_safe(self.length)
+        elif char in "}]":
+            self.closers.pop()
+            self.expect_key.pop()
+            self._mark_safe(self.length)
+            if not self.closers:
+                self.complete = True
+        elif char == ",":
+            # Everything before the comma is a complete member
+            self._mark_safe(self.length - 1)
+            if self.closers[-1] == "}":
+                self.expect_key[-1] = True
+
+    def result(self):
+        """Best-effort value of the text fed so far, or None"""
+        if not self.started:
+            return None
+        text = "".join(self.buffer)
+        if self.complete:
+            return json.loads(text)
+
+        candidates = []
+        if self.in_string and not self.string_is_key:
+            # Keep the partial string value; a dangling escape can't be closed
+            partial = text[:-1] if self.escaped else text
+            candidates.append(partial + '"' + "".join(reversed(self.closers)))
+        if self.safe_point:
+            position, closers = self.safe_point
+            candidates.append(text[:position] + closers)
+
+        for candidate in candidates:
+            try:
+                return json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+        return None
+
+
+def parse_tolerant(text: str):
+    """Parse model output that may be fenced, wrapped in prose or cut off; None if nothing is usable"""
+    parser = IncrementalJSONParser()
+    parser.feed(text or "")
+    try:
+        return parser.result()
+    except json.JSONDecodeError:
+        return None
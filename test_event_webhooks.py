@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Event webhook delivery test against a local HTTP sink.
+
+Produces job_change and new_activity events through the normal snapshot
+code paths, then delivers them with the webhook worker to a local server
+that checks signatures and rejects the first requests, so batching,
+retries, leases between two workers and lag metrics are exercised without
+any external service.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import activity_tracker
+import event_outbox
+import job_history
+
+SECRET = "local-test-secret"
+# Requests answered with HTTP 500 before the sink starts accepting
+FAILING_REQUESTS = 2
+
+# (signature ok, events) per request received by the sink
+RECEIVED = []
+
+
+class SinkHandler(BaseHTTPRequestHandler):
+    """Webhook subscriber: verifies the signature, fails the first requests"""
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        signature_ok = event_outbox.verify(
+            SECRET, self.headers.get(event_outbox.TIMESTAMP_HEADER, ""), body,
+            self.headers.get(event_outbox.SIGNATURE_HEADER, "")
+        )
+        RECEIVED.append((signature_ok, json.loads(body)["events"]))
+        status = 500 if len(RECEIVED) <= FAILING_REQUESTS else (200 if signature_ok else 401)
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def job(company, position):
+    """Extraction result with a found current job"""
+    return {"found": True, "current_job": {"company": company, "position": position, "period": "2024 - Present"}}
+
+
+def profile_text(posts):
+    """Minimal profile transcription with an Activity section"""
+    lines = ["**Test Person**", "Engineer at Example", "", "**Activity**", "120 followers"]
+    lines += posts
+    lines += ["", "**Experience**", "Engineer", "Example", "2024 - Present"]
+    return "\n".join(lines)
+
+
+def produce_events(db_path):
+    """Create snapshots that yield 3 job changes and 1 new activity event"""
+    job_history.init_history_table(db_path)
+    activity_tracker.init_activity_tables(db_path)
+    jobs = [job("Ecoisme", "CEO"), job("Ecoisme Inc.", "CEO"), job("Marble", "Founder"),
+            job("eEnergy", "Head of Laboratory"), job("UKIOT", "Co-Founder")]
+    changes = 0
+    for day, job_info in enumerate(jobs, start=1):
+        if job_history.record_snapshot(db_path, "profile:test", job_info, observed_at=f"2025-07-0{day} 10:00:00"):
+            changes += 1
+
+    # Baseline, same post re-read slightly differently, then one new post
+    snapshots = [
+        ["Test Person shared a post:", "Why smart grids need local storage...", "3w"],
+        ["Test Person shared a post:", "Why smart grids need local storage first", "3w"],
+        ["Test Person commented:", "Energy storage news from the pilot in Kyiv", "2d",
+         "Test Person shared a post:", "Why smart grids need local storage...", "3w"],
+    ]
+    for source_id, posts in enumerate(snapshots, start=1):
+        activity_tracker.track_posts(db_path, "profile:test", profile_text(posts), "bot", source_id,
+                                     observed_at=f"2025-07-0{source_id} 10:00:00")
+    return changes
+
+
+def test_event_webhooks():
+    """Deliver events to the local sink through failures and check what arrived"""
+    print("=" * 80)
+    print("EVENT WEBHOOK TEST (local HTTP sink)")
+    print("=" * 80)
+
+    sink = ThreadingHTTPServer(("127.0.0.1", 0), SinkHandler)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{sink.server_address[1]}/events"
+    print(f"📥 Sink listening on {url}")
+
+    # Short retry delays so the test doesn't wait for real backoff; restored afterwards
+    backoff_base = event_outbox.BACKOFF_BASE
+    event_outbox.BACKOFF_BASE = 0.1
+    db_path = os.path.join(tempfile.mkdtemp(), "events.db")
+    try:
+        event_outbox.add_subscriber(db_path, url, SECRET)
+        changes = produce_events(db_path)
+        print(f"🔄 Job changes recorded: {changes}")
+        assert changes == 3, "Ecoisme → Ecoisme Inc. is not a change, the other three are"
+
+        # Two workers on the same database, like two bot replicas
+        workers = [event_outbox.WebhookDeliveryWorker(db_path, batch_size=2) for _ in range(2)]
+        deadline = time.time() + 10
+        counts = [0, 0]
+
+        def deliver(index):
+            while sum(counts) < 4 and time.time() < deadline:
+                counts[index] += workers[index].deliver_once()
+                time.sleep(0.05)
+
+        threads = [threading.Thread(target=deliver, args=(index,)) for index in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        delivered = sum(counts)
+
+        accepted = [events for _, events in RECEIVED[FAILING_REQUESTS:]]
+        types = [event["type"] for events in accepted for event in events]
+        print(f"📡 Requests: {len(RECEIVED)} ({FAILING_REQUESTS} rejected), events delivered: {delivered}")
+        print(f"📨 Event types: {types}")
+        assert delivered == 4
+        assert all(signature_ok for signature_ok, _ in RECEIVED), "signature mismatch"
+        print("✅ Every request carried a valid signature")
+        assert all(len(events) <= 2 for events in accepted), "batch size exceeded"
+        assert types.count("job_change") == 3 and types.count("new_activity") == 1
+        ids = [event["id"] for events in accepted for event in events]
+        assert len(ids) == len(set(ids)), "event delivered twice"
+        assert ids == sorted(ids), "events delivered out of order"
+        print("✅ Failed batches retried, events delivered once, in order and batched by two workers")
+
+        stats = event_outbox.delivery_stats(db_path)
+        print(event_outbox.format_stats(stats))
+        assert stats["pending"] == 0 and stats["failed"] == 0 and stats["delivered"] == 4
+        assert stats["lag_p50_ms"] is not None
+        print("✅ Delivery lag recorded")
+    finally:
+        event_outbox.BACKOFF_BASE = backoff_base
+        sink.shutdown()
+
+    print("\n" + "=" * 80)
+    print("TEST COMPLETED")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    test_event_webhooks()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Strip text merging test for image_tiling.merge_tile_texts.
+
+Neighbouring strips transcribe the overlap twice; the merge must drop the
+repeated lines (whatever markdown each strip put around them), keep both
+texts when there is no overlap, and not mistake a repeated short line, or
+a single line away from the tile edges, for one.
+"""
+
+import image_tiling
+
+
+def test_image_tiling():
+    """Merge overlapping and non-overlapping strip texts"""
+    print("=" * 80)
+    print("TILE MERGE TEST")
+    print("=" * 80)
+
+    upper = "Jane Doe\nProduct Manager at Acme\n**Experience**\nSenior Engineer\nAcme Corp · Full-time\n2019 - Present"
+    lower = "- Senior Engineer\nAcme Corp · Full-time\n2019 - Present\nJunior Engineer\nInitech"
+    merged = image_tiling.merge_tile_texts([upper, lower])
+    assert merged.splitlines() == upper.splitlines() + ["Junior Engineer", "Initech"], merged
+    print("✅ Overlap lines kept once (upper strip's version), markdown differences ignored")
+
+    # The upper strip's last line is cut by the tile edge; the lower strip's full copy replaces it
+    merged = image_tiling.merge_tile_texts([
+        "Jane Doe\nSenior Engineer\nAcme Corp · Full-time\n2019 - Pre",
+        "Senior Engineer\nAcme Corp · Full-time\n2019 - Present\nJunior Engineer",
+    ])
+    assert merged.splitlines() == ["Jane Doe", "Senior Engineer", "Acme Corp · Full-time",
+                                   "2019 - Present", "Junior Engineer"], merged
+    print("✅ A line cut by the tile edge is replaced by the lower strip's copy")
+
+    # Three strips chain
+    merged = image_tiling.merge_tile_texts([
+        "Line one of the page\nLine two of the page\nLine three",
+        "Line two of the page\nLine three\nLine four of the page\nLine five",
+        "Line four of the page\nLine five\nLine six",
+    ])
+    assert merged.splitlines() == ["Line one of the page", "Line two of the page", "Line three",
+                                   "Line four of the page", "Line five", "Line six"], merged
+    print("✅ Three strips merge in order")
+
+    # No shared lines: nothing is dropped
+    merged = image_tiling.merge_tile_texts(["About\nI build things", "Education\nMIT"])
+    assert merged.splitlines() == ["About", "I build things", "Education", "MIT"], merged
+    # A short repeated line ("Posts") is not evidence of an overlap
+    merged = image_tiling.merge_tile_texts(["Activity\nPosts\nFirst post text", "Posts\nSecond post text"])
+    assert merged.splitlines() == ["Activity", "Posts", "First post text", "Posts", "Second post text"], merged
+    print("✅ Strips without a real overlap are concatenated")
+
+    # One long matching line only counts where the overlap must be: the end of the upper strip, the start of the lower
+    repeated = "Senior Engineer at Acme Corp"
+    merged = image_tiling.merge_tile_texts([f"About\n{repeated}\nLed the platform team\nSkills\nPython\nSQL\nDocker",
+                                            f"Activity\nReposted\nGreat talk\nLiked\n{repeated}\nNew role"])
+    assert merged.count(repeated) == 2, merged
+    merged = image_tiling.merge_tile_texts([f"About\nI build things\n{repeated}", f"{repeated}\nLed the platform team"])
+    assert merged.splitlines() == ["About", "I build things", repeated, "Led the platform team"], merged
+    print("✅ A single matching line away from the tile edges is not taken for the overlap")
+
+    assert image_tiling.merge_tile_texts([]) == ""
+    assert image_tiling.merge_tile_texts([None, "Only text"]) == "Only text"
+    assert image_tiling.merge_tile_texts(["Only text", None]) == "Only text"
+    print("✅ Empty strips are skipped")
+
+    print("\n" + "=" * 80)
+    print("TEST COMPLETED")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    test_image_tiling()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Normalization and trigram clustering test for job_normalize.
+
+Company and position spellings that differ only in case, legal suffix,
+punctuation or an OCR typo must land in one group; different values must
+not, and exact grouping (fuzzy=False) must only merge equal keys.
+"""
+
+from job_normalize import TrigramClusterer, fold_text, group_values, normalize_company, normalize_position
+
+
+def test_job_normalize():
+    """Fold, normalize and cluster company and position values"""
+    print("=" * 80)
+    print("JOB NORMALIZE TEST")
+    print("=" * 80)
+
+    assert fold_text("  Café & Co.  ") == "cafe and co"
+    assert fold_text("O'Neil—Smith") == "oneil smith"
+    assert fold_text(None) == ""
+    assert normalize_company("Google LLC") == normalize_company("google, inc.") == normalize_company("Google")
+    assert normalize_position("CEO") == normalize_position("Chief Executive Officer")
+    assert normalize_position("Co-Founder") == normalize_position("cofounder")
+    print("✅ Case, accents, legal suffixes and title aliases normalize to one key")
+
+    groups = group_values(
+        [(1, "Google"), (2, "Google LLC"), (3, "Gooogle"), (4, "Microsoft"), (5, "google inc."), (6, "  "), (7, "Microsoft Corp")],
+        normalize_company
+    )
+    assert groups == [("Google", [1, 2, 3, 5]), ("Microsoft", [4, 7])], groups
+    print(f"✅ Fuzzy company groups: {groups}")
+
+    groups = group_values([(1, "CEO"), (2, "Chief Executive Officer"), (3, "Co-Founder"), (4, "cofounder"),
+                           (5, "Co founder & CEO")], normalize_position, fuzzy=False)
+    assert groups == [("CEO", [1, 2]), ("Co-Founder", [3, 4]), ("Co founder & CEO", [5])], groups
+    print(f"✅ Exact position groups: {groups}")
+
+    clusterer = TrigramClusterer()
+    first = clusterer.add("acme robotics", "Acme Robotics")
+    assert clusterer.add("acme robotcs", "Acme Robotcs") == first
+    assert clusterer.add("acme robotics", "Acme Robotics") == first
+    assert clusterer.add("initech") != first
+    assert clusterer.label(first) == "Acme Robotics"
+    # OCR confusions ("rn" read for "m") still cluster
+    assert clusterer.add("rnarble") == clusterer.add("marble")
+    exact = TrigramClusterer(float("inf"))
+    assert exact.add("acme robotics") != exact.add("acme robotcs")
+    assert exact.add("acme robotics") == 0
+    print("✅ Clusterer merges typos and OCR confusions, keeps distinct keys apart, exact mode only equal keys")
+
+    print("\n" + "=" * 80)
+    print("TEST COMPLETED")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    test_job_normalize()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Rule-based current job extraction on the sample analyses.
+
+Every sample transcription in create_analysis_database.py is run through
+job_rules.extract_current_job and compared with the job it shows, so a
+regex change that loses or mis-splits an Experience entry shows up here.
+"""
+
+import job_rules
+from create_analysis_database import ANALYSIS_RESULTS
+
+# analysis_id -> (company, position, period) the rules must read; None where no job is found
+EXPECTED = {
+    1: ("Marble", "Founder", "April 2021 - Present"),
+    # The running period is found but not its title and company: left to the LLM
+    2: None,
+    3: ("Road to Product-Market-Fit", "Advisor", "Jan 2020 - Present"),
+    4: ("PLG Ventures", "Administrator", "Jan 2020 - Present"),
+    # Failed analyses (policy refusal, HTTP error)
+    5: None,
+    6: ("Ecoisme", "Co-Founder, CEO", "2012 - Present"),
+    7: None,
+    8: ("Public Organization for Families", "Administrator", "Oct 2019 - Present"),
+    9: ("Tempest (Energy & Environment)", "Advisor", "Aug 2022 – Present"),
+    10: ("IAS: Blockchain tech for banks", "Administrator", "Nov 2017 - Present"),
+}
+
+
+def test_job_rules():
+    """Current job of each sample, plus edge cases without an Experience section"""
+    print("=" * 80)
+    print("JOB RULES TEST")
+    print("=" * 80)
+
+    for row in ANALYSIS_RESULTS:
+        result = job_rules.extract_current_job(row["response_text"])
+        expected = EXPECTED[row["analysis_id"]]
+        if expected is None:
+            assert not result["found"], f"#{row['analysis_id']}: {result}"
+            continue
+        job = result["current_job"]
+        assert result["found"] and (job["company"], job["position"], job["period"]) == expected, \
+            f"#{row['analysis_id']}: {result}"
+        assert 0.8 <= result["confidence"] <= 1.0, f"#{row['analysis_id']}: {result}"
+        print(f"✅ #{row['analysis_id']}: {job['position']} @ {job['company']} ({result['confidence']})")
+
+    for text in ["", None, "Jane Doe\nProduct Manager", "**Experience**\nNothing but noise here"]:
+        assert not job_rules.extract_current_job(text)["found"], repr(text)
+    print("✅ Texts without a running Experience entry find no job")
+
+    assert job_rules.section_name("**Experience:**") == "experience"
+    assert job_rules.section_name("[Education]") == "education"
+    assert job_rules.section_name("Experience at Acme") is None
+    print("✅ Section headers recognised in their markdown variants")
+
+    print("\n" + "=" * 80)
+    print("TEST COMPLETED")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    test_job_rules()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate cache test for minhash_cache.
+
+Signatures of the same profile transcribed twice must be close and those
+of different texts far apart; the cache must find a stored near-duplicate
+only with the same top Experience entry, survive a reload from SQLite,
+and record reuse audits.
+"""
+
+import os
+import tempfile
+
+import minhash_cache
+from create_analysis_database import ANALYSIS_RESULTS
+
+
+def test_minhash_cache():
+    """Signatures, LSH lookups, persistence and audits"""
+    print("=" * 80)
+    print("MINHASH CACHE TEST")
+    print("=" * 80)
+
+    texts = [row["response_text"] for row in ANALYSIS_RESULTS if row["status"] == "SUCCESS"]
+    text = texts[0]
+    # The same transcription with a few OCR differences
+    variant = text.replace("connections", "conections").replace("Smart Grids", "Smart Grid", 1) + "\nSee more"
+    unrelated = "Weekly menu\n" + "\n".join(f"Day {day}: soup, salad and bread" for day in range(7))
+
+    sig, variant_sig, unrelated_sig = map(minhash_cache.signature, (text, variant, unrelated))
+    assert minhash_cache.similarity(sig, minhash_cache.signature(text)) == 1.0
+    assert minhash_cache.THRESHOLD <= minhash_cache.similarity(sig, variant_sig) < 1.0
+    assert minhash_cache.similarity(sig, unrelated_sig) < 0.2
+    assert minhash_cache.signature("").shape == (minhash_cache.NUM_PERM,)
+    print(f"✅ Similarity: variant {minhash_cache.similarity(sig, variant_sig):.2f}, "
+          f"unrelated {minhash_cache.similarity(sig, unrelated_sig):.2f}")
+
+    job = {"found": True, "current_job": {"company": "Marble", "position": "Founder"}}
+    entry = minhash_cache.top_entry(text)
+    assert entry and minhash_cache.top_entry(unrelated) == ""
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "cache.db")
+        cache = minhash_cache.MinHashCache(db_path)
+        assert cache.query(sig, entry) is None
+
+        cache.add_pending(1, sig, entry)
+        assert cache.query(variant_sig, entry)[0] == 1 and cache.job(1) is None
+        cache.discard(1)
+        assert cache.query(variant_sig, entry) is None
+        print("✅ Pending entries are found by in-batch duplicates and dropped on failure")
+
+        cache.store(1, sig, job, entry)
+        match = cache.query(variant_sig, entry)
+        assert match[0] == 1 and match[1] >= minhash_cache.THRESHOLD
+        assert cache.query(variant_sig, entry, exclude=1) is None
+        # A changed top Experience entry (new job) must not reuse the old result
+        assert cache.query(variant_sig, "another company founder 2024 present") is None
+        assert cache.query(unrelated_sig, "") is None
+        print("✅ Stored results are reused only with the same top Experience entry")
+
+        reloaded = minhash_cache.MinHashCache(db_path)
+        assert reloaded.query(variant_sig, entry)[0] == 1 and reloaded.job(1) == job
+        print("✅ Cache reloads from SQLite")
+
+        assert reloaded.record_audit(2, 1, match[1], job, {"found": True, "current_job": {"company": "marble ", "position": "FOUNDER"}})
+        assert not reloaded.record_audit(3, 1, match[1], job, {"found": True, "current_job": {"company": "Acme", "position": "Founder"}})
+        assert reloaded.audit_stats() == (2, 1)
+        print("✅ Audits record agreement")
+
+    assert minhash_cache.same_job({"found": False}, {"found": False, "current_job": None})
+    assert not minhash_cache.same_job({"found": False}, job)
+    print("✅ same_job compares found, company and position")
+
+    print("\n" + "=" * 80)
+    print("TEST COMPLETED")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    test_minhash_cache()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Voting test for ocr_consensus.merge_passes.
+
+Three transcriptions of one screenshot, each with its own misreading, must
+merge into the reading most passes agree on, report the disputed lines and
+fields, and vote the current job; identical passes are fully consistent.
+"""
+
+import ocr_consensus
+
+PASSES = [
+    "Jane Doe\nProduct Manager\n9,004 followers\n\nExperience\nCEO at Acme\n2019 - Present",
+    "Jane Doe\nProduct Manaqer\n9,004 followers\n\nExperience\nCEO at Acme\n2019 - Present",
+    "Jane Doe\nProduct Manager\n9,064 followers\n\nExperience\nCEO at Acme\n2019 - Present\nSee more",
+]
+
+
+def job(company, position):
+    return {"found": True, "current_job": {"company": company, "position": position, "period": None, "is_current": True}}
+
+
+def test_ocr_consensus():
+    """Merge passes line by line and vote fields"""
+    print("=" * 80)
+    print("OCR CONSENSUS TEST")
+    print("=" * 80)
+
+    report = ocr_consensus.merge_passes(PASSES)
+    assert report["text"] == PASSES[0], report["text"]
+    assert report["passes"] == 3
+    disputed = {item["line"]: item["support"] for item in report["disputed"]}
+    assert disputed == {"See more": 1 / 3, "Product Manager": 2 / 3, "9,004 followers": 2 / 3}, disputed
+    assert report["fields"]["followers"] == {"value": 9004.0, "agreement": 2 / 3}
+    assert report["fields"]["name"] == {"value": "Jane Doe", "agreement": 1.0}
+    assert 0.8 <= report["consistency"] < 1.0
+    print(f"✅ Misreads outvoted, a line only one pass saw dropped: {ocr_consensus.format_report(report)}")
+
+    report = ocr_consensus.merge_passes([PASSES[0]] * 3)
+    assert report["text"] == PASSES[0] and report["consistency"] == 1.0 and not report["disputed"]
+    print("✅ Identical passes are fully consistent")
+
+    report = ocr_consensus.merge_passes(PASSES, [job("Acme", "CEO"), job("ACME Inc.", "Chief Executive Officer"), job("Initech", "CEO")])
+    assert report["job_info"]["current_job"]["company"] == "Acme"
+    print("✅ Current job voted on normalized company and position")
+
+    # Passes with nothing in common are not merged line by line: one of them is kept whole
+    unrelated = ["one two\nthree four", "five six\nseven eight", "nine ten\neleven twelve"]
+    report = ocr_consensus.merge_passes(unrelated)
+    assert report["text"] in unrelated and report["consistency"] < ocr_consensus.OCR_CONSENSUS_MIN, report
+    print("✅ Unrelated passes fall back to one whole pass with low consistency")
+
+    assert ocr_consensus.needs_more_passes(0.5, 3) == (3 < ocr_consensus.OCR_CONSENSUS_MAX_PASSES)
+    assert not ocr_consensus.needs_more_passes(1.0, 1)
+    print("✅ More passes only for weak consensus")
+
+    print("\n" + "=" * 80)
+    print("TEST COMPLETED")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    test_ocr_consensus()
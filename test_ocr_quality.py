@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Scoring test for ocr_quality.score_text.
+
+Checks that the sample profile transcriptions pass, that refusals, empty
+and looping output fail, and that short texts are only penalised (and
+section coverage only counted) when they are profile texts.
+"""
+
+import ocr_quality
+from create_analysis_database import ANALYSIS_RESULTS
+
+
+def test_ocr_quality():
+    """Score sample transcriptions and hand-made edge cases"""
+    print("=" * 80)
+    print("OCR QUALITY TEST")
+    print("=" * 80)
+
+    profiles = [row["response_text"] for row in ANALYSIS_RESULTS if row["status"] == "SUCCESS"]
+    for text in profiles:
+        quality = ocr_quality.score_text(text)
+        assert quality["profile"] and not ocr_quality.needs_rerun(quality, 0), ocr_quality.format_quality(quality)
+    print(f"✅ {len(profiles)} sample profiles pass without a re-run")
+
+    # A previous snapshot adds the prior component; the same text matches itself fully
+    quality = ocr_quality.score_text(profiles[0], prior_text=profiles[0])
+    assert quality["prior"] == 1.0 and quality["coverage"] == 1.0
+    print(f"✅ Against its own snapshot: {ocr_quality.format_quality(quality)}")
+
+    # A short clean text from a non-profile image is not penalised for length or missing sections
+    menu = "Espresso 2.50\nCappuccino 3.20\nOpening hours 8-18"
+    quality = ocr_quality.score_text(menu)
+    assert not quality["profile"] and quality["coverage"] is None and quality["numeric"] is None
+    assert not ocr_quality.needs_rerun(quality, 0), ocr_quality.format_quality(quality)
+    print(f"✅ Short non-profile text: {ocr_quality.format_quality(quality)}")
+
+    # The same length with profile markers is a truncated profile and is re-run
+    short_profile = "Jane Doe\nProduct Manager\n500+ connections"
+    quality = ocr_quality.score_text(short_profile)
+    assert quality["profile"] and ocr_quality.needs_rerun(quality, 0), ocr_quality.format_quality(quality)
+    print(f"✅ Short profile text: {ocr_quality.format_quality(quality)}")
+
+    # With a previous snapshot any text is judged as a profile
+    quality = ocr_quality.score_text(menu, prior_text=profiles[0])
+    assert quality["profile"] and ocr_quality.needs_rerun(quality, 0), ocr_quality.format_quality(quality)
+    print(f"✅ Short text against a snapshot: {ocr_quality.format_quality(quality)}")
+
+    for label, text in [
+        ("refusal", "I'm sorry, I can't help with identifying people in images."),
+        ("empty", ""),
+        ("none", None),
+    ]:
+        quality = ocr_quality.score_text(text)
+        assert quality["score"] == 0.0, f"{label}: {quality}"
+    print("✅ Refusals and empty output score 0")
+
+    looping = "\n".join(["Experience", "Senior Engineer at Acme 2019 - Present"] + ["Led the platform team"] * 40)
+    quality = ocr_quality.score_text(looping)
+    assert quality["repetition"] < 0.5 and ocr_quality.needs_rerun(quality, 0), ocr_quality.format_quality(quality)
+    print(f"✅ Looping output: {ocr_quality.format_quality(quality)}")
+
+    garbage = "Experience\n" + " ".join(["#$%&", "@@!!", "ab12", "�x�"] * 20)
+    quality = ocr_quality.score_text(garbage)
+    assert quality["garbage"] < 0.5 and ocr_quality.needs_rerun(quality, 0), ocr_quality.format_quality(quality)
+    print(f"✅ Symbol soup: {ocr_quality.format_quality(quality)}")
+
+    print("\n" + "=" * 80)
+    print("TEST COMPLETED")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    test_ocr_quality()
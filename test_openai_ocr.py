@@ -9,6 +9,8 @@ import json
 import os
 from pathlib import Path
 
+import ocr_quality
+
 # OpenAI configuration (from env)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
@@ -92,8 +94,10 @@ def test_openai_vision(prompt_text, prompt_index):
                 print(content)
                 print("-" * 50)
                 
-                # Quality heuristic example
-                if len(content) > 20 and ("text" in content.lower() or "image" in content.lower()):
+                # Local quality score, the same one that gates re-runs in the bot
+                quality = ocr_quality.score_text(content)
+                print(f"🩺 Quality: {ocr_quality.format_quality(quality)}")
+                if quality["score"] >= ocr_quality.OCR_QUALITY_MIN:
                     print("🎯 GOOD RESULT!")
                     return True, content
                 else:
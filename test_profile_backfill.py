@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Backfill test on a database with both analysis_results and file_parse_results.
+
+Builds the sample analyses with create_analysis_database.py, adds bot rows
+with the bot's file_parse_results schema, then runs every *_pending backfill
+(profile resolution, metrics, snapshot archive, activity) over both sources,
+then compacts the texts into the snapshot chain and reads them back.
+"""
+
+import os
+import sqlite3
+import tempfile
+
+import activity_tracker
+import create_analysis_database
+import profile_identity
+import profile_metrics
+import snapshot_diff
+
+DB_PATH = 'image_analysis_results.db'
+
+
+def create_bot_rows(db_path):
+    """file_parse_results as main.py creates it, with two saved results"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS file_parse_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_name TEXT NOT NULL,
+            full_text TEXT NOT NULL,
+            parsed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    texts = [(file_name, text) for file_name, text in conn.execute(
+        "SELECT image_file, response_text FROM analysis_results WHERE status = 'SUCCESS' ORDER BY id LIMIT 2"
+    )]
+    conn.executemany("INSERT INTO file_parse_results (file_name, full_text) VALUES (?, ?)", texts)
+    conn.commit()
+    conn.close()
+    return len(texts)
+
+
+def read_texts(db_path):
+    """(source, id, stored text) of every snapshot row"""
+    conn = sqlite3.connect(db_path)
+    rows = [("analysis",) + row for row in conn.execute(
+        "SELECT id, response_text FROM analysis_results WHERE status = 'SUCCESS' ORDER BY id"
+    )]
+    rows += [("bot",) + row for row in conn.execute("SELECT id, full_text FROM file_parse_results ORDER BY id")]
+    conn.close()
+    return rows
+
+
+def count(db_path, query):
+    conn = sqlite3.connect(db_path)
+    value = conn.execute(query).fetchone()[0]
+    conn.close()
+    return value
+
+
+def test_profile_backfill():
+    """Every backfill reads both sources without errors"""
+    print("=" * 80)
+    print("PROFILE BACKFILL TEST (analysis_results + file_parse_results)")
+    print("=" * 80)
+
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    try:
+        create_analysis_database.create_database()
+        create_analysis_database.insert_analysis_data()
+        analyses = count(DB_PATH, "SELECT COUNT(*) FROM analysis_results WHERE status = 'SUCCESS'")
+        bot_rows = create_bot_rows(DB_PATH)
+        print(f"🗄️ {analyses} analyses, {bot_rows} bot results")
+
+        resolved = profile_identity.resolve_pending(DB_PATH)
+        print(f"👤 Resolved profiles for {resolved} snapshots")
+        snapshots = count(DB_PATH, "SELECT COUNT(*) FROM profile_snapshots")
+        assert snapshots == analyses + bot_rows, "every snapshot with a name gets a profile"
+        assert count(DB_PATH, "SELECT COUNT(*) FROM profile_snapshots WHERE source = 'bot'") == bot_rows
+        assert count(DB_PATH, "SELECT COUNT(*) FROM profiles") == 1, "all samples show the same person"
+
+        scanned = profile_metrics.extract_pending(DB_PATH)
+        archived = snapshot_diff.archive_pending(DB_PATH)
+        tracked = activity_tracker.track_pending(DB_PATH)
+        print(f"🔢 {scanned} scanned for metrics, 📝 {archived} archived, 📰 {tracked} scanned for posts")
+        assert scanned == archived == tracked == analyses + bot_rows
+
+        # A second run finds nothing left to do
+        assert profile_identity.resolve_pending(DB_PATH) == 0
+        assert profile_metrics.extract_pending(DB_PATH) == 0
+        print("✅ Backfills cover both sources and are idempotent")
+
+        originals = read_texts(DB_PATH)
+        compacted = snapshot_diff.compact_sources(DB_PATH)
+        print(f"🗜️ Compacted {compacted} rows")
+        assert compacted == analyses + bot_rows
+        assert all(text == "" for _, _, text in read_texts(DB_PATH)), "compacted rows keep no text"
+        for source, source_id, text in originals:
+            assert snapshot_diff.source_text(DB_PATH, source, source_id, "") == text, f"{source} #{source_id} not rebuilt"
+        assert snapshot_diff.compact_sources(DB_PATH) == 0
+        assert activity_tracker.track_pending(DB_PATH) == 0 and snapshot_diff.archive_pending(DB_PATH) == 0
+        print("✅ Texts are compacted into the chain and rebuilt exactly")
+    finally:
+        os.chdir(cwd)
+
+    print("\n" + "=" * 80)
+    print("TEST COMPLETED")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    test_profile_backfill()
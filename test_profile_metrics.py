@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Counter extraction test for profile_metrics.extract_metrics.
+
+Checks thousands separators, k/M suffixes and "500+" lower bounds, that
+counters of other people are skipped, and that numbers on separate lines
+are never joined into one.
+"""
+
+import profile_metrics
+
+
+def test_profile_metrics():
+    """Extract counters from short profile fragments"""
+    print("=" * 80)
+    print("PROFILE METRICS TEST")
+    print("=" * 80)
+
+    cases = [
+        ("9,004 followers · 500+ connections", {"followers": (9004.0, False), "connections": (500.0, True)}),
+        ("1 234 followers", {"followers": (1234.0, False)}),
+        ("1\u00a0234 followers", {"followers": (1234.0, False)}),
+        ("12.5K followers", {"followers": (12500.0, False)}),
+        ("Connections: 500+", {"connections": (500.0, True)}),
+        ("211 search appearances\n83 article followers", {"search_appearances": (211.0, False)}),
+        # A line break is not a thousands separator
+        ("Posts 12\n345 followers", {"followers": (345.0, False)}),
+        ("Posts 12\r\n345 followers", {"followers": (345.0, False)}),
+    ]
+    for text, expected in cases:
+        found = profile_metrics.extract_metrics(text)
+        print(f"   {text!r} -> {found}")
+        assert found == expected, f"{text!r}: expected {expected}, got {found}"
+    print("✅ Counters extracted")
+
+    print("\n" + "=" * 80)
+    print("TEST COMPLETED")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    test_profile_metrics()
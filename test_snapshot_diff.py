@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Diff and delta round-trip test for snapshot_diff.
+
+myers_diff and patience_diff must turn one line list into the other, and
+make_delta/apply_delta must rebuild the new text exactly (line endings,
+missing final newline, empty texts), on the sample transcriptions and on
+hand-made edits.
+"""
+
+import random
+
+import snapshot_diff
+from create_analysis_database import ANALYSIS_RESULTS
+
+
+def apply_script(script):
+    """(old lines, new lines) an edit script describes"""
+    old = [line for tag, line in script if tag != "+"]
+    new = [line for tag, line in script if tag != "-"]
+    return old, new
+
+
+def test_snapshot_diff():
+    """Round-trip diffs and deltas"""
+    print("=" * 80)
+    print("SNAPSHOT DIFF TEST")
+    print("=" * 80)
+
+    pairs = [
+        ("", ""),
+        ("", "one\ntwo\n"),
+        ("one\ntwo\n", ""),
+        ("a\nb\nc\n", "a\nb\nc"),
+        ("a\nb\nc", "a\nx\nc\n"),
+        ("a\r\nb\r\n", "a\r\nc\r\n"),
+        ("same\nsame\nsame\n", "same\nother\nsame\n"),
+        ("**Experience**\nFounder\nMarble\n", "**Experience**\nCEO\nMarble\nAdvisor\n"),
+    ]
+    texts = [row["response_text"] for row in ANALYSIS_RESULTS if row["status"] == "SUCCESS"]
+    pairs += list(zip(texts, texts[1:]))
+
+    # Random line edits of a sample: deletions, insertions, duplicates and swaps
+    rng = random.Random(42)
+    base = texts[0].splitlines(keepends=True)
+    for _ in range(30):
+        lines = base[:]
+        for _ in range(rng.randint(1, 8)):
+            position = rng.randrange(len(lines) + 1)
+            action = rng.choice(["insert", "delete", "duplicate", "swap"])
+            if action == "insert":
+                lines.insert(position, f"new line {rng.random()}\n")
+            elif lines and action == "delete":
+                del lines[min(position, len(lines) - 1)]
+            elif lines and action == "duplicate":
+                lines.insert(position, rng.choice(lines))
+            elif len(lines) > 1:
+                i, j = rng.sample(range(len(lines)), 2)
+                lines[i], lines[j] = lines[j], lines[i]
+        pairs.append((texts[0], "".join(lines)))
+
+    for old_text, new_text in pairs:
+        old_lines, new_lines = old_text.splitlines(keepends=True), new_text.splitlines(keepends=True)
+        for diff in (snapshot_diff.myers_diff, snapshot_diff.patience_diff):
+            assert apply_script(diff(old_lines, new_lines)) == (old_lines, new_lines), diff.__name__
+        delta = snapshot_diff.make_delta(old_text, new_text)
+        assert snapshot_diff.apply_delta(old_text, delta) == new_text
+    print(f"✅ {len(pairs)} text pairs round-trip through both diffs and make_delta/apply_delta")
+
+    # Myers finds a shortest script (the example from the paper has D = 5)
+    script = snapshot_diff.myers_diff(list("abcabba"), list("cbabac"))
+    assert sum(tag != "=" for tag, _ in script) == 5, script
+    script = snapshot_diff.myers_diff(["a", "b", "c"], ["a", "x", "c"])
+    assert [tag for tag, _ in script].count("=") == 2
+    print("✅ Myers edit scripts are minimal")
+
+    delta = snapshot_diff.make_delta("Jane Doe\n**Experience**\nFounder\n", "Jane Doe\n**Experience**\nCEO\n")
+    assert delta["sections"] == ["experience"], delta
+    delta = snapshot_diff.make_delta("Jane Doe\n**About**\nHi\n", "Jane Smith\n**About**\nHi\n")
+    assert delta["sections"] == ["header"], delta
+    print("✅ Deltas name the sections they touch")
+
+    print("\n" + "=" * 80)
+    print("TEST COMPLETED")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    test_snapshot_diff()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Webhook mode test against a local fake Telegram.
+
+Starts a fake Bot API server, runs main.py in webhook mode against it and
+POSTs updates to the embedded webhook server like Telegram would.
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import requests
+
+FAKE_TOKEN = "123456:FAKE-TOKEN"
+SECRET_TOKEN = "local-test-secret"
+WEBHOOK_PATH = "telegram"
+
+# Bot API calls received by the fake Telegram: (method, params)
+API_CALLS = []
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    """Answers Bot API methods with minimal valid results"""
+
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        # python-telegram-bot sends parameters form-encoded
+        params = {key: values[0] for key, values in parse_qs(body).items()}
+        API_CALLS.append((method, params))
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        elif method == "sendMessage":
+            result = {
+                "message_id": len(API_CALLS),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+
+        payload = json.dumps({"ok": True, "result": result}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def free_port():
+    """Pick a free local TCP port"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=20):
+    """Wait until something listens on the port"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return True
+        time.sleep(0.2)
+    return False
+
+
+def make_update(update_id, text):
+    """Build a private-chat text message update"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 42, "type": "private"},
+            "from": {"id": 42, "is_bot": False, "first_name": "Tester", "username": "tester"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}] if text.startswith("/") else [],
+        },
+    }
+
+
+def test_webhook_flow():
+    """Run the bot in webhook mode and deliver updates via the fake Telegram"""
+    print("=" * 80)
+    print("WEBHOOK MODE TEST (local fake Telegram)")
+    print("=" * 80)
+
+    api_port = free_port()
+    webhook_port = free_port()
+    api_server = ThreadingHTTPServer(("127.0.0.1", api_port), FakeTelegramHandler)
+    threading.Thread(target=api_server.serve_forever, daemon=True).start()
+    print(f"🤖 Fake Bot API on port {api_port}")
+
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN=FAKE_TOKEN,
+        OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "sk-test"),
+        TELEGRAM_API_BASE_URL=f"http://127.0.0.1:{api_port}/bot",
+        BOT_MODE="webhook",
+        WEBHOOK_URL="https://example.invalid",
+        WEBHOOK_PATH=WEBHOOK_PATH,
+        WEBHOOK_LISTEN="127.0.0.1",
+        WEBHOOK_PORT=str(webhook_port),
+        WEBHOOK_SECRET_TOKEN=SECRET_TOKEN,
+    )
+    bot = subprocess.Popen(
+        [sys.executable, "main.py"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    try:
+        assert wait_for_port(webhook_port), "webhook server did not start"
+        print(f"🌐 Webhook server listening on port {webhook_port}")
+
+        url = f"http://127.0.0.1:{webhook_port}/{WEBHOOK_PATH}"
+        set_webhook = [params for method, params in API_CALLS if method == "setWebhook"]
+        assert set_webhook and set_webhook[0].get("secret_token") == SECRET_TOKEN
+        print("✅ setWebhook called with secret token")
+
+        response = requests.post(
+            url,
+            json=make_update(1, "/start"),
+            headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"},
+            timeout=10,
+        )
+        print(f"📡 Wrong secret → HTTP {response.status_code}")
+        assert response.status_code == 403
+
+        for update_id, command in enumerate(["/start", "/help", "/status"], start=2):
+            response = requests.post(
+                url,
+                json=make_update(update_id, command),
+                headers={"X-Telegram-Bot-Api-Secret-Token": SECRET_TOKEN},
+                timeout=10,
+            )
+            print(f"📡 {command} → HTTP {response.status_code}")
+            assert response.status_code == 200
+
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            replies = [params for method, params in API_CALLS if method == "sendMessage"]
+            if len(replies) >= 3:
+                break
+            time.sleep(0.2)
+        print(f"💬 Replies sent by bot: {len(replies)}")
+        assert len(replies) == 3, "bot did not answer every accepted update"
+        print("✅ All accepted updates were handled, rejected update was not")
+    finally:
+        bot.terminate()
+        bot.wait(timeout=15)
+        api_server.shutdown()
+
+    print("\n" + "=" * 80)
+    print("TEST COMPLETED")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    test_webhook_flow()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Persistent inbox for Telegram updates.
+
+Updates are written to SQLite together with the next polling offset before
+Telegram is allowed to forget them (it only drops updates below the offset
+passed to the following getUpdates call). A crash or deploy therefore never
+loses an update: anything not marked done is replayed on the next start.
+Album photos, which arrive as separate updates, are buffered in SQLite the
+same way until the whole album can be processed.
+"""
+
+import json
+import logging
+import sqlite3
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+ALBUM_COLLECTING = "collecting"
+ALBUM_PROCESSING = "processing"
+ALBUM_DONE = "done"
+
+
+class UpdateInbox:
+    """SQLite-backed update inbox with polling offset tracking"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.init_db()
+
+    def init_db(self):
+        """Create inbox and state tables if not exist"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS update_inbox (
+                update_id INTEGER PRIMARY KEY,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                processed_at TIMESTAMP
+            )
+        ''')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_update_inbox_status ON update_inbox (status, update_id)'
+        )
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS bot_state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def get_offset(self) -> Optional[int]:
+        """Next getUpdates offset (None before the first batch)"""
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute("SELECT value FROM bot_state WHERE key = 'polling_offset'").fetchone()
+        conn.close()
+        return int(row[0]) if row else None
+
+    def record(self, updates: List[dict]) -> int:
+        """Store a getUpdates batch and advance the offset in one transaction"""
+        if not updates:
+            return self.get_offset() or 0
+
+        next_offset = max(update["update_id"] for update in updates) + 1
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO update_inbox (update_id, payload) VALUES (?, ?)',
+                [(update["update_id"], json.dumps(update, ensure_ascii=False)) for update in updates]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO bot_state (key, value) VALUES ('polling_offset', ?)",
+                (str(next_offset),)
+            )
+        conn.close()
+        return next_offset
+
+    def recover(self) -> int:
+        """Return updates left in processing by a crash back to pending"""
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            cursor = conn.execute(
+                'UPDATE update_inbox SET status = ? WHERE status = ?',
+                (STATUS_PENDING, STATUS_PROCESSING)
+            )
+        conn.close()
+        return cursor.rowcount
+
+    def pending_count(self) -> int:
+        """Number of updates waiting to be processed"""
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute(
+            'SELECT COUNT(*) FROM update_inbox WHERE status = ?', (STATUS_PENDING,)
+        ).fetchone()
+        conn.close()
+        return row[0]
+
+    def fetch_pending(self, limit: int) -> List[Tuple[int, dict]]:
+        """Oldest pending updates, marked as processing"""
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            rows = conn.execute(
+                'SELECT update_id, payload FROM update_inbox WHERE status = ? ORDER BY update_id LIMIT ?',
+                (STATUS_PENDING, limit)
+            ).fetchall()
+            conn.executemany(
+                'UPDATE update_inbox SET status = ?, attempts = attempts + 1 WHERE update_id = ?',
+                [(STATUS_PROCESSING, update_id) for update_id, _ in rows]
+            )
+        conn.close()
+        return [(update_id, json.loads(payload)) for update_id, payload in rows]
+
+    def mark_done(self, update_id: int):
+        """Mark update as processed"""
+        self._set_status(update_id, STATUS_DONE)
+
+    def mark_failed(self, update_id: int, error: str):
+        """Mark update as failed (kept for inspection, not replayed)"""
+        self._set_status(update_id, STATUS_FAILED, error)
+
+    def _set_status(self, update_id: int, status: str, error: str = None):
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute(
+                'UPDATE update_inbox SET status = ?, error = ?, processed_at = CURRENT_TIMESTAMP WHERE update_id = ?',
+                (status, error, update_id)
+            )
+        conn.close()
+
+    def prune(self, keep_days: int = 7) -> int:
+        """Delete processed updates older than keep_days"""
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM update_inbox WHERE status = ? AND processed_at < datetime('now', ?)",
+                (STATUS_DONE, f"-{keep_days} days")
+            )
+        conn.close()
+        return cursor.rowcount
+
+
+class MediaGroupBuffer:
+    """Album photos collected in SQLite until the album is complete
+
+    Every photo is stored before its update is acknowledged, and whichever
+    process sees the album closed first (no new photo for the window) claims
+    it with a lease, so albums survive restarts and span webhook replicas
+    sharing the database.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.init_db()
+
+    def init_db(self):
+        """Create album tables if not exist"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS media_groups (
+                chat_id INTEGER NOT NULL,
+                media_group_id TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'collecting',
+                last_photo_ts REAL NOT NULL,
+                lease_until REAL,
+                PRIMARY KEY (chat_id, media_group_id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS media_group_photos (
+                chat_id INTEGER NOT NULL,
+                media_group_id TEXT NOT NULL,
+                message_id INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                PRIMARY KEY (chat_id, media_group_id, message_id)
+            )
+        ''')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_media_groups_status ON media_groups (status, last_photo_ts)'
+        )
+        conn.commit()
+        conn.close()
+
+    def add(self, chat_id: int, media_group_id: str, message_id: int, payload: dict) -> bool:
+        """Store an album photo; False if the album was already claimed (the photo came too late)"""
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute(
+                '''
+                INSERT INTO media_groups (chat_id, media_group_id, last_photo_ts) VALUES (?, ?, ?)
+                ON CONFLICT (chat_id, media_group_id) DO UPDATE SET last_photo_ts = excluded.last_photo_ts
+                WHERE status = 'collecting'
+                ''',
+                (chat_id, media_group_id, time.time())
+            )
+            status = conn.execute(
+                'SELECT status FROM media_groups WHERE chat_id = ? AND media_group_id = ?', (chat_id, media_group_id)
+            ).fetchone()[0]
+            if status == ALBUM_COLLECTING:
+                conn.execute(
+                    'INSERT OR IGNORE INTO media_group_photos (chat_id, media_group_id, message_id, payload) VALUES (?, ?, ?, ?)',
+                    (chat_id, media_group_id, message_id, json.dumps(payload, ensure_ascii=False))
+                )
+        conn.close()
+        return status == ALBUM_COLLECTING
+
+    def claim_closed(self, window: float, lease_seconds: float) -> List[Tuple[int, str, List[dict]]]:
+        """Albums with no new photo for `window` seconds (or whose lease ran out), leased to the caller
+
+        Returns (chat_id, media_group_id, photo payloads in message order) per album.
+        """
+        now = time.time()
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            groups = conn.execute(
+                '''
+                UPDATE media_groups SET status = 'processing', lease_until = ?
+                WHERE (status = 'collecting' AND last_photo_ts <= ?) OR (status = 'processing' AND lease_until <= ?)
+                RETURNING chat_id, media_group_id
+                ''',
+                (now + lease_seconds, now - window, now)
+            ).fetchall()
+            albums = []
+            for chat_id, media_group_id in groups:
+                payloads = [json.loads(payload) for (payload,) in conn.execute(
+                    '''
+                    SELECT payload FROM media_group_photos
+                    WHERE chat_id = ? AND media_group_id = ? ORDER BY message_id
+                    ''',
+                    (chat_id, media_group_id)
+                )]
+                albums.append((chat_id, media_group_id, payloads))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return albums
+
+    def finish(self, chat_id: int, media_group_id: str):
+        """Album processed: drop its photos, keep the group row so late photos aren't taken for a new album"""
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute(
+                "UPDATE media_groups SET status = 'done', lease_until = NULL WHERE chat_id = ? AND media_group_id = ?",
+                (chat_id, media_group_id)
+            )
+            conn.execute(
+                'DELETE FROM media_group_photos WHERE chat_id = ? AND media_group_id = ?', (chat_id, media_group_id)
+            )
+        conn.close()
+
+    def prune(self, keep_days: int = 7) -> int:
+        """Delete finished albums older than keep_days"""
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM media_groups WHERE status = 'done' AND last_photo_ts < ?",
+                (time.time() - keep_days * 86400,)
+            )
+        conn.close()
+        return cursor.rowcount
@@ -6,15 +6,24 @@ View data from the image analysis results database (CLI)
 import sqlite3
 import json
 
+import snapshot_diff
+
+DB_PATH = 'image_analysis_results.db'
+
+
+def response_text(row_id, stored):
+    """Response of an analysis row, rebuilt from the snapshot chain once compacted"""
+    return snapshot_diff.source_text(DB_PATH, 'analysis', row_id, stored)
+
 def view_analysis_by_id(analysis_id):
     """Show full analysis by ID"""
-    conn = sqlite3.connect('image_analysis_results.db')
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
     cursor.execute('''
         SELECT analysis_id, prompt_text, image_file, status, 
                prompt_tokens, completion_tokens, total_tokens, 
-               response_text, created_at
+               response_text, created_at, id
         FROM analysis_results 
         WHERE analysis_id = ?
     ''', (analysis_id,))
@@ -30,7 +39,7 @@ def view_analysis_by_id(analysis_id):
         print(f"📅 Date: {result[8]}")
         print(f"\n📝 RESPONSE:")
         print("-"*80)
-        print(result[7])
+        print(response_text(result[9], result[7]))
         print("-"*80)
     else:
         print(f"❌ Analysis #{analysis_id} not found")
@@ -40,11 +49,11 @@ def view_analysis_by_id(analysis_id):
 
 def compare_analyses():
     """Compare successful analyses"""
-    conn = sqlite3.connect('image_analysis_results.db')
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT analysis_id, total_tokens, LENGTH(response_text) as response_length
+        SELECT analysis_id, total_tokens, id, response_text
         FROM analysis_results 
         WHERE status = 'SUCCESS'
         ORDER BY analysis_id
@@ -57,25 +66,28 @@ def compare_analyses():
     print("ID | Tokens | Response length")
     print("-"*60)
     
-    for result in results:
-        print(f"{result[0]:2d} | {result[1]:7d} | {result[2]:12d}")
+    for analysis_id, total_tokens, row_id, text in results:
+        print(f"{analysis_id:2d} | {total_tokens:7d} | {len(response_text(row_id, text) or ''):12d}")
     
     conn.close()
 
 
 def search_in_responses(keyword):
     """Search by keyword in responses"""
-    conn = sqlite3.connect('image_analysis_results.db')
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
+    # Compacted responses live in the snapshot chain, so the match is done on rebuilt texts
     cursor.execute('''
-        SELECT analysis_id, status, response_text
+        SELECT analysis_id, status, id, response_text
         FROM analysis_results 
-        WHERE response_text LIKE ?
         ORDER BY analysis_id
-    ''', (f'%{keyword}%',))
+    ''')
     
-    results = cursor.fetchall()
+    keyword_lower = keyword.lower()
+    results = [(analysis_id, status, text) for analysis_id, status, text in (
+        (analysis_id, status, response_text(row_id, stored) or "") for analysis_id, status, row_id, stored in cursor.fetchall()
+    ) if keyword_lower in text.lower()]
     
     print(f"🔍 SEARCH: '{keyword}'")
     print("="*60)
@@ -84,7 +96,6 @@ def search_in_responses(keyword):
         for result in results:
             print(f"📋 Analysis #{result[0]} ({result[1]}):")
             text = result[2]
-            keyword_lower = keyword.lower()
             text_lower = text.lower()
             
             if keyword_lower in text_lower:
@@ -118,15 +129,11 @@ def show_menu():
 
 def show_all_analyses():
     """Show brief information about all analyses"""
-    conn = sqlite3.connect('image_analysis_results.db')
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT analysis_id, status, total_tokens,
-               CASE WHEN LENGTH(response_text) > 80 
-                    THEN SUBSTR(response_text, 1, 80) || '...' 
-                    ELSE response_text 
-               END as short_response
+        SELECT analysis_id, status, total_tokens, id, response_text
         FROM analysis_results 
         ORDER BY analysis_id
     ''')
@@ -138,7 +145,9 @@ def show_all_analyses():
     
     for result in results:
         status_emoji = "✅" if result[1] == "SUCCESS" else "❌"
-        print(f"{status_emoji} #{result[0]:2d} | {result[1]:12s} | {result[2]:4d} tokens | {result[3]}")
+        text = response_text(result[3], result[4]) or ""
+        short_response = text[:80] + '...' if len(text) > 80 else text
+        print(f"{status_emoji} #{result[0]:2d} | {result[1]:12s} | {result[2]:4d} tokens | {short_response}")
         print()
     
     conn.close()
@@ -146,7 +155,7 @@ def show_all_analyses():
 
 def show_statistics():
     """Show detailed statistics"""
-    conn = sqlite3.connect('image_analysis_results.db')
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
     # Overall stats
@@ -206,7 +215,7 @@ def main():
                     search_in_responses(keyword)
             elif command == "export":
                 # Export to JSON
-                conn = sqlite3.connect('image_analysis_results.db')
+                conn = sqlite3.connect(DB_PATH)
                 cursor = conn.cursor()
                 cursor.execute('SELECT * FROM analysis_results ORDER BY analysis_id')
                 results = cursor.fetchall()
@@ -220,7 +229,7 @@ def main():
                         "image_file": result[3],
                         "status": result[4],
                         "tokens": {"prompt": result[5], "completion": result[6], "total": result[7]},
-                        "response_text": result[8],
+                        "response_text": response_text(result[0], result[8]),
                         "created_at": result[9]
                     })
                 
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Images in the form the vision API accepts.
+
+Chat completions take an image as a base64 data URL of at most 20 MB, and
+GPT-4o high detail fits every image into 2048x2048 before reading it, so
+pixels beyond that only cost upload time. Images already within range and in
+a format the API reads (JPEG, PNG, WebP, still GIF) are sent as they are,
+with their own MIME type. Anything larger, or in another format (TIFF, BMP,
+animated GIF), is downscaled into the box and re-encoded as JPEG.
+"""
+
+import base64
+from io import BytesIO
+
+from PIL import Image
+
+# Longest side GPT-4o high detail reads; larger images are scaled down to it server-side anyway
+MAX_SIDE = 2048
+# Per-image size limit of the API
+MAX_BYTES = 20 * 1024 * 1024
+# PIL format -> MIME type the API accepts as is
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+JPEG_QUALITY = 90
+# Re-encoding steps quality down by 10 until the image fits, but not below this
+MIN_JPEG_QUALITY = 50
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """RGB image; transparent areas become white like the page behind a screenshot"""
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        rgba = image.convert("RGBA")
+        flat = Image.new("RGB", rgba.size, (255, 255, 255))
+        flat.paste(rgba, mask=rgba.getchannel("A"))
+        return flat
+    return image.convert("RGB")
+
+
+def prepare_image(image_bytes: bytes) -> tuple:
+    """(bytes, MIME type) within the API limits; unchanged if the image already is"""
+    image = Image.open(BytesIO(image_bytes))
+    mime = MIME_TYPES.get(image.format)
+    if image.format == "GIF" and getattr(image, "is_animated", False):
+        mime = None
+    if mime and max(image.size) <= MAX_SIDE and len(image_bytes) <= MAX_BYTES:
+        return image_bytes, mime
+
+    # Large JPEGs are decoded at a reduced scale straight away instead of at full size
+    image.draft("RGB", (MAX_SIDE, MAX_SIDE))
+    image = _flatten(image)
+    image.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+
+    quality = JPEG_QUALITY
+    while True:
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=quality)
+        if buffer.tell() <= MAX_BYTES or quality <= MIN_JPEG_QUALITY:
+            return buffer.getvalue(), "image/jpeg"
+        quality -= 10
+
+
+def to_data_url(image_bytes: bytes) -> str:
+    """data: URL for an image_url content part"""
+    data, mime = prepare_image(image_bytes)
+    return f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"